@@ -2,7 +2,7 @@
 # Name  : MIPSAssembler.py
 # Author: T.K.R.Arvind
 # Date  : 6th Jan 2021
-# 
+#
 # This program takes in assembly program written @INPATH checks for errors and converts to MIPS
 # HEX and (R/J/I type formatted) binary codes @OUTPUT.
 #
@@ -13,526 +13,2431 @@
 #          4) It is customisable to machine dependent opcode and function values by changing in 'MNEMONICSPATH'
 #          5) It interprets $a as registers e.g $1 -> $r1 while just 1 doesnot refer to any register
 #          6) It can adopt to variable register file width say 64/128 by changing Values in 'constant used'
+#          7) It can be imported and reused e.g Assembler().assemble("addi $s1, $zero, 8")
+#          8) It can stream e.g  generator | python MIPSAssembler.py --stream -f bin > program.bin
 #
-# NOTE: This program needs two dictionaries. One for register names and other having pnemonics to opcode 
-#============================================================================================================# 
+# NOTE: This program needs two dictionaries. One for register names and other having pnemonics to opcode
+#============================================================================================================#
 
+import io
+import os
 import sys
+import mmap
+import re
+import json
+import glob
+import time
+import pickle
+import marshal
+import hashlib
+import bisect
+import itertools
+import argparse
+from array import array
+try:
+    import fcntl
+except ImportError:                         #Windows, see isAppending()
+    fcntl = None
+from concurrent.futures import ProcessPoolExecutor
 
-#============================================================================================================# 
+#============================================================================================================#
 #                                           PATH Variables
 #============================================================================================================#
 INPATH = "./test/input.txt"                #Path where the input assembly program is written
 OUTPUT = "./test/machineCodeOutput.txt"    #Path where the output program is generated
 
-TMP = "assembler.tmp"               #run time generated temp file
-MNEMINOCSPATH = "mnemonics.dict"    #reference file for assembler
-REGNAMES = "regNames.dict"          #reference file for assembler
+BASEDIR = os.path.dirname(os.path.abspath(__file__))
+MNEMINOCSPATH = os.path.join(BASEDIR, "mnemonics.dict")    #reference file for assembler
+REGNAMES = os.path.join(BASEDIR, "regNames.dict")          #reference file for assembler
 
-#============================================================================================================# 
+#============================================================================================================#
 #                                           Constants Used
-#============================================================================================================# 
+#============================================================================================================#
 REGFILESIZE = 32             #Number of register available 32
 REGBITWIDTH = 5              #Rs,Rt,Rd,SA are represented by 5 bits/can be changed if needed
 FUNCTIONBITWIDTH = 6         #Function is represented with 6 bits
 OFFSETBITWIDTH = 16          #Offset/Immediate is 16 bits
 TARGETBITWIDTH = 26          #target in 'j target' is represented with 26 bits
+PARALLELCHUNK = 50000        #Number of asm converted by a worker at once in parallel second pass
+TEXTCHUNK = 4096             #asm text joined into one string at once when the program keeps its text
+STREAMCHUNK = 4096           #asm written and flushed at once in streaming mode
+STREAMFIXUPMAGIC = b"MIPSFIX\n"  #ends the fixup section of a streamed binary image
+TAGSPLITTER = re.compile(r'[\s,()]+')  #splits asm into mnemonic and the operands which may refer TAGs
+NUMBER = re.compile(r'[+-]?[0-9]+$')
+OPERANDKEY = re.compile(r'\s*\$?([^\s$]*)')    #first word of an operand without the leading $, up to the next $
+NUMERIC = re.compile(r'[0-9+-]+$')            #operand key which is a number (signs are checked by int())
+UNUSUALCHAR = re.compile(r'[^0-9a-z+-]')       #character which is neither a number nor a lower case letter/sign
+MEMORYOPERAND = re.compile(r'([^()]+)\(([^()]*)[^)]*\)')   #offset(rs), rs ends at the first ( or )
+MACROPARAMETERS = re.compile(r'[\s,]+')    #.macro NAME p1, p2 or .macro NAME p1 p2
+MACROARGUMENT = re.compile(r'\\(\w+|@)')   #\p1 or \@ in the body of a macro
+MACRODEPTH = 64              #macros called inside macros are expanded up to so many levels
+FUNCTIONFIELD = {"threeRegisterEncoder":5,"branchEncoder":2,"jumpRegisterEncoder":3}   #field of the function bits
+TRANSFERENCODERS = ("branchEncoder","jumpRegisterEncoder","jumpEncoder")   #asm having a delay slot (with 'b' class)
+LINKMNEMONICS = ("jal","bgezal","bltzal","jalr")                           #write the return address to $ra
+NOEFFECT = {"addi":"immediate","addiu":"immediate","ori":"immediate","xori":"immediate","sll":"immediate",
+            "srl":"immediate","sra":"immediate","add":"either","addu":"either","or":"either","xor":"either",
+            "sub":"right","subu":"right"}     #no effect with the same rd/rs and 0 (or $zero) as the last/other operand
+WORDTYPE = 'I' if array('I').itemsize == 4 else 'L'     #array typecode holding one 32 bit machine code
 
 
 
-#============================================================================================================# 
-#                                       Global Variable Used
-#============================================================================================================# 
-MemDictionary = {"root":0}   #Holds the memory location of TAGS and root represents the start of the memory program
-PNUMANICSdictionary = {}     #Holds the pnemonics to opcode conversion description
-RegNameDictionary = {}       #Holds the names of registers
-WarningFlag = False
-WarningCount = 0             #Counter for the warning produced
+#============================================================================================================#
+#   Raised for the errors after which translation cannot continue e.g missing reference files or more than
+#   one relative path symbol(:) in a line. The message is the same text the script used to print
+#============================================================================================================#
+class AssemblerError(Exception):
+    pass
 
-#=============================================================================================================#
-#               Reads the opcode dictionary which is used as reference table for conversion
-#=============================================================================================================#
-try:
-    opcodefile = open(MNEMINOCSPATH,'r')
-    for dline in iter(lambda: opcodefile.readline(), ''):               #iterating throughout the file till EOF
-        dline = dline.split("\n")[0].split("\r")[0].split("#")[0]       #extrating key values from eol and other extras
-        if not dline:
-            continue
-        dlist = dline.split()                                           #spliting the words in each line as list
-        PNUMANICSdictionary[dlist[0]] = dlist[1:]
-except IOError:
-    print("ERROR: "+str(MNEMINOCSPATH)+"file not found in the directory"+"\nTerminating the program.....")
-    sys.exit(1)
-     
-#=============================================================================================================#
-#                   Reads the register names used as reference table for conversion
-#=============================================================================================================#
-try:
-    regnames = open(REGNAMES,'r')
-    for dline in iter(lambda: regnames.readline(), ''):                 #iterating throughout the file till EOF
-        dline = dline.split("\n")[0].split("\r")[0]                     #extrating key values from eol and other extras
-        if not dline:
-            continue
-        [key,value] = dline.split()                                     #spliting the words in each line as list
-        RegNameDictionary[key] = value
-except IOError:
-    print("ERROR: "+str(REGNAMES)+" file not found in the directory"+"\nTerminating the program.....")
-    sys.exit(1)
-
-
-#========================================== Register Value Finder =============================================#
-#   This function takes in the key value to be searched in the RegNameDictionary. It also converts any upper case
-#   char to lowercase  as dictionary contains only lower case. It returns interger value representing the register 
-#   or the 'immediate' value in the asm code
-#=============================================================================================================#
-def registerValue(value,asm,LineNumber):
-    global WarningFlag 
-    keyCaps = ''
-    valuepair = ''
-    parsedvalue = value.lower().split()[0]    
-    dollarRemoved = parsedvalue.split('$') 
-    
-    if(dollarRemoved[0] == '' or dollarRemoved[0] == ' ' ):             #if value is wit $ i.e $20 = ['','20'
-        keyCaps = dollarRemoved[1]
-    else:
-        keyCaps = dollarRemoved[0]                                      #if value is without $ i.e 20 = ['20']
-
-    numberCount = 0                                                     #checking number of numeral value
-    keyLength = len(keyCaps)
-    keyformatted = ''
-    
-    for i in range(0,keyLength):
-        if(keyCaps[i] >= '0' and keyCaps[i] <= '9'):                    #if numbers  
-            keyformatted += keyCaps[i]
-            numberCount +=  1
-        elif((keyCaps[i] >= 'a' and keyCaps[i] <= 'z') or (keyCaps[i] >= 'A' and keyCaps[i] <= 'Z')):#if alphabets convert to lower case
-            keyformatted += keyCaps[i].lower()
-        elif(keyCaps[i] == '-' or keyCaps[i] == '+'):
-            keyformatted += keyCaps[i]
-            numberCount +=  1
-        else:                                                           #else print error
-            print("WARNING in line "+str(LineNumber)+": asm has some unusual character '"+keyCaps[i]+"' in value "+value+" at asm -"+asm)
-            WarningFlag = True
-            return int(0)
-            
-    if(numberCount == keyLength):                                       #if string has only numbers
-        return int(keyformatted)
-    
-    try:
-        valuepair = RegNameDictionary[keyformatted]                     #check is the register name is avaialble in dictionary
-    except KeyError:
-        print("WARNING in line "+str(LineNumber)+": Value "+keyformatted+" is neither a number nor represent any register in line -"+asm)
-        WarningFlag = True
-        return int(0)
-        
-    return int(valuepair)   
-#==================================================================================================================#
 
 
+#============================================================================================================#
+#                                             Diagnostics
+#   Every warning is kept as a Diagnostic (line, column, category, text, source asm) in a Diagnostics
+#   collector instead of being printed where it is found. They are written at the end in one go as text
+#   ("WARNING in line N: ...", the same as before) or JSON. With maxErrors the translation stops by
+#   raising TooManyWarnings as soon as that many warnings are collected. With a stream every warning is
+#   written to it as soon as it is found and only counted (streaming mode keeps nothing per asm)
+#============================================================================================================#
+class TooManyWarnings(AssemblerError):
+    pass
+
+class Diagnostic:
+    __slots__ = ('line','column','category','text','source','file')
+
+    def __init__(self,line,column,category,text,source,file = None):
+        self.line = line                    #line number in the input
+        self.column = column                #1 based column in source, None if not known
+        self.category = category            #syntax/mnemonic/register/value/tag/macro
+        self.text = text
+        self.source = source                #asm (or line) having the warning
+        self.file = file                    #included file of the line, None for the translated program
+
+    def __getstate__(self):
+        return (self.line,self.column,self.category,self.text,self.source,self.file)
+
+    def __setstate__(self,state):
+        (self.line,self.column,self.category,self.text,self.source,self.file) = state
 
+    def message(self):
+        return "WARNING in line "+lineName(self.line,self.file)+": "+self.text
 
+    def asDict(self):
+        return {"line":self.line, "column":self.column, "category":self.category, "text":self.text, "source":self.source,
+                "file":self.file}
 
+def lineName(line,file = None):
+    return str(line) if file is None else str(line)+" of "+file
 
+class Diagnostics:
 
-#==================================================================================================================#
-#   This function takes in the offset value and if it  is negative then it converts to its equivalent 
-#   unsigned positive number of given max bits. If positive number cannot be represented within the given
-#   max bits it is catched in code  
-#==================================================================================================================#
-def NegToPosINT(value,Nbits,LineNumber,shouldBePositive = False):
-    global WarningFlag 
-    if(value <0 ):
-        if(shouldBePositive):                                           #for value constrained to be positive
-            print("WARNING in line "+str(LineNumber)+": offset "+str(value)+" cannot be negative ")
-            WarningFlag = True
-            value = 0
-        elif ((-1*value) > 2**(Nbits - 1)) :                            #max negative value should be 2**(Nbits-1)
-            print("WARNING in line "+str(LineNumber)+": Value "+str(value)+" exceeds allowed offset bit "+str(Nbits))
-            WarningFlag = True
-            value = 0                                                   #for 3bit max neg is -4, if -20 is given it returns 0
+    def __init__(self,maxErrors = None,stream = None):
+        self.Entries = []
+        self.MaxErrors = maxErrors
+        self.Stream = stream
+        self.Count = 0
+
+    def __len__(self):
+        return self.Count
+
+    def __iter__(self):
+        return iter(self.Entries)
+
+    def add(self,diagnostic):
+        self.Count += 1
+        if self.Stream is None:
+            self.Entries.append(diagnostic)
         else:
-            value = value + (1<<Nbits)                                  #(-1) = 2^Nbits-1, (-2)= 2^Nbits-2...
-    elif (value >= 2**(Nbits - 1)):                                     #Max positive value is 2**(Nbits-1)-1
-            print("WARNING in line "+str(LineNumber)+": Value "+str(value)+" exceeds allowed offset bit "+str(Nbits))
-            WarningFlag = True
-            value = 0                                                   #for 3bit max pos is 3, if 5 is given it returns 0
-    return value
-#==================================================================================================================#
-
-
-
-
-
-
-
-#======================================== Offset Calculator =======================================================#
-#   This Function takes in offset value which can be integer directly or tag. If the tag is found in
-#   dictionary then it wil calculate the relative position. If it is jump it calculates the absolute
-#   position in the memory. if not it will raise error flag. 
-#==================================================================================================================#
-def OffsetCalculator(value,CurrentMem,asm,LineNumber,isjump = False):
-    tmpb = 0
-    global WarningFlag
-    try:                                    #trying to see whether it is given as 'int' offset
-        tmpb =  int(value)
-    except ValueError:                      #if it is a tag
-        tmp = value.split()                 #if it is a invalid tag woth spaces
-        if(len(tmp)>1):
-            print("WARNING in line "+str(LineNumber)+": TAG "+  value +" has space inside, in asm -"+asm)
-            WarningFlag = True
-        key = tmp[0]                        # it has only key
-        if key in MemDictionary:            #if the key is found find the relative position
-            if(isjump):                     #If jump instruction
-                tmpb = (int(MemDictionary[key]))
-            else:                           #relative position
-                tmpb = (int(MemDictionary[key]) - CurrentMem - 1) 
-        else:                               #else store the position to which it will be updated later
-            WarningFlag = True
-            print("WARNING in line "+str(LineNumber)+": @"+  value +" is not found in the program")
-    return tmpb
-#==================================================================================================================#
-
-
-
-
-
-
-#===================================== Assembly To Machine Code Converter =========================================#
-#   This function takes in asm without any comments or tags converts to assembly program using
-#   dictionary from .PNUMANICSdictionary.txt file and returns the machine code or ERROR
-#==================================================================================================================#
-def assemblyConverter(asm,CurrentMem,LineNumber): 
-    global WarningFlag 
-    WarningFlag = False
-    #--------------------------------------Example ------------------------------------------------#
-    #   input : addi $s1,$s2 , 100
-    #   pnewmatics : addi
-    #   commasep : ['addi $s1', '$s2' , '100']
-    #   values   : ['addi','$s1','$s2','100']
-    # ---------------------------------------------------------------------------------------------#
-    Mnemonics = asm.split()[0].lower()            #seperating the Mnemonics and values 
-    if(Mnemonics == 'nop'):                       #only for 'nop' special case there are no target/register 
-        return '0'* REGFILESIZE
-    commasep = asm.split(',') 
-    listLength = len(commasep)
-    
-    #-------------- what if the input is done without comma e.g. addi $s1 $s2, 100-----------------#
-    #   commasep = ['addi $s1 $s2','100']
-    #   commasep[0].split() = ['addi','$s1','$s2']
-    #-----------------------------------------------------------------------------------------------#
-    if(len(commasep[0].split()) != 2 ):
-        print("WARNING in line "+str(LineNumber)+": Missing values or a comma between $registers in asm -"+asm)
-        return "WARNING"
-        
-    values = [Mnemonics, commasep[0].split()[1]]
-    if(listLength > 1):
-        values.extend(commasep[1:])
-        
-    #-------------- what is the input is done without comma e.g. addi  $s1 , $s2 100-----------------#
-    #   values = ['addi',' $1','$s2 100']
-    #   values[0].split()  = ['addi']
-    #   values[1].split() = ['$s1']
-    #   values[2].split() = ['$s2','100'] catches these error
-    #   and removes extra spaces infront or back of say $s1 
-    #----------------------------------------------------------------------------------------------#
-    
-    for i in range(0,len(values)):       
-        valueSplitter = values[i].split()
-        
-        if(len(valueSplitter) > 1):
-            print("WARNING in line "+str(LineNumber)+": '"+ str(values[i])+"' has a comma or paranthesis missing in asm -"+asm)
-            return "WARNING"
+            self.Stream.write(diagnostic.message()+'\n')
+        if self.MaxErrors is not None and self.Count >= self.MaxErrors:
+            raise TooManyWarnings("Stopped after "+str(self.Count)+" warnings (max errors "+str(self.MaxErrors)+")")
+
+    def messages(self):
+        return [diagnostic.message() for diagnostic in self.Entries]
+
+    def text(self):
+        return ''.join([diagnostic.message()+'\n' for diagnostic in self.Entries])
+
+    def json(self):
+        return json.dumps({"count":self.Count,
+                           "warnings":[diagnostic.asDict() for diagnostic in self.Entries]},indent=2)
+
+    def emit(self,format = "text",stream = None):
+        if stream is None:
+            stream = sys.stdout
+        if format == "json":
+            stream.write(self.json()+'\n')
+        elif self.Entries:
+            stream.write(self.text())
+
+
+
+#============================================================================================================#
+#                                               Program
+#   The translated program kept in columns instead of a (LineNumber, asm, machineCode) tuple per asm: the
+#   line number, the mnemonic (index in Assembler.OpcodeNames, -1 when not known), the machine code (0 for
+#   a warning) and whether it converted, 11 bytes per asm. The TAG a branch/jump or a memory offset refers
+#   is kept as the index of the asm (RefIndex) and the TAG id (RefTags, name in TagNames) for the incremental
+#   pass and the optimizer. The asm text is not kept when the program is read from a file, it is read again from the
+#   file when the second pass or the listing needs it; other sources (strings, stdin) keep the text of all
+#   asm in one string with the offset of every asm. Iterating gives (LineNumber, asm, machineCode or None
+#   for warning) as the list of tuples did
+#============================================================================================================#
+class Program:
+    __slots__ = ('Lines','Opcodes','Codes','Valid','RefIndex','RefTags','TagNames','TagIds','OpcodeIds','Transfers','Memories',
+                 'Path','Encoding','Stamp','Preprocessor','Includes','Text','Pending','Offsets','Size','Removed','Changed')
+
+    def __init__(self,assembler,source = None):
+        self.Lines = array('I')             #line number of every asm
+        self.Opcodes = array('h')           #index of the mnemonic in assembler.OpcodeNames
+        self.Codes = array(WORDTYPE)        #machine code, 0 for a warning as in the image
+        self.Valid = bytearray()            #1 when the asm converted, 0 for a warning
+        self.RefIndex = array('I')          #index of every branch/jump/memory asm to a TAG, in order
+        self.RefTags = array('I')           #id of its TAG in TagNames
+        self.TagNames = []
+        self.TagIds = {}
+        self.OpcodeIds = assembler.OpcodeIds
+        self.Transfers = assembler.Transfers
+        self.Memories = assembler.Memories
+        self.Path = sourcePath(source)      #file the asm text is read again from, else kept in Text
+        self.Encoding = getattr(source,'encoding',None)
+        self.Stamp = sourceStamp(self.Path) if self.Path is not None else None
+        self.Preprocessor = assembler.Preprocessor if self.Path is not None else None
+        self.Includes = {}                  #path -> stamp of the files included by the program
+        self.Text = []                      #joined text chunks, one string once it is read
+        self.Pending = []                   #asm not yet joined into Text
+        self.Offsets = array('Q')           #start of every asm in Text
+        self.Size = 0
+        self.Removed = {}                   #index -> [(LineNumber, asm, reason)] removed before it by the optimizer
+        self.Changed = {}                   #index -> asm as written before the optimizer changed/moved it
+
+    def __len__(self):
+        return len(self.Lines)
+
+    def add(self,LineNumber,asm,MachineCode = None):
+        index = len(self.Lines)
+        self.Lines.append(LineNumber)
+        opcode = self.OpcodeIds.get(asm.split(None,1)[0].lower(),-1)
+        self.Opcodes.append(opcode)
+        if opcode in self.Transfers:
+            TAG = TAGSPLITTER.split(asm)[-1]
+        elif opcode in self.Memories:       #lw rt, TAG(rs) is relative to the asm as a branch
+            operand = MEMORYOPERAND.match(asm.rsplit(',',1)[-1].strip())
+            TAG = operand.group(1).strip() if operand is not None else None
         else:
-            values[i] = valueSplitter[0]
-  
-    if Mnemonics not in PNUMANICSdictionary:
-        print("WARNING in line "+str(LineNumber)+": {"+str(Mnemonics)+"} in the asm ="+str(asm)+"= is not  found in dictionary, you can update in 'PNUMANICS.dict'")
-        return "WARNING"
-    
-    #----------------------------------------------------------------------------------------------#
-    # bringing in the description as list for the Mnemonics from PNUMANICSdictionary
-    # descriptionMnemonics contains 1)no. of param required 2)hasValue 3)opcode 4) function(optional)  
-    # hasValue indiates whether it is a 1)arithmetic 2)branch 3)shiftt 4)jump 5)memory operation
-    #----------------------------------------------------------------------------------------------#
-    descriptionMnemonics = PNUMANICSdictionary[Mnemonics] 
-    paramRequired = descriptionMnemonics[0]
-    hasValue = descriptionMnemonics[1]   
-    opcode = descriptionMnemonics[2]
-     
-    a = 0  #for holding the $values
-    b = 0  #for holding the $values
-    c = 0  #for holding the $values
-    
-    machineCode = opcode+'_' 
-   
-    
-    
+            TAG = None
+        if TAG and not NUMBER.match(TAG):
+            if TAG not in self.TagIds:
+                self.TagIds[TAG] = len(self.TagNames)
+                self.TagNames.append(TAG)
+            self.RefIndex.append(index)
+            self.RefTags.append(self.TagIds[TAG])
+        self.Codes.append(0 if MachineCode is None else MachineCode)
+        self.Valid.append(MachineCode is not None)
+        if self.Path is None:
+            self.Offsets.append(self.Size)
+            self.Size += len(asm)
+            self.Pending.append(asm)
+            if len(self.Pending) >= TEXTCHUNK:
+                self.Text.append(''.join(self.Pending))
+                self.Pending = []
+        return index
+
+    def setCode(self,index,MachineCode):
+        self.Codes[index] = 0 if MachineCode is None else MachineCode
+        self.Valid[index] = MachineCode is not None
+
+    def text(self):
+        if self.Pending or not isinstance(self.Text,str):
+            self.Text = ''.join(self.Text)+''.join(self.Pending)
+            self.Pending = []
+        return self.Text
+
+    #------------------------------ asm text, read again from the file if it is not kept ------------------------------#
+    def openSource(self):
+        for (path,stamp) in [(self.Path,self.Stamp)]+list(self.Includes.items()):
+            if sourceStamp(path) != stamp:
+                raise AssemblerError("File in path "+str(path)+" changed after it was translated")
+        return open(self.Path,'r',encoding = self.Encoding)
+
+    def sourceLines(self,source):                         #the lines the passes read, see Preprocessor
+        return source if self.Preprocessor is None else self.Preprocessor.expand(source,self.Path)
+
+    def statements(self):
+        lines = self.Lines
+        if self.Path is None:
+            text = self.text()
+            offsets = self.Offsets
+            for index in range(len(lines)-1):
+                yield (lines[index],text[offsets[index]:offsets[index+1]])
+            if lines:
+                yield (lines[-1],text[offsets[-1]:])
+            return
+        if not lines:
+            return
+        index = 0
+        wanted = lines[0]
+        with self.openSource() as source:
+            LineNumber = 0
+            for line in self.sourceLines(source):
+                LineNumber += 1
+                if LineNumber == wanted:
+                    yield (LineNumber,sourceAsm(line))
+                    index += 1
+                    if index == len(lines):
+                        return
+                    wanted = lines[index]
+        raise AssemblerError("File in path "+str(self.Path)+" changed after it was translated")
+
+    def __iter__(self):
+        codes = self.Codes
+        valid = self.Valid
+        index = 0
+        for (LineNumber,asm) in self.statements():
+            yield (LineNumber,asm,codes[index] if valid[index] else None)
+            index += 1
+
+#----------------------------------------------------------------------------------------------------------#
+#   asm of a source line, the same as Assembler.readLine() without adding the TAG
+#----------------------------------------------------------------------------------------------------------#
+def sourceAsm(line):
+    words = line.split("\n")[0].split("#")[0].split("\r")[0]
+    if(words.find(':')>0):
+        return words.split(":")[1].strip()
+    return words.strip()
+
+#----------------------------------------------------------------------------------------------------------#
+#   Path of a source which can be read again: a file opened for reading from its start, else None
+#----------------------------------------------------------------------------------------------------------#
+def sourcePath(source):
+    path = getattr(source,'name',None)
+    if not isinstance(path,str) or not os.path.isfile(path) or 'r' not in getattr(source,'mode',''):
+        return None
+    try:
+        if not source.seekable() or source.tell() != 0:
+            return None
+    except (OSError,ValueError):
+        return None
+    return path
+
+def sourceStamp(path):
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    return (status.st_mtime_ns,status.st_size)
+
+
+
+#============================================================================================================#
+#                                             Preprocessor
+#   Runs between the source and the first pass so labels of included files and macros are collected as
+#   any other. '.include "path"' inserts another file (path relative to the including file) and
+#       .macro NAME p1, p2
+#           ..body using \p1 and \p2..
+#       .endm
+#   defines a macro which is expanded where 'NAME a, b' (or 'TAG: NAME a, b') is written, \@ in the body
+#   gives a number unique for every expansion e.g for the TAGs inside a macro. Every included file is
+#   expanded once and kept in Cache by the sha1 of its content and of the macros it may call, so a block
+#   included many times in a build is read and expanded only once. SourceMap keeps the file and line of
+#   every line handed over to the passes; warnings are given with the original file and line, the lines of
+#   a macro point to the line it is called from
+#============================================================================================================#
+class SourceMap:
+
+    def __init__(self):
+        self.Files = [None]                 #file id 0 is the translated program
+        self.FileIds = {None:0}
+        self.Starts = array('I')            #first produced line of every run of consecutive lines
+        self.Ids = array('H')               #file id of the run
+        self.Lines = array('I')             #line of that file the run starts with
+        self.Count = 0                      #lines produced so far
+        self.LastId = -1
+        self.LastLine = -1
+
+    def fileId(self,name):
+        if name not in self.FileIds:
+            self.FileIds[name] = len(self.Files)
+            self.Files.append(name)
+        return self.FileIds[name]
+
+    def add(self,fileId,line):
+        self.Count += 1
+        if fileId != self.LastId or line != self.LastLine+1:
+            self.Starts.append(self.Count)
+            self.Ids.append(fileId)
+            self.Lines.append(line)
+            self.LastId = fileId
+        self.LastLine = line
+
+    def locate(self,LineNumber):                          #(file or None, line) of a produced line
+        run = bisect.bisect_right(self.Starts,LineNumber)-1
+        if run < 0:
+            return (None,LineNumber)
+        return (self.Files[self.Ids[run]],self.Lines[run]+LineNumber-self.Starts[run])
+
+class Preprocessor:
+
+    def __init__(self):
+        self.Cache = {}                     #(sha1 of file, macros) -> (lines, macros defined, nested file sha1s)
+        self.Digests = {}                   #path -> (stamp, sha1) so unchanged files are not hashed again
+        self.Hits = 0
+
+    def digest(self,path):
+        stamp = sourceStamp(path)
+        if stamp is None:
+            return None
+        known = self.Digests.get(os.path.abspath(path))
+        if known is not None and known[0] == stamp:
+            return known[1]
+        with open(path,'rb') as included:
+            digest = hashlib.sha1(included.read()).hexdigest()
+        self.Digests[os.path.abspath(path)] = (stamp,digest)
+        return digest
+
+    def unchanged(self,path,digest):                      #a file which cannot be read is included again
+        try:
+            return self.digest(path) == digest
+        except OSError:
+            return False
+
+    #----------------- lines of the program with the directives done, report(file, line, text, source) -----------------#
+    def expand(self,lines,path = None,sourceMap = None,report = None):
+        return Expansion(self,sourceMap or SourceMap(),report).start(lines,path)
+
+class Expansion:
+
+    def __init__(self,preprocessor,sourceMap,report):
+        self.Preprocessor = preprocessor
+        self.Map = sourceMap
+        self.Report = report
+        self.Macros = {}                    #NAME -> (parameters, body lines, sha1)
+        self.Unique = 0                     #expansions using \@
+        self.Warnings = 0
+        self.Stack = []                     #files being included
+        self.Files = {}                     #path -> stamp of every included file
+
+    def start(self,lines,path):
+        if path is not None:
+            self.Stack.append(os.path.abspath(path))
+        return self.lines(lines,0,path)
+
+    def warning(self,fileId,line,text,source):
+        self.Warnings += 1
+        if self.Report is not None:
+            self.Report(self.Map.Files[fileId],line,text,source)
+
+    def lines(self,source,fileId,path):
+        Map = self.Map
+        macros = self.Macros
+        LineNumber = 0
+        definition = None                                 #[NAME, parameters, body, line] while a .macro is read
+        for line in source:
+            LineNumber += 1
+            if definition is None and not macros and '.' not in line:
+                Map.add(fileId,LineNumber)                #nothing to preprocess
+                yield line
+                continue
+            words = line.split("\n")[0].split("#")[0].split("\r")[0].strip()
+            directive = words.split(None,1)[0].lower() if words.startswith('.') else None
+            if definition is not None:
+                if directive == ".endm":
+                    self.define(definition)
+                    definition = None
+                elif directive == ".macro":
+                    self.warning(fileId,LineNumber,".macro inside the macro "+definition[0]+" is not supported",words)
+                else:
+                    definition[2].append(line)
+            elif directive == ".macro":
+                parameters = MACROPARAMETERS.split(words[len(".macro"):].strip())
+                if not parameters[0]:
+                    self.warning(fileId,LineNumber,".macro needs a name",words)
+                    parameters = ['']
+                definition = [parameters[0].lower(),tuple([name for name in parameters[1:] if name]),[],LineNumber]
+            elif directive == ".endm":
+                self.warning(fileId,LineNumber,".endm without .macro",words)
+            elif directive == ".include":
+                target = words[len(".include"):].strip().strip('"\'<>')
+                included = os.path.normpath(os.path.join(os.path.dirname(path) if path else '',target))
+                for produced in self.include(included,fileId,LineNumber):
+                    yield produced
+            else:
+                call = self.macroCall(words)
+                if call is None:
+                    Map.add(fileId,LineNumber)
+                    yield line
+                    continue
+                for produced in self.call(call,fileId,LineNumber,0):
+                    yield produced
+        if definition is not None:
+            self.warning(fileId,definition[3],"macro "+definition[0]+" is not closed with .endm",".macro "+definition[0])
+
+    def define(self,definition):
+        (name,parameters,body,line) = definition
+        self.Macros[name] = (parameters,tuple(body),hashlib.sha1(repr((name,parameters,body)).encode()).hexdigest())
+
+    #-------------------------------- (TAG or None, NAME, arguments) when words call a macro --------------------------------#
+    def macroCall(self,words):
+        TAG = None
+        if words.find(':') > 0:
+            (TAG,words) = words.split(':',1)
+        parts = words.split(None,1)
+        if not parts or parts[0].lower() not in self.Macros:
+            return None
+        arguments = [argument.strip() for argument in parts[1].split(',')] if len(parts) > 1 else []
+        return (TAG,parts[0].lower(),arguments)
+
+    def call(self,call,fileId,LineNumber,depth):
+        (TAG,name,arguments) = call
+        (parameters,body,digest) = self.Macros[name]
+        if TAG is not None:
+            self.Map.add(fileId,LineNumber)
+            yield TAG.strip()+":"
+        if len(arguments) != len(parameters):
+            self.warning(fileId,LineNumber,"macro "+name+" takes "+str(len(parameters))+" arguments, "+str(len(arguments))+" given",name)
+            return
+        if depth >= MACRODEPTH:
+            self.warning(fileId,LineNumber,"macro "+name+" is expanded more than "+str(MACRODEPTH)+" times inside itself",name)
+            return
+        values = dict(zip(parameters,arguments))
+        unique = None
+        for line in body:
+            if '\\@' in line:
+                if unique is None:
+                    self.Unique += 1
+                    unique = str(self.Unique)
+                values['@'] = unique
+            line = MACROARGUMENT.sub(lambda match: values.get(match.group(1),match.group(0)),line)
+            inner = self.macroCall(line.split("\n")[0].split("#")[0].split("\r")[0].strip())
+            if inner is None:
+                self.Map.add(fileId,LineNumber)
+                yield line
+            else:
+                for produced in self.call(inner,fileId,LineNumber,depth+1):
+                    yield produced
+
+    #----------------------- included file from Cache when it and the macros it may call are the same -----------------------#
+    def include(self,path,fileId,LineNumber):
+        preprocessor = self.Preprocessor
+        if os.path.abspath(path) in self.Stack:
+            raise AssemblerError(lineName(LineNumber,self.Map.Files[fileId])+": "+path+" includes itself")
+        where = lineName(LineNumber,self.Map.Files[fileId])
+        try:
+            digest = preprocessor.digest(path)
+        except OSError as error:                          #e.g a directory or no permission
+            raise AssemblerError(where+": File in path "+path+" cannot be read ("+str(error.strerror or error)+")")
+        if digest is None:
+            raise AssemblerError(where+": File in path "+path+" not found")
+        self.Files[path] = sourceStamp(path)
+        key = (digest,tuple(sorted([(name,macro[2]) for (name,macro) in self.Macros.items()])))
+        entry = preprocessor.Cache.get(key)
+        if entry is not None and all([preprocessor.unchanged(nested,value) for (nested,value) in entry[2].items()]):
+            preprocessor.Hits += 1
+            for (line,name,number) in entry[0]:
+                self.Map.add(self.Map.fileId(name),number)
+                yield line
+            self.Macros.update(entry[1])
+            for nested in entry[2]:
+                self.Files[nested] = sourceStamp(nested)
+            return
+        macros = dict(self.Macros)
+        files = set(self.Files)
+        (unique,warnings) = (self.Unique,self.Warnings)
+        produced = []
+        try:
+            included = open(path,'r')
+        except OSError as error:
+            raise AssemblerError(where+": File in path "+path+" cannot be read ("+str(error.strerror or error)+")")
+        self.Stack.append(os.path.abspath(path))
+        try:
+            with included:
+                for line in self.lines(included,self.Map.fileId(path),path):
+                    produced.append((line,self.Map.Files[self.Map.LastId],self.Map.LastLine))
+                    yield line
+        finally:
+            self.Stack.pop()
+        if self.Unique == unique and self.Warnings == warnings:   #the same lines every time it is included
+            defined = dict([(name,macro) for (name,macro) in self.Macros.items() if macros.get(name) is not macro])
+            nested = dict([(name,preprocessor.digest(name)) for name in self.Files if name not in files])
+            preprocessor.Cache[key] = (tuple(produced),defined,nested)
+
+
+
+#============================================================================================================#
+#                                            Assembler
+#   Holds the reference tables which are read only once when the object is created so the same object
+#   can translate any number of programs. Every call to assemble() starts with a fresh tag table
+#
+#   e.g:   asm = Assembler()
+#          words = asm.assemble("START: addi $s1, $zero, 8\n j START")
+#          words = asm.assemble_file("./test/input.txt")
+#============================================================================================================#
+class Assembler:
+
+    def __init__(self, mnemonicsPath = MNEMINOCSPATH, regNamesPath = REGNAMES, verbose = True, tableCache = True,
+                 maxErrors = None):
+        self.MemDictionary = {"root":0}   #Holds the memory location of TAGS and root represents the start of the memory program
+        self.PNUMANICSdictionary = {}     #Holds the pnemonics to opcode conversion description
+        self.RegNameDictionary = {}       #Holds the names of registers
+        self.Program = None               #Program (line, mnemonic and machineCode columns) of the last program
+        self.WarningCount = 0             #Counter for the warning produced
+        self.MaxErrors = maxErrors        #translation stops with TooManyWarnings after so many warnings
+        self.Diagnostics = Diagnostics()  #Warnings of the last program, printed at the end when verbose
+        self.Stats = None                 #AssemblerStats when enableStats() is called
+        self.Verbose = verbose
+        self.MnemonicsPath = mnemonicsPath
+        self.RegNamesPath = regNamesPath
+        self.ChunkSize = PARALLELCHUNK    #Number of asm per worker job in parallelSecondPass()
+        self.Cache = None                 #IncrementalCache used by secondPass() when set
+        self.Fixups = None                #TAGs waiting to be read, only while singlePass() is running
+        self.PendingTag = None            #TAG of the current asm which is not yet read (single pass)
+        self.Ordering = None              #(phase, line) of every warning while singlePass() runs, see report()
+        self.Phase = 1                    #0 while a line is read (first pass), 1 while an asm is converted
+        self.Relocations = None           #(index, TAG, kind) of the last relocatable object, see objectPass()
+        self.Optimize = False             #peephole optimizer between the passes, see optimize()
+        self.DelaySlots = False           #optimize for a target running the asm after a branch/jump (delay slot)
+        self.Optimizations = []           #(LineNumber, text) of every change of the optimizer
+        self.Preprocessor = Preprocessor() #.include/.macro with the included files cached, None reads the program as is
+        self.SourceMap = None             #file and line of the lines read by the passes, see preprocess()
+        self.loadTables(mnemonicsPath,regNamesPath,tableCache)
+        self.Program = Program(self)
+
+    #=========================================================================================================#
+    #   Reads the reference tables from the table cache next to 'MNEMINOCSPATH' when it is still valid, else
+    #   parses both the files, compiles the encoders and writes the cache again for the next start
+    #=========================================================================================================#
+    def loadTables(self,mnemonicsPath,regNamesPath,tableCache = True):
+        cachePath = os.path.splitext(mnemonicsPath)[0]+".cache"
+        if tableCache:
+            tables = readTableCache(cachePath,(mnemonicsPath,regNamesPath))
+            if tables is not None:                        #only the encoder closures are built
+                (self.PNUMANICSdictionary,self.RegNameDictionary,specs,registers) = tables
+                self.compileEncoders(specs,registers)
+                return
+        self.loadMnemonics(mnemonicsPath)
+        self.loadRegNames(regNamesPath)
+        specs = self.encoderSpecs()
+        self.compileEncoders(specs)
+        if tableCache:
+            writeTableCache(cachePath,(mnemonicsPath,regNamesPath),(self.PNUMANICSdictionary,self.RegNameDictionary,specs,
+                                                                    self.Registers))
+
+    #=========================================================================================================#
+    #               Reads the opcode dictionary which is used as reference table for conversion
+    #=========================================================================================================#
+    def loadMnemonics(self,path):
+        try:
+            with open(path,'r') as opcodefile:
+                for dline in iter(lambda: opcodefile.readline(), ''):           #iterating throughout the file till EOF
+                    dline = dline.split("\n")[0].split("\r")[0].split("#")[0]   #extrating key values from eol and other extras
+                    if not dline:
+                        continue
+                    dlist = dline.split()                                       #spliting the words in each line as list
+                    self.PNUMANICSdictionary[dlist[0]] = dlist[1:]
+        except IOError:
+            raise AssemblerError(str(path)+"file not found in the directory")
+
+    #=========================================================================================================#
+    #                   Reads the register names used as reference table for conversion
+    #=========================================================================================================#
+    def loadRegNames(self,path):
+        try:
+            with open(path,'r') as regnames:
+                for dline in iter(lambda: regnames.readline(), ''):             #iterating throughout the file till EOF
+                    dline = dline.split("\n")[0].split("\r")[0]                 #extrating key values from eol and other extras
+                    if not dline:
+                        continue
+                    [key,value] = dline.split()                                 #spliting the words in each line as list
+                    self.RegNameDictionary[key] = value
+        except IOError:
+            raise AssemblerError(str(path)+" file not found in the directory")
+
+    #=========================================================================================================#
+    #   Every warning goes through here so that the format stays the same everywhere. asm is the source text
+    #   of the warning and token the part of it which is wrong, its position gives the column
+    #=========================================================================================================#
+    def warning(self,LineNumber,text,category = "other",asm = "",token = None):
+        column = None
+        if asm:
+            column = 1
+            if token:
+                column = asm.find(token)+1 or 1
+        self.report(Diagnostic(LineNumber,column,category,text,asm))
+
+    def report(self,diagnostic):
+        if self.Ordering is not None:
+            self.Ordering.append((self.Phase,diagnostic.line if self.Phase else 0))
+        if self.SourceMap is not None:                    #line read by the passes -> included file and its line
+            (diagnostic.file,diagnostic.line) = self.SourceMap.locate(diagnostic.line)
+        if self.Stats is not None:
+            self.Stats.warning(diagnostic.category)
+        self.Diagnostics.add(diagnostic)
+
+    def preprocessorWarning(self,file,line,text,source):  #already the original file and line
+        self.WarningCount += 1
+        if self.Ordering is not None:
+            self.Ordering.append((0,0))
+        if self.Stats is not None:
+            self.Stats.warning("macro")
+        self.Diagnostics.add(Diagnostic(line,1,"macro",text,source,file))
+
+    def location(self,LineNumber):
+        if self.SourceMap is None:
+            return str(LineNumber)
+        (file,line) = self.SourceMap.locate(LineNumber)
+        return lineName(line,file)
+
+
+    #========================================== Register Value Finder =========================================#
+    #   This function takes in the key value to be searched in the RegNameDictionary. Every spelling of a
+    #   register ($s1, s1, S1, $S1, $17, $zero, $R0..) is looked up at once in the table built by
+    #   registerTable(), anything else is lexed with the regexes: the key is the first word without the
+    #   leading $ (up to the next $), in lower case as dictionary contains only lower case. It returns
+    #   interger value representing the register or the 'immediate' value in the asm code, None after a warning
+    #=========================================================================================================#
+    def registerValue(self,value,asm,LineNumber):
+        try:
+            return self.Registers[value]
+        except KeyError:
+            pass
+        key = OPERANDKEY.match(value.lower()).group(1)
+        unusual = UNUSUALCHAR.search(key)
+        if(unusual is not None):
+            self.warning(LineNumber,"asm has some unusual character '"+unusual.group()+"' in value "+value+" at asm -"+asm,"syntax",asm,value)
+            return None
+
+        if(NUMERIC.match(key)):                                         #if string has only numbers
+            try:
+                return int(key)
+            except ValueError:                                          #signs inside the number e.g 1-2
+                pass
+        elif(key in self.Registers):                                    #check is the register name is avaialble in dictionary
+            return self.Registers[key]
+        self.warning(LineNumber,"Value "+key+" is neither a number nor represent any register in line -"+asm,"register",asm,value)
+        return None
+
+    #=========================================================================================================#
+    #   Every spelling registerValue() accepts for a register: the names of RegNameDictionary in any case
+    #   with/without $ and the numbers of the register file with/without $
+    #=========================================================================================================#
+    def registerTable(self):
+        registers = {}
+        for number in range(REGFILESIZE):
+            registers[str(number)] = number
+            registers['$'+str(number)] = number
+        for key in self.RegNameDictionary:
+            if key != key.lower() or UNUSUALCHAR.search(key) or NUMERIC.match(key):
+                continue                                                #never reached by the lower case key
+            number = int(self.RegNameDictionary[key])
+            for spelling in itertools.product(*[(char,char.upper()) if char != char.upper() else (char,) for char in key]):
+                spelling = ''.join(spelling)
+                registers[spelling] = number
+                registers['$'+spelling] = number
+        return registers
+    #=========================================================================================================#
+
+
+
+    #=========================================================================================================#
+    #   This function takes in the offset value and if it  is negative then it converts to its equivalent
+    #   unsigned positive number of given max bits. If positive number cannot be represented within the given
+    #   max bits it is catched in code and None is returned. None given in (earlier warning) is passed on
+    #=========================================================================================================#
+    def NegToPosINT(self,value,Nbits,LineNumber,shouldBePositive = False,asm = ""):
+        if(value is None):
+            return None
+        if(value <0 ):
+            if(shouldBePositive):                                       #for value constrained to be positive
+                self.warning(LineNumber,"offset "+str(value)+" cannot be negative ","value",asm,str(value))
+                value = None
+            elif ((-1*value) > 2**(Nbits - 1)) :                        #max negative value should be 2**(Nbits-1)
+                self.warning(LineNumber,"Value "+str(value)+" exceeds allowed offset bit "+str(Nbits),"value",asm,str(value))
+                value = None                                            #for 3bit max neg is -4, -20 cannot be given
+            else:
+                value = value + (1<<Nbits)                              #(-1) = 2^Nbits-1, (-2)= 2^Nbits-2...
+        elif (value >= 2**(Nbits - 1)):                                 #Max positive value is 2**(Nbits-1)-1
+                self.warning(LineNumber,"Value "+str(value)+" exceeds allowed offset bit "+str(Nbits),"value",asm,str(value))
+                value = None                                            #for 3bit max pos is 3, 5 cannot be given
+        return value
+    #=========================================================================================================#
+
+
+
+    #======================================== Offset Calculator ==============================================#
+    #   This Function takes in offset value which can be integer directly or tag. If the tag is found in
+    #   dictionary then it wil calculate the relative position. If it is jump it calculates the absolute
+    #   position in the memory. if not it returns None after the warning.
+    #=========================================================================================================#
+    def OffsetCalculator(self,value,CurrentMem,asm,LineNumber,isjump = False):
+        tmpb = 0
+        failed = False
+        try:                                    #trying to see whether it is given as 'int' offset
+            tmpb =  int(value)
+        except ValueError:                      #if it is a tag
+            tmp = value.split()                 #if it is a invalid tag woth spaces
+            if(len(tmp)>1):
+                self.warning(LineNumber,"TAG "+  value +" has space inside, in asm -"+asm,"tag",asm,value)
+                failed = True
+            key = tmp[0]                        # it has only key
+            if key in self.MemDictionary:       #if the key is found find the relative position
+                if(isjump):                     #If jump instruction
+                    tmpb = (int(self.MemDictionary[key]))
+                    if(self.Relocations is not None):   #object: the absolute target moves with the object
+                        self.PendingTag = key
+                else:                           #relative position
+                    tmpb = (int(self.MemDictionary[key]) - CurrentMem - 1)
+            elif(self.Fixups is not None or self.Relocations is not None):  #single pass: TAG may be read later,
+                                                #singlePass() patches it. object: the linker patches it
+                self.PendingTag = key
+            else:                               #else store the position to which it will be updated later
+                self.warning(LineNumber,"@"+  value +" is not found in the program","tag",asm,value)
+                failed = True
+        if failed:
+            return None
+        return tmpb
+    #=========================================================================================================#
+
+
+
+    #===================================== Assembly To Machine Code Converter ================================#
+    #   This function takes in asm without any comments or tags converts to assembly program using the
+    #   encoders compiled from PNUMANICSdictionary and returns the machine code as integer or None for warning
+    #=========================================================================================================#
+    def assemblyConverter(self,asm,CurrentMem,LineNumber):
+        #--------------------------------------Example ------------------------------------------------#
+        #   input : addi $s1,$s2 , 100
+        #   pnewmatics : addi
+        #   commasep : ['addi $s1', '$s2' , '100']
+        #   values   : ['addi','$s1','$s2','100']
+        # ---------------------------------------------------------------------------------------------#
+        Mnemonics = asm.split()[0].lower()            #seperating the Mnemonics and values
+        if(Mnemonics == 'nop'):                       #only for 'nop' special case there are no target/register
+            return 0
+        commasep = asm.split(',')
+        listLength = len(commasep)
+
+        #-------------- what if the input is done without comma e.g. addi $s1 $s2, 100-----------------#
+        #   commasep = ['addi $s1 $s2','100']
+        #   commasep[0].split() = ['addi','$s1','$s2']
+        #-----------------------------------------------------------------------------------------------#
+        if(len(commasep[0].split()) != 2 ):
+            self.warning(LineNumber,"Missing values or a comma between $registers in asm -"+asm,"syntax",asm)
+            return None
+
+        values = [Mnemonics, commasep[0].split()[1]]
+        if(listLength > 1):
+            values.extend(commasep[1:])
+
+        #-------------- what is the input is done without comma e.g. addi  $s1 , $s2 100-----------------#
+        #   values = ['addi',' $1','$s2 100']
+        #   values[0].split()  = ['addi']
+        #   values[1].split() = ['$s1']
+        #   values[2].split() = ['$s2','100'] catches these error
+        #   and removes extra spaces infront or back of say $s1
+        #----------------------------------------------------------------------------------------------#
+
+        for i in range(0,len(values)):
+            valueSplitter = values[i].split()
+
+            if(len(valueSplitter) > 1):
+                self.warning(LineNumber,"'"+ str(values[i])+"' has a comma or paranthesis missing in asm -"+asm,"syntax",asm,valueSplitter[0])
+                return None
+            else:
+                values[i] = valueSplitter[0]
+
+        try:
+            encoder = self.Encoders[Mnemonics]
+        except KeyError:
+            self.warning(LineNumber,"{"+str(Mnemonics)+"} in the asm ="+str(asm)+"= is not  found in dictionary, you can update in 'PNUMANICS.dict'","mnemonic",asm)
+            return None
+        return encoder(values,asm,CurrentMem,LineNumber)
+    #=========================================================================================================#
+
+
+
+    #======================================= Encoder Compiler ================================================#
+    #   Every mnemonic in PNUMANICSdictionary is compiled once into a function which packs the fields of
+    #   the asm directly into the machine code with shifts. Layouts holds the bit width of every field
+    #   which is only needed when the (R/J/I type formatted) binary text is asked e.g for the listing.
+    #   encoderSpecs() gives (encoder, layout, shifts) per mnemonic which is kept in the table cache
+    #
+    #   descriptionMnemonics contains 1)no. of param required 2)hasValue 3)opcode 4) function(optional)
+    #   hasValue indiates whether it is a 1)arithmetic 2)branch 3)shiftt 4)jump 5)memory operation
+    #=========================================================================================================#
+    def encoderSpecs(self):
+        specs = {}
+        for Mnemonics in self.PNUMANICSdictionary:
+            descriptionMnemonics = self.PNUMANICSdictionary[Mnemonics]
+            paramRequired = int(descriptionMnemonics[0])
+            opcode = descriptionMnemonics[2]
+            if(paramRequired == 3):                 #opcode_rs_rt_rd_sa_function
+                layout = (len(opcode),REGBITWIDTH,REGBITWIDTH,REGBITWIDTH,REGBITWIDTH,len(descriptionMnemonics[3]))
+                encoder = "threeRegisterEncoder"
+            elif(paramRequired == 2):               #opcode_rs_rt_immediate
+                layout = (len(opcode),REGBITWIDTH,REGBITWIDTH,OFFSETBITWIDTH)
+                encoder = "twoRegisterEncoder"
+            elif(paramRequired == 1 and descriptionMnemonics[1] == 'b'):   #opcode_rs_function_offset
+                layout = (len(opcode),REGBITWIDTH,len(descriptionMnemonics[3]),OFFSETBITWIDTH)
+                encoder = "branchEncoder"
+            elif(paramRequired == 1):               #opcode_rs_0_function
+                layout = (len(opcode),REGBITWIDTH,3*REGBITWIDTH,len(descriptionMnemonics[3]))
+                encoder = "jumpRegisterEncoder"
+            else:                                   #opcode_target
+                layout = (len(opcode),TARGETBITWIDTH)
+                encoder = "jumpEncoder"
+            shifts = []                             #shift of every field from the LSB
+            position = sum(layout)
+            for width in layout:
+                position -= width
+                shifts.append(position)
+            base = int(opcode,2)<<shifts[0]         #opcode and function fields, the same for every asm
+            if encoder in FUNCTIONFIELD:
+                base |= int(descriptionMnemonics[3],2)<<shifts[FUNCTIONFIELD[encoder]]
+            specs[Mnemonics] = (encoder,layout,tuple(shifts),base)
+        return specs
+
+    def compileEncoders(self,specs,registers = None):
+        self.Specs = specs
+        self.BatchTables = None
+        self.Registers = registers if registers is not None else self.registerTable()   #spelling -> number, see registerValue()
+        self.OpcodeNames = list(specs)+["nop"]           #mnemonic of every opcode id kept by Program
+        self.OpcodeIds = dict([(Mnemonics,index) for (index,Mnemonics) in enumerate(self.OpcodeNames)])
+        self.Transfers = frozenset([self.OpcodeIds[Mnemonics] for Mnemonics in specs
+                                    if specs[Mnemonics][0] in ("branchEncoder","jumpEncoder")
+                                    or self.PNUMANICSdictionary[Mnemonics][1] == 'b'])
+        self.Memories = frozenset([self.OpcodeIds[Mnemonics] for Mnemonics in specs
+                                   if self.PNUMANICSdictionary[Mnemonics][1] in ('ml','ms')])
+        self.Encoders = {}
+        self.Layouts = {"nop":(REGFILESIZE,)}
+        for Mnemonics in specs:
+            (encoder,layout,shifts,base) = specs[Mnemonics]
+            self.Layouts[Mnemonics] = layout
+            self.Encoders[Mnemonics] = getattr(self,encoder)(self.PNUMANICSdictionary[Mnemonics],shifts,base)
+
+    #=========================================================================================================#
+    #   Checks the register values are within the register file
+    #=========================================================================================================#
+    def registerCheck(self,registers,asm,LineNumber):
+        for value in registers:
+            if(value >= REGFILESIZE):                                   #if the value goes more than allowed bitsize
+                self.warning(LineNumber,"Register value greater than "+ str(REGFILESIZE-1)+" is not accepted - "+asm,"register",asm)
+                return False
+            if(value < 0):
+                self.warning(LineNumber,"Negative register value is not accepted, registers are 0 to "+ str(REGFILESIZE-1)+" - "+asm,"register",asm)
+                return False
+        return True
+
     #--------------------------------------- For the asm that requires three register values -------------------------#
-    if(int(paramRequired) == 3):
-        if(len(values) != 4):
-           print("WARNING in line "+str(LineNumber)+": "+str(asm)+" is missing a parameters")
-           return "WARNING"
-        a =  registerValue(values[1],asm,LineNumber)  
-        b =  registerValue(values[2],asm,LineNumber)  
-        c =  registerValue(values[3],asm,LineNumber)  
-        
-        if(WarningFlag):
-            return "WARNING"
-            
-        if(a > REGFILESIZE or b > REGFILESIZE or c > REGFILESIZE):             #if the value goes more than allowed bitsize 
-            print("WARNING in line "+str(LineNumber)+": Register value greater than "+ str(REGFILESIZE)+" is not accepted -"+asm)
-            return "WARNING"
-            
-        if(a == 0):
-            print("WARNING in line "+str(LineNumber)+": Zero Register cannot be assigned -"+asm)
-            return "WARNING"
-            
-        if(hasValue == 'a'):                    #add rd, rs, rt
-            machineCode += bin(b).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rs
-            machineCode += bin(c).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rt 
-            machineCode += bin(a).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rd
-            machineCode += bin(0).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #sa
-        elif(hasValue == 's'):                  #sll rd, rt, sa
-            if(c<0):
-               print("WARNING in line "+str(LineNumber)+": Shift value should be positive -"+asm)
-               return "WARNING" 
-            machineCode += bin(0).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rs
-            machineCode += bin(b).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rt
-            machineCode += bin(a).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rd
-            machineCode += bin(c).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #sa
-        else:                                   #sllv rd, rt, rs
-            machineCode += bin(c).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rs
-            machineCode += bin(b).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rt
-            machineCode += bin(a).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #rd
-            machineCode += bin(0).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'    #sa
-            
-        machineCode += descriptionMnemonics[3]
-            
-    #--------------------------------------- For the asm that requires two register values -------------------------#        
-    elif(int(paramRequired) == 2):  
-        
-        #---------------------------------------------- immediate arguments ------------------------------------#
-        if(hasValue == 'a'):                    #addi rt,rs,immediate 
-            if(len(values) != 4):
-                print("WARNING in line "+str(LineNumber)+": -"+str(asm)+"-  is missing a parameters")
-                return "WARNING"
-            a =  registerValue(values[2],asm,LineNumber)  #rs
-            b =  registerValue(values[1],asm,LineNumber)  #rt
-            c =  NegToPosINT(registerValue(values[3],asm,LineNumber),OFFSETBITWIDTH,LineNumber)  #---> signed
-            
-        #----------------------------------------------- branches ---------------------------------------------#
-        elif(hasValue == 'b'):                  #bne rs,rt,offset
+    def threeRegisterEncoder(self,descriptionMnemonics,shifts,base):
+        hasValue = descriptionMnemonics[1]
+        (rs,rt,rd,sa) = shifts[1:5]
+
+        def encode(values,asm,CurrentMem,LineNumber):
             if(len(values) != 4):
-                print("WARNING in line "+str(LineNumber)+": -"+str(asm)+"-  is missing a parameters")
-                return "WARNING"
-            a =  registerValue(values[1],asm,LineNumber) #rs
-            b =  registerValue(values[2],asm,LineNumber) #rt
-            tmpc= OffsetCalculator(values[3],CurrentMem,asm,LineNumber)       #offset: either Value/Tag can be present
-            c = NegToPosINT(tmpc,OFFSETBITWIDTH,LineNumber)                   #converting offset value to "unsigned integer"  
-         
-        #----------------------------------------------- memory ---------------------------------------------#
-        else:                                   #lw rt, offset(rs)
-            if(len(values) != 3):
-                print("WARNING in line "+str(LineNumber)+": -"+str(asm)+"- is missing a parameters or paranthesis")
-                return "WARNING"
-             
-            b =  registerValue(values[1],asm,LineNumber)   #rt
-            if(values[2].find('(') > 0 and values[2].find(')') > 0):
-                a =  registerValue(values[2].split(')')[0].split('(')[1],asm,LineNumber) #rs
-                tmpc = OffsetCalculator(values[2].split(')')[0].split('(')[0],CurrentMem,asm,LineNumber) #offset: either Value/Tag can be present
-                c = NegToPosINT(tmpc,OFFSETBITWIDTH,LineNumber)               #converting offset value to "unsigned integer" 
-            else:
-                print("WARNING in line "+str(LineNumber)+": -"+str(asm)+"- is missing parameters or paranthesis")
-                return "WARNING"
-
-        #(a = rs b = rt  c = imm/off)
-        if(WarningFlag):
-            return "WARNING"
-            
-        if( b == 0 and (hasValue == 'a' or hasValue == 'ml')): #immediate and load Mnemonics should not assign zero register 
-            print("WARNING in line "+str(LineNumber)+": Zero Register cannot be assigned -"+asm)
-            return "WARNING"
-                
-        if(a > REGFILESIZE or b > REGFILESIZE ):                            #if the value goes more than allowed bitsize 
-            print("WARNING in line "+str(LineNumber)+": Register value greater than "+ str(REGFILESIZE)+" is not accepted - "+asm)
-            return "WARNING"
-        machineCode += bin(a).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'     #rs
-        machineCode += bin(b).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'     #rt
-        machineCode += bin(c).split('0b')[1].rjust(OFFSETBITWIDTH,'0')      #immediate /offset
-    
-    #--------------------------------------- For the asm that requires one register values -------------------------# 
-    elif(int(paramRequired) == 1): 
-    
-        #----------------------------------------------- branch ---------------------------------------------#
-        if(hasValue == 'b'):                #bgez rs, offset
+               self.warning(LineNumber,str(asm)+" is missing a parameters","syntax",asm)
+               return None
+            a =  self.registerValue(values[1],asm,LineNumber)
+            b =  self.registerValue(values[2],asm,LineNumber)
+            c =  self.registerValue(values[3],asm,LineNumber)
+
+            if(a is None or b is None or c is None):
+                return None
+
+            if(not self.registerCheck((a,b) if hasValue == 's' else (a,b,c),asm,LineNumber)):
+                return None
+            if(hasValue == 's' and c >= REGFILESIZE):                   #sa is also limited to the register bitwidth
+                self.warning(LineNumber,"Register value greater than "+ str(REGFILESIZE-1)+" is not accepted - "+asm,"register",asm)
+                return None
+
+            if(a == 0):
+                self.warning(LineNumber,"Zero Register cannot be assigned -"+asm,"register",asm)
+                return None
+
+            if(hasValue == 'a'):                    #add rd, rs, rt
+                return base | b<<rs | c<<rt | a<<rd
+            elif(hasValue == 's'):                  #sll rd, rt, sa
+                if(c<0):
+                   self.warning(LineNumber,"Shift value should be positive -"+asm,"value",asm,values[3])
+                   return None
+                return base | b<<rt | a<<rd | c<<sa
+            else:                                   #sllv rd, rt, rs
+                return base | c<<rs | b<<rt | a<<rd
+        return encode
+
+    #--------------------------------------- For the asm that requires two register values -------------------------#
+    def twoRegisterEncoder(self,descriptionMnemonics,shifts,base):
+        hasValue = descriptionMnemonics[1]
+        (rs,rt) = shifts[1:3]
+
+        def encode(values,asm,CurrentMem,LineNumber):
+            #---------------------------------------------- immediate arguments ------------------------------------#
+            if(hasValue == 'a'):                    #addi rt,rs,immediate
+                if(len(values) != 4):
+                    self.warning(LineNumber,"-"+str(asm)+"-  is missing a parameters","syntax",asm)
+                    return None
+                a =  self.registerValue(values[2],asm,LineNumber)  #rs
+                b =  self.registerValue(values[1],asm,LineNumber)  #rt
+                c =  self.NegToPosINT(self.registerValue(values[3],asm,LineNumber),OFFSETBITWIDTH,LineNumber,False,asm)  #---> signed
+
+            #----------------------------------------------- branches ---------------------------------------------#
+            elif(hasValue == 'b'):                  #bne rs,rt,offset
+                if(len(values) != 4):
+                    self.warning(LineNumber,"-"+str(asm)+"-  is missing a parameters","syntax",asm)
+                    return None
+                a =  self.registerValue(values[1],asm,LineNumber) #rs
+                b =  self.registerValue(values[2],asm,LineNumber) #rt
+                tmpc= self.OffsetCalculator(values[3],CurrentMem,asm,LineNumber)  #offset: either Value/Tag can be present
+                c = self.NegToPosINT(tmpc,OFFSETBITWIDTH,LineNumber,False,asm)              #converting offset value to "unsigned integer"
+
+            #----------------------------------------------- memory ---------------------------------------------#
+            else:                                   #lw rt, offset(rs)
+                if(len(values) != 3):
+                    self.warning(LineNumber,"-"+str(asm)+"- is missing a parameters or paranthesis","syntax",asm)
+                    return None
+
+                b =  self.registerValue(values[1],asm,LineNumber)   #rt
+                operand = MEMORYOPERAND.match(values[2])            #offset(rs)
+                if(operand is not None):
+                    a =  self.registerValue(operand.group(2),asm,LineNumber) #rs
+                    tmpc = self.OffsetCalculator(operand.group(1),CurrentMem,asm,LineNumber) #offset: either Value/Tag can be present
+                    c = self.NegToPosINT(tmpc,OFFSETBITWIDTH,LineNumber,False,asm)          #converting offset value to "unsigned integer"
+                else:
+                    self.warning(LineNumber,"-"+str(asm)+"- is missing parameters or paranthesis","syntax",asm,values[2])
+                    return None
+
+            #(a = rs b = rt  c = imm/off)
+            if(a is None or b is None or c is None):
+                return None
+
+            if( b == 0 and (hasValue == 'a' or hasValue == 'ml')): #immediate and load Mnemonics should not assign zero register
+                self.warning(LineNumber,"Zero Register cannot be assigned -"+asm,"register",asm)
+                return None
+
+            if(not self.registerCheck((a,b),asm,LineNumber)):
+                return None
+            return base | a<<rs | b<<rt | c
+        return encode
+
+    #----------------------------------------------- branch bgez rs, offset ---------------------------------------------#
+    def branchEncoder(self,descriptionMnemonics,shifts,base):
+        rs = shifts[1]
+
+        def encode(values,asm,CurrentMem,LineNumber):
             if(len(values) != 3):
-               print("WARNING in line "+str(LineNumber)+": -"+str(asm)+"- is missing some parameters")
-               return "WARNING"
-            a =  registerValue(values[1],asm,LineNumber)
-            tmpb = OffsetCalculator(values[2],CurrentMem,asm,LineNumber)    #offset: either Value/Tag can be present
-            b = NegToPosINT(tmpb,OFFSETBITWIDTH,LineNumber)                 #converting offset value to "unsigned integer" 
-            
-            if(WarningFlag == True):
-                return "WARNING"
-                
-            if(a > REGFILESIZE):                                            #if the value goes more than allowed bitsize 
-                print("WARNING in line "+str(LineNumber)+": Register value greater than "+ str(REGFILESIZE)+" is not accepted - "+asm)
-                return "WARNING"
-            machineCode += bin(a).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'
-            machineCode += descriptionMnemonics[3]+'_'
-            machineCode += bin(b).split('0b')[1].rjust(OFFSETBITWIDTH,'0')                   
-            
-        #----------------------------------------------- jump ---------------------------------------------#
-        else:                              #jr rs
+               self.warning(LineNumber,"-"+str(asm)+"- is missing some parameters","syntax",asm)
+               return None
+            a =  self.registerValue(values[1],asm,LineNumber)
+            tmpb = self.OffsetCalculator(values[2],CurrentMem,asm,LineNumber)    #offset: either Value/Tag can be present
+            b = self.NegToPosINT(tmpb,OFFSETBITWIDTH,LineNumber,False,asm)                 #converting offset value to "unsigned integer"
+
+            if(a is None or b is None):
+                return None
+
+            if(not self.registerCheck((a,),asm,LineNumber)):
+                return None
+            return base | a<<rs | b
+        return encode
+
+    #----------------------------------------------- jump jr rs ---------------------------------------------#
+    def jumpRegisterEncoder(self,descriptionMnemonics,shifts,base):
+        rs = shifts[1]
+
+        def encode(values,asm,CurrentMem,LineNumber):
             if(len(values) != 2):
-               print("WARNING in line "+str(LineNumber)+": -"+str(asm)+"- is missing some parameters")
-               return "WARNING"
-            a =  registerValue(values[1],asm,LineNumber)
-            if(WarningFlag):
-                return "WARNING"
-                
-            if(a > REGFILESIZE):                                              #if the value goes more than allowed bitsize 
-                print("WARNING in line "+str(LineNumber)+": Register value greater than "+ str(REGFILESIZE)+" is not accepted - "+asm)
-                return "WARNING"
-            machineCode += bin(a).split('0b')[1].rjust(REGBITWIDTH,'0')+'_'
-            machineCode += bin(0).split('0b')[1].rjust(3*REGBITWIDTH,'0')+'_'
-            machineCode += descriptionMnemonics[3]
-            
-    #--------------------------------------- For the asm that requires no register values -------------------------#  
-    else: #j target
-        if(len(values) != 2):
-           print("WARNING in line "+str(LineNumber)+": -"+str(asm)+"- is missing some parameters")
-           return "WARNING"
-       
-        tmpa = OffsetCalculator(values[1],CurrentMem,asm,LineNumber,True) #True indicate target position to be calculated rather than offset 
-        a =  NegToPosINT(tmpa,TARGETBITWIDTH,LineNumber)          
-        if(WarningFlag):
-            return "WARNING"
-        machineCode += bin(a).split('0b')[1].rjust(TARGETBITWIDTH,'0')
-      
-    return machineCode
-    
-#==================================================================================================================#    
-    
-    
-    
-    
-    
-    
-#========================================== Underscore Remover ======================================================#
-#   This fuction takes in a string and removes the '_' if present. It helps in converting the  
-#   human readable, formatted binary code to binary or hex
-#==================================================================================================================#
-def underscoreRemover(text,LineNumber):
-    ftext = ''                                      #formatted Text
-    for c in text:
-        if c != '_':
-            ftext += c
-    
-    try:
-        return hex(int(ftext,2))
-    except ValueError:
-        print("WARNING in line "+str(LineNumber)+": Cannot convert to hex")
-        return "WARNING"
-#==================================================================================================================#    
+               self.warning(LineNumber,"-"+str(asm)+"- is missing some parameters","syntax",asm)
+               return None
+            a =  self.registerValue(values[1],asm,LineNumber)
+            if(a is None):
+                return None
 
+            if(not self.registerCheck((a,),asm,LineNumber)):
+                return None
+            return base | a<<rs
+        return encode
 
+    #--------------------------------------- For the asm that requires no register values j target ------------------#
+    def jumpEncoder(self,descriptionMnemonics,shifts,base):
 
+        def encode(values,asm,CurrentMem,LineNumber):
+            if(len(values) != 2):
+               self.warning(LineNumber,"-"+str(asm)+"- is missing some parameters","syntax",asm)
+               return None
 
+            tmpa = self.OffsetCalculator(values[1],CurrentMem,asm,LineNumber,True) #True indicate target position to be calculated rather than offset
+            a =  self.NegToPosINT(tmpa,TARGETBITWIDTH,LineNumber,False,asm)
+            if(a is None):
+                return None
+            return base | a
+        return encode
+    #=========================================================================================================#
 
 
 
-#=========================================    Main Program part-1  ======================================================#   
-#   Iterating for all line till End of Line of input is reached. It is mainly to read all the tags and their
-#   location on the code as well as extracting the assembly program from the comments and others
-#   NOTE:readline() will return '' for eof and \n for a newline
-#==================================================================================================================#   
-try:
-    tmpwhandler = open(TMP,'w')
-    fp = open(INPATH,'r')
-    LineNumber = 0
-    CurrentMem = int(MemDictionary['root'])       #Holds the memory locatiom the current asm 
-    asm = ''                                      #Holds the assembly codes
-    WarningCount = 0
-    for line in iter(lambda: fp.readline(), ''):  #iterating throughout the file till EOF
+    #======================================= Columnar Batch Encoder ==========================================#
+    #   Encodes many asm at once from NumPy columns instead of text: mnemonics are indices in
+    #   BatchMnemonics (mnemonicIndex() converts names), rs/rt/rd/shamt are the register fields and immediate
+    #   is the signed immediate/offset (or the target for j/jal) as given to NegToPosINT. Columns which a
+    #   mnemonic does not use are ignored, missing ones are 0. The same checks as the encoders are applied
+    #   to every row: registers within REGFILESIZE, no write to the zero register, shift within the register
+    #   bitwidth and immediate within its bits. Returns (words as uint32 array, mask of failing rows), the
+    #   failing rows are 0 (nop) as in the image
+    #=========================================================================================================#
+    def batchTables(self):
+        import numpy as np                                #only needed here, the assembler itself runs without it
+        names = list(self.Specs)
+        count = len(names)
+        tables = dict([(column,np.zeros(count,dtype=np.int64)) for column in
+                       ("base","rs","rt","rd","sa","usesRs","usesRt","usesRd","usesSa","immBits","zeroRd","zeroRt")])
+        for (k,Mnemonics) in enumerate(names):
+            (encoder,layout,shifts,base) = self.Specs[Mnemonics]
+            descriptionMnemonics = self.PNUMANICSdictionary[Mnemonics]
+            hasValue = descriptionMnemonics[1]
+            if encoder == "threeRegisterEncoder":                               #opcode_rs_rt_rd_sa_function
+                (tables["rs"][k],tables["rt"][k],tables["rd"][k],tables["sa"][k]) = shifts[1:5]
+                (tables["usesRs"][k],tables["usesRt"][k],tables["usesRd"][k]) = (hasValue != 's',1,1)
+                (tables["usesSa"][k],tables["zeroRd"][k]) = (hasValue == 's',1)
+            elif encoder == "twoRegisterEncoder":                               #opcode_rs_rt_immediate
+                (tables["rs"][k],tables["rt"][k]) = shifts[1:3]
+                (tables["usesRs"][k],tables["usesRt"][k],tables["immBits"][k]) = (1,1,OFFSETBITWIDTH)
+                tables["zeroRt"][k] = hasValue in ('a','ml')
+            elif encoder == "branchEncoder":                                    #opcode_rs_function_offset
+                (tables["rs"][k],tables["usesRs"][k],tables["immBits"][k]) = (shifts[1],1,OFFSETBITWIDTH)
+            elif encoder == "jumpRegisterEncoder":                              #opcode_rs_0_function
+                (tables["rs"][k],tables["usesRs"][k]) = (shifts[1],1)
+            else:                                                               #opcode_target
+                tables["immBits"][k] = TARGETBITWIDTH
+            tables["base"][k] = base
+        self.BatchMnemonics = names
+        self.BatchTables = tables
+        return tables
+
+    def mnemonicIndex(self,names):
+        import numpy as np
+        if self.BatchTables is None:
+            self.batchTables()
+        index = dict([(Mnemonics,k) for (k,Mnemonics) in enumerate(self.BatchMnemonics)])
+        return np.array([index.get(Mnemonics,-1) for Mnemonics in names],dtype=np.int64)   #-1 fails in encodeBatch
+
+    def encodeBatch(self,mnemonics,rs = None,rt = None,rd = None,shamt = None,immediate = None):
+        import numpy as np
+        tables = self.BatchTables if self.BatchTables is not None else self.batchTables()
+        k = np.asarray(mnemonics,dtype=np.int64)
+        count = len(k)
+        def column(values):
+            return np.zeros(count,dtype=np.int64) if values is None else np.broadcast_to(np.asarray(values,dtype=np.int64),(count,))
+        (rs,rt,rd,shamt,immediate) = [column(values) for values in (rs,rt,rd,shamt,immediate)]
+
+        failed = (k < 0) | (k >= len(self.BatchMnemonics))                   #unknown mnemonic
+        k = np.where(failed,0,k)
+        words = tables["base"][k]
+        for (values,uses,shift) in ((rs,"usesRs","rs"),(rt,"usesRt","rt"),(rd,"usesRd","rd")):
+            used = tables[uses][k].astype(bool)
+            failed |= used & ((values < 0) | (values >= REGFILESIZE))          #registerCheck
+            words |= np.where(used,values & ((1<<REGBITWIDTH)-1),0) << tables[shift][k]
+        used = tables["usesSa"][k].astype(bool)
+        failed |= used & ((shamt < 0) | (shamt >= REGFILESIZE))               #sa is limited to the register bitwidth
+        words |= np.where(used,shamt & ((1<<REGBITWIDTH)-1),0) << tables["sa"][k]
+        failed |= tables["zeroRd"][k].astype(bool) & (rd == 0)                 #Zero Register cannot be assigned
+        failed |= tables["zeroRt"][k].astype(bool) & (rt == 0)
+
+        bits = tables["immBits"][k]
+        half = np.int64(1) << np.maximum(bits-1,0)
+        failed |= (bits > 0) & ((immediate < -half) | (immediate >= half))     #NegToPosINT
+        words |= np.where(bits > 0,immediate & ((half << 1)-1),0)              #negative -> 2**Nbits + value
+        words[failed] = 0
+        return (words.astype(np.uint32),failed)
+    #=========================================================================================================#
+
+
+
+    #========================================== Binary Formatter =============================================#
+    #   Converts the machine code to human readable, (R/J/I type) formatted binary code with '_' between the
+    #   fields of the mnemonic e.g 001000_00000_10011_0000000000001000
+    #=========================================================================================================#
+    def binaryText(self,Mnemonics,MachineCode):
+        layout = self.Layouts[Mnemonics]
+        fields = []
+        position = sum(layout)
+        for width in layout:
+            position -= width
+            fields.append(bin((MachineCode>>position) & ((1<<width)-1))[2:].rjust(width,'0'))
+        return '_'.join(fields)
+    #=========================================================================================================#
+
+
+
+    #=========================================    Line Reader  ================================================#
+    #   Extracts the assembly program from the comments and others and adds the tag (if any) to MemDictionary
+    #   with the given memory location. Returns (asm, TAG) where TAG is the name newly added or None
+    #=========================================================================================================#
+    def readLine(self,line,LineNumber,CurrentMem):
         words = line.split("\n")[0].split("#")[0].split("\r")[0] #extrating wording from eol,comments and other extras
-        LineNumber +=1
         if not words:                             #if line is empty
-            continue
+            return ('',None)
         #---------------------------------------------------------------------------------------------#
-        #  This piece of code is trying to extract relative path (if exist add value to dictionary) 
+        #  This piece of code is trying to extract relative path (if exist add value to dictionary)
         #  and assembly code
         #---------------------------------------------------------------------------------------------#
+        RelPath = None
         if(words.find(':')>0):                    #if there is a relative path
             pieces = words.split(":")
             if(len(pieces) > 2):
-                print("ERROR-"+str(LineNumber)+": There are more relative path symbol(:) -"+words+"\nTerminating the program.....")
-                sys.exit(1)
+                raise AssemblerError(self.location(LineNumber)+": There are more relative path symbol(:) -"+words)
+            RelPath = pieces[0].strip()          #adding values of RelPath to dictionary + removing spaces start and end of string
+            if RelPath in self.MemDictionary:
+                self.warning(LineNumber,"There are multiple entries for "+RelPath+", values may get overwritten","tag",words,RelPath)
+                self.WarningCount += 1
+                RelPath = None
             else:
-                RelPath = pieces[0].strip()      #adding values of RelPath to dictionary + removing spaces start and end of string
-                if RelPath in MemDictionary:    
-                    print("WARNING in line "+str(LineNumber)+": There are multiple entries for "+RelPath+", values may get overwritten" )
-                    WarningCount += 1
-                else:
-                    MemDictionary[RelPath] = CurrentMem #Updating  on the memory dictionary
-                asm = pieces[1].strip()         #removing spaces start and end of string
+                self.MemDictionary[RelPath] = CurrentMem #Updating  on the memory dictionary
+            asm = pieces[1].strip()             #removing spaces start and end of string
         else:
             asm = words.strip()
-            
-        if not asm:                             #if asm is empty i.e ''
+        return (asm,RelPath)
+    #=========================================================================================================#
+
+
+
+    #=========================================     Preprocessing    ==========================================#
+    #   Lines of the program with .include/.macro done by the Preprocessor (kept with its cache of included
+    #   files for the next programs). SourceMap gives the original file and line of every line for warnings
+    #=========================================================================================================#
+    def preprocess(self,lines,program):
+        if self.Preprocessor is None:
+            self.SourceMap = None
+            return lines
+        path = getattr(lines,'name',None)
+        if not isinstance(path,str) or not os.path.isfile(path):
+            path = None                                   #includes are relative to the working directory
+        self.SourceMap = SourceMap()
+        expansion = Expansion(self.Preprocessor,self.SourceMap,self.preprocessorWarning)
+        program.Includes = expansion.Files                #filled while the lines are read
+        return expansion.start(lines,path)
+    #=========================================================================================================#
+
+
+
+    #=========================================    Main Program part-1  =======================================#
+    #   Iterating for all line till End of Line of input is reached. It is mainly to read all the tags and their
+    #   location on the code as well as extracting the assembly program from the comments and others.
+    #   Returns the Program (the line and mnemonic of every asm) which is handed over to secondPass()
+    #   NOTE: lines can be any iterable of text lines e.g an open file or io.StringIO
+    #=========================================================================================================#
+    def firstPass(self,lines):
+        self.MemDictionary = {"root":0}
+        self.WarningCount = 0
+        self.Diagnostics = Diagnostics(self.MaxErrors)
+        program = Program(self,lines)
+        LineNumber = 0
+        CurrentMem = int(self.MemDictionary['root'])      #Holds the memory locatiom the current asm
+        for line in self.preprocess(lines,program):       #iterating throughout the file till EOF
+            LineNumber +=1
+            asm = self.readLine(line,LineNumber,CurrentMem)[0]
+            if not asm:                                   #if asm is empty i.e ''
+                continue
+            CurrentMem += 1                               #updating Memory Position
+            program.add(LineNumber,asm)
+        return program
+    #=========================================================================================================#
+
+
+
+    #========================================= Peephole Optimizer ============================================#
+    #   Runs between firstPass() and the conversion when self.Optimize is set and returns the optimized
+    #   Program, the TAGs in MemDictionary are moved to the new memory locations and numeric branch offsets
+    #   and jump targets are changed to reach the same asm. Without delay slots (as MIPSSimulator.py) it
+    #   removes nop padding, asm without effect (e.g addi $x, $x, 0, see NOEFFECT) and branches/jumps to the
+    #   very next asm. With self.DelaySlots the asm after a branch/jump is run before it jumps: nops there
+    #   are kept unless the asm just before the branch can be moved into the slot (it is not the target of
+    #   a TAG and the branch does not read what it writes). Every change is kept in self.Optimizations as
+    #   (LineNumber, text) and the listing shows the removed asm and the asm as written before the change.
+    #   NOTE: code addresses computed into registers (other than by jal) are not followed
+    #=========================================================================================================#
+    def optimize(self,program):
+        self.Optimizations = []
+        entries = [[LineNumber,asm,index] for (index,(LineNumber,asm)) in enumerate(program.statements())]
+        names = [self.OpcodeNames[opcode] if opcode >= 0 else None for opcode in program.Opcodes]
+        count = len(entries)
+        removed = bytearray(count+1)
+        labels = dict(zip(program.RefIndex,[program.TagNames[TAG] for TAG in program.RefTags]))
+        targets = [self.transferTarget(names[index],entries[index][1],index,labels.get(index)) for index in range(count)]
+        fixed = set(self.MemDictionary.values())          #memory locations a TAG or numeric offset goes to
+        fixed.update([target for (target,numeric) in targets if target is not None])
+        transfers = [name in self.Specs and (self.Specs[name][0] in TRANSFERENCODERS or
+                                             self.PNUMANICSdictionary[name][1] == 'b') for name in names]
+        notes = {}
+
+        for index in range(count-1,-1,-1):                #backwards, a removed branch can make the one before useless
+            name = names[index]
+            if self.DelaySlots and index > 0 and transfers[index-1]:
+                reason = None                             #asm in a delay slot, see below
+            elif name == "nop":
+                reason = "nop"
+            elif name in NOEFFECT and self.noEffect(name,entries[index][1]):
+                reason = "no effect"
+            elif (not self.DelaySlots and transfers[index] and name not in LINKMNEMONICS
+                  and targets[index][0] is not None):     #with a delay slot the next asm would run twice
+                target = targets[index][0]
+                reason = "branch to the next asm" if target > index and not removed.find(0,index+1,target) >= 0 else None
+            else:
+                reason = None
+            if reason is not None:
+                removed[index] = 1
+                notes[index] = reason
+                self.Optimizations.append((entries[index][0],"removed '"+entries[index][1]+"' ("+reason+")"))
+
+        if self.DelaySlots:
+            for index in range(1,count-1):
+                if (transfers[index] and names[index+1] == "nop" and not removed[index-1] and not transfers[index-1]
+                    and (index < 2 or not transfers[index-2]) and index not in fixed and index+1 not in fixed
+                    and names[index-1] not in (None,"nop") and self.canFillSlot(names[index-1],entries[index-1][1],
+                                                                                  names[index],entries[index][1])):
+                    (entries[index-1],entries[index]) = (entries[index],entries[index-1])
+                    (names[index-1],names[index]) = (names[index],names[index-1])
+                    (targets[index-1],targets[index]) = (targets[index],targets[index-1])
+                    transfers[index-1:index+1] = [True,False]
+                    removed[index+1] = 1
+                    notes[index+1] = "delay slot filled"
+                    self.Optimizations.append((entries[index][0],"moved '"+entries[index][1]+"' into the delay slot of '"
+                                                                 +entries[index-1][1]+"'"))
+
+        newIndex = array('I',[0]*(count+1))               #new memory location of every old one
+        position = 0
+        for index in range(count+1):
+            newIndex[index] = position
+            if index < count and not removed[index]:
+                position += 1
+        root = int(self.MemDictionary['root'])
+        for TAG in self.MemDictionary:
+            if TAG != 'root' and 0 <= self.MemDictionary[TAG]-root <= count:
+                self.MemDictionary[TAG] = root+newIndex[self.MemDictionary[TAG]-root]
+
+        optimized = Program(self)
+        for index in range(count):
+            (LineNumber,asm,origin) = entries[index]
+            if index in notes and removed[index]:
+                optimized.Removed.setdefault(newIndex[index],[]).append((LineNumber,asm,notes[index]))
+            if removed[index]:
+                continue
+            (target,numeric) = targets[index]
+            if numeric and 0 <= target <= count:
+                value = newIndex[target] if self.Specs[names[index]][0] == "jumpEncoder" else newIndex[target]-newIndex[index]-1
+                token = [token for token in TAGSPLITTER.split(asm) if token][-1]
+                if int(token) != value:
+                    start = asm.rfind(token)
+                    rewritten = asm[:start]+str(value)+asm[start+len(token):]
+                    self.Optimizations.append((LineNumber,"changed '"+asm+"' to '"+rewritten+"'"))
+                    optimized.Changed[newIndex[index]] = asm
+                    asm = rewritten
+            if origin != index:
+                optimized.Changed.setdefault(newIndex[index],asm)
+            optimized.add(LineNumber,asm)
+        self.Optimizations.sort(key = lambda change: change[0])
+        return optimized
+
+    #----------------------- (memory location, numeric) a branch/jump goes to, (None, False) if not known -----------------------#
+    def transferTarget(self,name,asm,index,TAG):           #TAG of the asm as kept by the Program
+        if name not in self.Specs:
+            return (None,False)
+        jump = self.Specs[name][0] == "jumpEncoder"
+        if not jump and self.PNUMANICSdictionary[name][1] != 'b':
+            return (None,False)
+        if TAG is not None:
+            if TAG in self.MemDictionary:
+                return (int(self.MemDictionary[TAG])-int(self.MemDictionary['root']),False)
+            return (None,False)
+        tokens = [token for token in TAGSPLITTER.split(asm) if token]
+        if len(tokens) < 2 or not NUMBER.match(tokens[-1]):
+            return (None,False)
+        value = int(tokens[-1])
+        return ((value if jump else index+1+value),True)
+
+    #------------------------------------- asm which does not change anything --------------------------------------------#
+    def noEffect(self,name,asm):
+        tokens = [token for token in TAGSPLITTER.split(asm) if token][1:]
+        if len(tokens) != 3:
+            return False
+        registers = [self.Registers.get(token) for token in tokens]
+        if registers[0] is None or registers[0] == 0 or registers[1] is None:
+            return False
+        if NOEFFECT[name] == "immediate":             #addi $x, $x, 0
+            return registers[0] == registers[1] and (registers[2] == 0 or (NUMBER.match(tokens[2]) is not None and int(tokens[2]) == 0))
+        if registers[2] is None:
+            return False
+        if registers[0] == registers[1] and registers[2] == 0:       #add $x, $x, $zero
+            return True
+        return NOEFFECT[name] == "either" and registers[0] == registers[2] and registers[1] == 0
+
+    #---------------------------- (registers written, registers read) by an asm, None if not known ----------------------------#
+    def registerUse(self,name,asm):
+        description = self.PNUMANICSdictionary.get(name)
+        if description is None:
+            return None
+        tokens = [token for token in TAGSPLITTER.split(asm) if token][1:]
+        link = set([self.Registers["$ra"]]) if name in LINKMNEMONICS and "$ra" in self.Registers else set()
+        (paramRequired,hasValue) = (int(description[0]),description[1])
+        if paramRequired == 3:
+            (written,read) = ([0],[1] if hasValue == 's' else [1,2])
+        elif paramRequired == 2:
+            (written,read) = {'a':([0],[1]),'b':([],[0,1]),'ml':([0],[2]),'ms':([],[0,2])}.get(hasValue,(None,None))
+        elif paramRequired == 1:
+            (written,read) = ([],[0])
+        else:
+            (written,read) = ([],[])
+        if hasValue == 'ms' or name == "sw":              #stores read the register they write to memory
+            (written,read) = ([],[0,2])
+        if written is None or len(tokens) <= max(written+read+[-1]):
+            return None
+        registers = [self.Registers.get(tokens[position]) for position in written+read]
+        if None in registers:
+            return None
+        return (set(registers[:len(written)]) | link,set(registers[len(written):]))
+
+    def canFillSlot(self,name,asm,branchName,branch):
+        use = self.registerUse(name,asm)
+        branchUse = self.registerUse(branchName,branch)
+        if use is None or branchUse is None:
+            return False
+        return not (use[0] & branchUse[1]) and not (branchUse[0] & (use[0] | use[1]))
+    #=========================================================================================================#
+
+
+
+    #========================================= Main Program part-2  ==========================================#
+    #   Iterating for all asm of the Program collected by firstPass(). It will convert the assembly code and
+    #   keeps the machineCode of every asm in the Program which becomes self.Program
+    #=========================================================================================================#
+    def secondPass(self,program,jobs = None):
+        self.Program = program
+        if self.Cache is not None:
+            return self.incrementalSecondPass(program)
+        if jobs is not None and len(program) > self.ChunkSize:
+            return self.parallelSecondPass(program,jobs)
+        CurrentMem = int(self.MemDictionary['root'])      #Holds the memory locatiom the current asm
+        index = 0
+        for (LineNumber,asm) in program.statements():
+            MachineCode = self.assemblyConverter(asm,CurrentMem,LineNumber)
+            CurrentMem += 1                               #updating Memory Position
+            if (MachineCode is None):
+                self.WarningCount += 1
+            program.setCode(index,MachineCode)
+            index += 1
+    #=========================================================================================================#
+
+
+
+    #===================================== Relocatable Object part-2 =========================================#
+    #   Same as secondPass() for a program which is linked with others later (see MIPSLinker.py). A TAG which
+    #   is not in this program is imported: the asm is converted with 0 as offset/target and (index in
+    #   Program, TAG, kind) is kept in self.Relocations, kind is 'j' for a jump target and 'b' for a relative
+    #   offset. Jumps to TAGs of this program are kept as well as their target moves with the program
+    #=========================================================================================================#
+    def objectPass(self,program):
+        self.Program = program
+        self.Relocations = []
+        CurrentMem = int(self.MemDictionary['root'])
+        try:
+            for (index,(LineNumber,asm)) in enumerate(program.statements()):
+                self.PendingTag = None
+                MachineCode = self.assemblyConverter(asm,CurrentMem,LineNumber)
+                if (MachineCode is None):
+                    self.WarningCount += 1
+                elif (self.PendingTag is not None):
+                    kind = 'j' if self.Specs[self.OpcodeNames[program.Opcodes[index]]][0] == "jumpEncoder" else 'b'
+                    self.Relocations.append((index,self.PendingTag,kind))
+                program.setCode(index,MachineCode)
+                CurrentMem += 1
+            return self.Relocations
+        finally:
+            self.Relocations = None
+            self.PendingTag = None
+    #=========================================================================================================#
+
+
+
+    #===================================== Parallel Main Program part-2  =====================================#
+    #   Once firstPass() has filled MemDictionary every asm depends only on its own text, its memory location
+    #   and the TAGs, so the program is split into chunks which are converted in a process pool. Each worker
+    #   gets the TAG table once (read only) and returns the machine codes and warnings of its chunk, these
+    #   are merged in memory order so Program, WarningCount and the warnings are the same as secondPass()
+    #=========================================================================================================#
+    def parallelSecondPass(self,program,jobs = None):
+        root = int(self.MemDictionary['root'])
+        statements = program.statements()
+        chunks = iter(lambda: list(itertools.islice(statements,self.ChunkSize)),[])
+        pool = ProcessPoolExecutor(max_workers = jobs or None,initializer = encodeInit,
+                                   initargs = (self.MnemonicsPath,self.RegNamesPath,self.MemDictionary))
+        try:
+            index = 0
+            for (codes,warnings) in pool.map(encodeWorker,((root+start,chunk) for (start,chunk) in
+                                                           zip(itertools.count(0,self.ChunkSize),chunks))):
+                for MachineCode in codes:
+                    if (MachineCode is None):
+                        self.WarningCount += 1
+                    program.setCode(index,MachineCode)
+                    index += 1
+                for diagnostic in warnings:
+                    self.report(diagnostic)
+        finally:                                          #TooManyWarnings drops the chunks not yet converted
+            pool.shutdown(cancel_futures = True)
+    #=========================================================================================================#
+
+
+
+    #================================== Incremental Main Program part-2  =====================================#
+    #   Same as secondPass() but the machine codes and warnings of the last run are kept in self.Cache by
+    #   memory location. The text of every asm is compared with the one at the same location last time and
+    #   for the branch/jump/memory rows of the Program (RefIndex) the value of their TAG as well, the codes of the
+    #   asm which are the same are copied at once. Asm without a TAG do not depend on their memory location,
+    #   those which moved (lines added/removed above them) are found by their text. Only the rest is converted
+    #=========================================================================================================#
+    def incrementalSecondPass(self,program):
+        cache = self.Cache
+        root = int(self.MemDictionary['root'])
+        if cache.Root != root:                            #every asm moved
+            cache.clear()
+        texts = [asm for (LineNumber,asm) in program.statements()]
+        count = len(texts)
+        (old,oldRefs) = (cache.Texts,cache.Refs)
+        refs = dict(zip(program.RefIndex,[self.MemDictionary.get(program.TagNames[TAG]) for TAG in program.RefTags]))
+        changed = set([index for (index,(asm,before)) in enumerate(zip(texts,old)) if asm != before])
+        changed.update([index for index in refs if index not in oldRefs or oldRefs[index] != refs[index]])
+        changed.update(range(len(old),count))
+        codes = cache.Codes[:count]
+        valid = cache.Valid[:count]
+        if len(codes) < count:                            #new asm at the end
+            codes.extend(array(WORDTYPE,[0])*(count-len(codes)))
+            valid.extend(bytes(count-len(valid)))
+        (program.Codes,program.Valid) = (codes,valid)
+        warnings = {}
+        moved = {}                                        #asm without TAG -> its memory location last time
+        if changed:
+            moved = dict([(asm,index) for (index,asm) in enumerate(old) if index not in oldRefs])
+        converted = 0
+        for index in sorted(changed.union([index for index in cache.Warnings if index < count])):
+            (LineNumber,asm) = (program.Lines[index],texts[index])
+            if index not in changed:
+                before = index                            #memory location of the same asm last time
+            elif index in refs:
+                before = None
+            else:
+                before = moved.get(asm)
+                if before is not None:
+                    (codes[index],valid[index]) = (cache.Codes[before],cache.Valid[before])
+            if before is None:
+                converted += 1
+                first = len(self.Diagnostics)
+                MachineCode = self.assemblyConverter(asm,root+index,LineNumber)
+                program.setCode(index,MachineCode)
+                found = tuple([(d.column,d.category,d.text) for d in self.Diagnostics.Entries[first:]])
+            else:                                         #warnings are kept without line, lines can move
+                found = cache.Warnings.get(before,())
+                for (column,category,text) in found:
+                    self.report(Diagnostic(LineNumber,column,category,text,asm))
+            if found:
+                warnings[index] = found
+        self.WarningCount += valid.count(0)
+        cache.Hits = count-converted
+        (cache.Texts,cache.Codes,cache.Valid,cache.Refs,cache.Warnings,cache.Root) = (texts,codes[:],valid[:],refs,warnings,root)
+    #=========================================================================================================#
+
+
+
+    #========================================= Single Pass  ==================================================#
+    #   Converts every asm as soon as it is read. A branch/jump to a TAG which is not yet read is converted
+    #   with the TAG left out and kept in self.Fixups; the asm is converted again once the TAG is read (an asm
+    #   which failed for another reason is only kept to report the TAG if it never shows up). The warnings
+    #   are put in the order of firstPass()+secondPass() at the end, so the output is the same
+    #=========================================================================================================#
+    def singlePass(self,lines):
+        self.MemDictionary = {"root":0}
+        self.WarningCount = 0
+        self.Diagnostics = Diagnostics(self.MaxErrors)
+        self.Program = Program(self,lines)
+        self.Fixups = {}                                  #TAG -> [(index in Program, CurrentMem, asm)] waiting for it
+        self.Ordering = []
+        LineNumber = 0
+        CurrentMem = int(self.MemDictionary['root'])
+        try:
+            for line in self.preprocess(lines,self.Program):
+                LineNumber +=1
+                self.Phase = 0
+                (asm,RelPath) = self.readLine(line,LineNumber,CurrentMem)
+                self.Phase = 1
+                if RelPath in self.Fixups:                #backpatching the asm waiting for this TAG
+                    for (index,FixMem,FixAsm) in self.Fixups.pop(RelPath):
+                        if FixMem is not None:            #None: failed already, nothing to patch
+                            self.patch(index,FixMem,FixAsm)
+                if not asm:
+                    continue
+                self.PendingTag = None
+                MachineCode = self.assemblyConverter(asm,CurrentMem,LineNumber)
+                index = self.Program.add(LineNumber,asm,MachineCode)
+                if (MachineCode is None):
+                    self.WarningCount += 1
+                if (self.PendingTag is not None):
+                    self.Fixups.setdefault(self.PendingTag,[]).append((index,CurrentMem if MachineCode is not None else None,asm))
+                CurrentMem += 1
+            for TAG in self.Fixups:                       #TAGs which are not found in the whole program
+                for (index,FixMem,FixAsm) in self.Fixups[TAG]:
+                    self.warning(self.Program.Lines[index],"@"+  TAG +" is not found in the program","tag",FixAsm,TAG)
+                    if FixMem is not None:                #a failed asm is counted already
+                        self.WarningCount += 1
+                        self.Program.setCode(index,None)
+        finally:
+            self.orderDiagnostics()
+            self.Fixups = None
+            self.PendingTag = None
+            self.Phase = 1
+
+    def orderDiagnostics(self):                           #stable: warnings of one line keep their order
+        (ordering,entries) = (self.Ordering,self.Diagnostics.Entries)
+        self.Ordering = None
+        if len(ordering) == len(entries) and any(ordering[i] > ordering[i+1] for i in range(len(ordering)-1)):
+            entries[:] = [entries[i] for i in sorted(range(len(entries)),key = ordering.__getitem__)]
+
+    def patch(self,index,CurrentMem,asm):
+        MachineCode = self.assemblyConverter(asm,CurrentMem,self.Program.Lines[index])
+        if (MachineCode is None):
+            self.WarningCount += 1
+        self.Program.setCode(index,MachineCode)
+    #=========================================================================================================#
+
+
+
+    #========================================= Streaming  ====================================================#
+    #   Single pass from lines (e.g sys.stdin) straight into a binary output (e.g sys.stdout.buffer) in one of
+    #   STREAMFORMATS, written and flushed every chunk asm. Only the TAGs and the asm waiting for a TAG are
+    #   kept, not the program. An asm read before its TAG is written as 0 and fixed once the TAG is read: in
+    #   the chunk not yet written, by seeking back to its record when the output is seekable (a file) or else
+    #   in a fixup section written after the last record (see fixupSectionBinary/fixupSectionReadmem).
+    #   Warnings are written to warnings (default sys.stderr) as they are found. Returns the number of asm
+    #=========================================================================================================#
+    def stream(self,lines,output,format = "bin",chunk = STREAMCHUNK,warnings = None):
+        if format not in STREAMFORMATS:
+            raise AssemblerError("Output format "+str(format)+" cannot be streamed, use one of "+", ".join(STREAMFORMATS))
+        formatter = OUTPUTFORMATS[format][0]
+        width = len(formatter([0]))                       #every record has the same length
+        self.MemDictionary = {"root":0}
+        self.WarningCount = 0
+        self.Diagnostics = Diagnostics(self.MaxErrors,sys.stderr if warnings is None else warnings)
+        self.Program = Program(self)                      #stays empty, only the included files are kept
+        self.Fixups = {}                                  #TAG -> [(CurrentMem, asm, LineNumber, failed)] waiting for it
+        try:                                              #writes of a file opened to append ignore seek
+            seekable = output.seekable() and not isAppending(output)
+            start = output.tell() if seekable else 0
+        except (AttributeError,OSError):
+            (seekable,start) = (False,0)
+        root = int(self.MemDictionary['root'])
+        buffer = array(WORDTYPE)                          #asm not yet written, the first one is at memory root+written
+        late = array(WORDTYPE)                            #(address, code) of written records fixed later, not seekable
+        written = 0
+        LineNumber = 0
+        CurrentMem = root
+        try:
+            for line in self.preprocess(lines,self.Program):
+                LineNumber +=1
+                (asm,RelPath) = self.readLine(line,LineNumber,CurrentMem)
+                if RelPath in self.Fixups:                #fixing the asm waiting for this TAG
+                    for (FixMem,FixAsm,FixLine,failed) in self.Fixups.pop(RelPath):
+                        if failed:                        #warned already, stays 0
+                            continue
+                        MachineCode = self.assemblyConverter(FixAsm,FixMem,FixLine)
+                        if (MachineCode is None):
+                            self.WarningCount += 1
+                        elif FixMem-root >= written:
+                            buffer[FixMem-root-written] = MachineCode
+                        elif seekable:
+                            output.seek(start+(FixMem-root)*width)
+                            output.write(formatter([MachineCode]))
+                            output.seek(start+written*width)
+                        else:
+                            late.extend((FixMem-root,MachineCode))
+                if not asm:
+                    continue
+                self.PendingTag = None
+                MachineCode = self.assemblyConverter(asm,CurrentMem,LineNumber)
+                if (MachineCode is None):
+                    self.WarningCount += 1
+                if (self.PendingTag is not None):
+                    self.Fixups.setdefault(self.PendingTag,[]).append((CurrentMem,asm,LineNumber,MachineCode is None))
+                    MachineCode = 0
+                buffer.append(MachineCode or 0)
+                CurrentMem += 1
+                if len(buffer) >= chunk:
+                    output.write(formatter(buffer))
+                    output.flush()
+                    written += len(buffer)
+                    del buffer[:]
+            for TAG in self.Fixups:                       #TAGs which are not found in the whole stream, left as 0
+                for (FixMem,FixAsm,FixLine,failed) in self.Fixups[TAG]:
+                    self.warning(FixLine,"@"+  TAG +" is not found in the program","tag",FixAsm,TAG)
+                    if not failed:                        #a failed asm is counted already
+                        self.WarningCount += 1
+            output.write(formatter(buffer))
+            written += len(buffer)
+            if late:
+                output.write(STREAMFORMATS[format](format,late))
+            output.flush()
+        finally:
+            self.Fixups = None
+            self.PendingTag = None
+        return written
+    #=========================================================================================================#
+
+
+
+    #=========================================================================================================#
+    #   Translates the program given as a string and returns the machine codes as list of integers. Lines
+    #   with warnings are kept as 0 (nop) so that the position of the following asm do not move.
+    #   jobs converts the asm in a process pool after the TAGs are read (None = serial, 0 = every core)
+    #=========================================================================================================#
+    def assemble(self,source,singlePass = False,jobs = None):
+        self.translate(io.StringIO(source),singlePass,jobs)
+        return self.words()
+
+    def assemble_file(self,path,singlePass = False,jobs = None):
+        try:
+            fp = open(path,'r')
+        except IOError:
+            raise AssemblerError("File in path "+str(path)+" not found")
+        with fp:
+            self.translate(fp,singlePass,jobs)
+        return self.words()
+
+    def translate(self,lines,singlePass = False,jobs = None,relocatable = False):
+        try:
+            if singlePass and self.Optimize:
+                raise AssemblerError("The optimizer needs the whole program, it cannot be used with single pass")
+            if relocatable:                               #returns the relocations, see objectPass()
+                return self.objectPass(self.optimized(self.firstPass(lines)))
+            if self.Stats is not None:
+                self.timedTranslate(lines,singlePass,jobs)
+            elif singlePass:
+                self.singlePass(lines)
+            else:
+                self.secondPass(self.optimized(self.firstPass(lines)),jobs)
+        finally:
+            if self.Verbose:                              #warnings are printed at once, not while converting
+                self.Diagnostics.emit()
+
+    def optimized(self,program):
+        self.Optimizations = []
+        return self.optimize(program) if self.Optimize else program
+
+    def timedTranslate(self,lines,singlePass,jobs):
+        start = time.perf_counter()
+        if singlePass:
+            self.singlePass(lines)
+            self.Stats.phase("single pass",start)
+        else:
+            program = self.firstPass(lines)
+            middle = self.Stats.phase("pass1 (read + TAGs)",start)
+            if self.Optimize:
+                program = self.optimize(program)
+                middle = self.Stats.phase("optimize",middle)
+            self.secondPass(program,jobs)
+            self.Stats.phase("pass2 (convert)",middle)
+        self.Stats.Tags = len(self.MemDictionary)-1       #without root
+        self.Stats.Instructions = len(self.Program)
+
+    #=========================================================================================================#
+    #   Collects per phase time, per mnemonic/format class conversion time and warnings by category in
+    #   self.Stats. The time of each asm is taken by shadowing assemblyConverter on this object only, so
+    #   when stats are not enabled nothing extra runs. Workers of --parallel are not timed per mnemonic
+    #=========================================================================================================#
+    def enableStats(self):
+        self.Stats = AssemblerStats()
+        convert = Assembler.assemblyConverter.__get__(self)
+        stats = self.Stats
+        clock = time.perf_counter
+        description = self.PNUMANICSdictionary
+
+        def timedConverter(asm,CurrentMem,LineNumber):
+            start = clock()
+            MachineCode = convert(asm,CurrentMem,LineNumber)
+            seconds = clock()-start
+            Mnemonics = asm.split()[0].lower()
+            if Mnemonics in description:
+                stats.instruction(Mnemonics,description[Mnemonics][1],seconds)
+            else:
+                stats.instruction(Mnemonics,'nop' if Mnemonics == 'nop' else '?',seconds)
+            return MachineCode
+        self.assemblyConverter = timedConverter
+        return self.Stats
+
+    #=========================================================================================================#
+    #   Machine codes of the last translated program as integers
+    #=========================================================================================================#
+    def words(self):
+        return self.image().tolist()
+
+    #=========================================================================================================#
+    #   Machine codes of the last translated program as array('I') which the output formats are built from
+    #=========================================================================================================#
+    def image(self):
+        return self.Program.Codes[:]                      #warnings are already 0
+
+    #=========================================================================================================#
+    #   Lines of the last translated program formatted as "asm : HEX : binary"
+    #=========================================================================================================#
+    def listing(self):
+        lines = []
+        opcodes = self.Program.Opcodes
+        (removed,changed) = (self.Program.Removed,self.Program.Changed)
+        for (index,(LineNumber,asm,MachineCode)) in enumerate(self.Program):
+            if index in removed:                          #asm removed by the optimizer before this one
+                lines.extend(self.removedNotes(removed[index]))
+            output = asm.ljust(30,' ') +': '
+            if (MachineCode is None):
+                output+= 'WARNING'.ljust(15,' ')+' : WARNING'
+            else:
+                output+= hex(MachineCode).ljust(15,' ')+' : '
+                output+= self.binaryText(self.OpcodeNames[opcodes[index]],MachineCode)
+            if index in changed:
+                output+= ('    # was '+changed[index] if changed[index] != asm else '    # moved')+' (line '+self.location(LineNumber)+')'
+            lines.append(output)
+        if len(self.Program) in removed:
+            lines.extend(self.removedNotes(removed[len(self.Program)]))
+        return lines
+
+    def removedNotes(self,removed):
+        return ['# removed '+asm+' (line '+self.location(LineNumber)+', '+reason+')' for (LineNumber,asm,reason) in removed]
+
+    def writeListing(self,path,useMmap = False):
+        self.writeOutput(path,"listing",useMmap)
+
+    #=========================================================================================================#
+    #   Writes the last translated program in one of OUTPUTFORMATS with a single bulk write
+    #=========================================================================================================#
+    def writeOutput(self,path,format = "listing",useMmap = False):
+        start = time.perf_counter()
+        if format == "listing":
+            data = ''.join([output+'\n' for output in self.listing()]).encode()
+        elif format in OUTPUTFORMATS:
+            data = OUTPUTFORMATS[format][0](self.image())
+        else:
+            raise AssemblerError("Output format "+str(format)+" is not supported")
+        writeBulk(path,data,useMmap)
+        if self.Stats is not None:
+            self.Stats.phase("output ("+format+")",start)
+
+
+
+#============================================================================================================#
+#                                              Statistics
+#   Filled by an Assembler after enableStats(): wall time per phase, count and conversion time per mnemonic
+#   and per format class (hasValue of PNUMANICSdictionary e.g a/b/s/v/ml/ms/j), warnings by category and
+#   the size of the TAG table. summary() is the human readable text, asDict() is for JSON
+#============================================================================================================#
+class AssemblerStats:
+
+    def __init__(self):
+        self.Phases = {}                    #phase -> seconds
+        self.Mnemonics = {}                 #mnemonic -> [count, seconds]
+        self.Classes = {}                   #hasValue -> [count, seconds]
+        self.Categories = {}                #warning category -> count
+        self.Tags = 0
+        self.Instructions = 0
+
+    def phase(self,name,start):
+        now = time.perf_counter()
+        self.Phases[name] = self.Phases.get(name,0.0)+(now-start)
+        return now
+
+    def instruction(self,Mnemonics,hasValue,seconds):
+        entry = self.Mnemonics.get(Mnemonics)
+        if entry is None:
+            entry = self.Mnemonics[Mnemonics] = [0,0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry = self.Classes.get(hasValue)
+        if entry is None:
+            entry = self.Classes[hasValue] = [0,0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def warning(self,category):
+        self.Categories[category] = self.Categories.get(category,0)+1
+
+    def asDict(self):
+        return {"phases_s":self.Phases,
+                "instructions":self.Instructions,
+                "tags":self.Tags,
+                "mnemonics":dict([(key,{"count":value[0],"seconds":value[1]}) for (key,value) in self.Mnemonics.items()]),
+                "classes":dict([(key,{"count":value[0],"seconds":value[1]}) for (key,value) in self.Classes.items()]),
+                "warnings":self.Categories}
+
+    def summary(self):
+        lines = ["---------------------------------- Statistics ----------------------------------"]
+        for name in self.Phases:
+            lines.append(name.ljust(30)+"%10.3f ms" % (self.Phases[name]*1000))
+        lines.append("asm".ljust(30)+str(self.Instructions).rjust(10))
+        lines.append("TAGs".ljust(30)+str(self.Tags).rjust(10))
+        for (title,table) in (("format class",self.Classes),("mnemonic",self.Mnemonics)):
+            if not table:
+                continue
+            lines.append(title.ljust(18)+"count".rjust(12)+"total ms".rjust(12)+"us/asm".rjust(10))
+            for key in sorted(table,key = lambda key: -table[key][1]):
+                (count,seconds) = table[key]
+                lines.append("  "+key.ljust(16)+str(count).rjust(12)+"%12.3f" % (seconds*1000)+"%10.2f" % (seconds*1e6/count))
+        if self.Categories:
+            lines.append("warnings by category")
+            for key in sorted(self.Categories):
+                lines.append("  "+key.ljust(16)+str(self.Categories[key]).rjust(12))
+        return '\n'.join(lines)
+
+
+
+#============================================================================================================#
+#                                             Table Cache
+#   The parsed reference tables and the encoder specs are kept with marshal in one file next to the
+#   reference files. Each reference file is recorded by (path, mtime, size, sha1 of content). When the
+#   mtime or size differ the content is hashed, and the cache is used only if the hashes still match
+#============================================================================================================#
+TABLECACHEVERSION = 2
+
+def tableFileStamp(path,withHash = True):
+    status = os.stat(path)
+    digest = None
+    if withHash:
+        with open(path,'rb') as reference:
+            digest = hashlib.sha1(reference.read()).hexdigest()
+    return (os.path.abspath(path),status.st_mtime_ns,status.st_size,digest)
+
+def tableConstants():
+    return (REGFILESIZE,REGBITWIDTH,OFFSETBITWIDTH,TARGETBITWIDTH)
+
+def readTableCache(cachePath,paths):
+    try:
+        with open(cachePath,'rb') as cachefile:
+            (version,constants,stamps,tables) = marshal.loads(cachefile.read())
+        if version != TABLECACHEVERSION or constants != tableConstants() or len(stamps) != len(paths):
+            return None
+        (mnemonics,regnames,specs,registers) = tables
+        if not (isinstance(mnemonics,dict) and isinstance(regnames,dict) and isinstance(specs,dict)
+                and isinstance(registers,dict)):
+            return None
+        stale = False
+        for (path,stamp) in zip(paths,stamps):
+            current = tableFileStamp(path,False)
+            if current[0:3] == stamp[0:3]:
+                continue
+            if current[0] != stamp[0] or tableFileStamp(path)[3] != stamp[3]:
+                return None                 #other file or content changed
+            stale = True                    #only touched, the stamps are refreshed
+        if stale:
+            writeTableCache(cachePath,paths,tables)
+        return tables
+    except (OSError,EOFError,ValueError,TypeError):
+        return None
+
+def writeTableCache(cachePath,paths,tables):
+    try:
+        stamps = tuple([tableFileStamp(path) for path in paths])
+        data = marshal.dumps((TABLECACHEVERSION,tableConstants(),stamps,tables))
+    except (OSError,ValueError):
+        return
+    temporary = cachePath+"."+str(os.getpid())+".tmp"    #one per process, batch workers may write it at once
+    try:
+        with open(temporary,'wb') as cachefile:
+            cachefile.write(data)
+        os.replace(temporary,cachePath)
+    except OSError:                         #e.g read only directory, the tables are parsed every time
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+
+
+
+#============================================================================================================#
+#                                          Incremental Cache
+#   Machine codes of every asm of the last run kept by Assembler.incrementalSecondPass() in columns by
+#   memory location. It is saved with
+#   pickle at path (if given) together with a signature of the reference tables, the cache is discarded
+#   when the tables change
+#
+#   e.g:   asm.Cache = IncrementalCache("program.cache", asm)
+#          asm.assemble_file("program.s")
+#          asm.Cache.save()
+#============================================================================================================#
+INCREMENTALCACHEVERSION = 5
+
+class IncrementalCache:
+
+    def __init__(self,path,assembler):
+        self.Path = path
+        self.Hits = 0                       #asm reused in the last run
+        self.clear()
+        self.Signature = hashlib.sha1(repr((INCREMENTALCACHEVERSION,sorted(assembler.PNUMANICSdictionary.items()),
+                                            sorted(assembler.RegNameDictionary.items()),
+                                            REGFILESIZE,REGBITWIDTH,OFFSETBITWIDTH,TARGETBITWIDTH)).encode()).hexdigest()
+        if path is None:
+            return
+        try:
+            with open(path,'rb') as cachefile:
+                (signature,columns) = pickle.load(cachefile)
+            if signature == self.Signature:
+                (self.Texts,self.Codes,self.Valid,self.Refs,self.Warnings,self.Root) = columns
+        except (IOError,EOFError,ValueError,TypeError,pickle.UnpicklingError):
+            pass                            #missing or broken cache, everything is converted again
+
+    def save(self):
+        if self.Path is None:
+            return
+        with open(self.Path,'wb') as cachefile:
+            pickle.dump((self.Signature,(self.Texts,self.Codes,self.Valid,self.Refs,self.Warnings,self.Root)),
+                        cachefile,pickle.HIGHEST_PROTOCOL)
+
+    def clear(self):
+        self.Texts = []                     #asm at every memory location of the last run
+        self.Codes = array(WORDTYPE)        #its machine code (0 for warnings)
+        self.Valid = bytearray()            #1 if it was converted without warnings
+        self.Refs = {}                      #index of a branch/jump/memory asm -> value of its TAG
+        self.Warnings = {}                  #index -> ((column, category, text), ...)
+        self.Root = 0
+
+
+
+#============================================================================================================#
+#   Workers of Assembler.parallelSecondPass(), the TAG table is handed over once when the worker starts
+#============================================================================================================#
+encodeAssembler = None                      #Assembler of the worker process
+
+def encodeInit(mnemonicsPath,regNamesPath,MemDictionary):
+    global encodeAssembler
+    encodeAssembler = Assembler(mnemonicsPath,regNamesPath,verbose = False)
+    encodeAssembler.MemDictionary = MemDictionary
+
+def encodeWorker(job):
+    (CurrentMem,chunk) = job
+    encodeAssembler.Diagnostics = Diagnostics()
+    codes = []
+    for (LineNumber,asm) in chunk:
+        codes.append(encodeAssembler.assemblyConverter(asm,CurrentMem,LineNumber))
+        CurrentMem += 1
+    return (codes,encodeAssembler.Diagnostics.Entries)
+
+
+
+#============================================================================================================#
+#                                           Output Formats
+#   Every format takes in the machine codes as array('I') and returns the whole file as bytes. Lines with
+#   warnings are written as 0 (nop) so that addresses in the image match the memory location of the asm
+#============================================================================================================#
+def formatBinaryBigEndian(code):
+    code = array(WORDTYPE,code)
+    if sys.byteorder == 'little':
+        code.byteswap()
+    return code.tobytes()
+
+def formatBinaryLittleEndian(code):
+    code = array(WORDTYPE,code)
+    if sys.byteorder == 'big':
+        code.byteswap()
+    return code.tobytes()
+
+def formatReadmemh(code):                   #Verilog $readmemh, one word per line
+    return ''.join(['%08x\n' % word for word in code]).encode()
+
+def formatReadmemb(code):                   #Verilog $readmemb, one word per line
+    return ''.join([format(word,'032b')+'\n' for word in code]).encode()
+
+#------------------------------------------------------------------------------------------------------------#
+#   Intel HEX with 16 data bytes per record, words are stored big endian as in MIPS memory. An extended
+#   linear address record (type 04) is added whenever the address crosses 64K
+#------------------------------------------------------------------------------------------------------------#
+def formatIntelHex(code):
+    data = formatBinaryBigEndian(code)
+    records = []
+    upper = 0
+    for address in range(0,len(data),16):
+        if (address>>16) != upper:
+            upper = address>>16
+            records.append(intelHexRecord(0,4,bytes([upper>>8, upper & 0xff])))
+        records.append(intelHexRecord(address & 0xffff,0,data[address:address+16]))
+    records.append(":00000001FF\n")
+    return ''.join(records).encode()
+
+def intelHexRecord(address,recordType,data):
+    record = bytes([len(data), address>>8, address & 0xff, recordType]) + data
+    checksum = (-sum(record)) & 0xff
+    return ':'+record.hex().upper()+'%02X' % checksum+'\n'
+
+#------------------------------------------------------------------------------------------------------------#
+#   Logisim memory image, 8 words per line and runs of the same word written as count*word
+#------------------------------------------------------------------------------------------------------------#
+def formatLogisim(code):
+    items = []
+    i = 0
+    length = len(code)
+    while i < length:
+        word = code[i]
+        j = i+1
+        while j < length and code[j] == word:
+            j += 1
+        if j-i >= 4:
+            items.append(str(j-i)+'*'+'%x' % word)
+        else:
+            items.extend(['%x' % word]*(j-i))
+        i = j
+    lines = ["v2.0 raw"]
+    for i in range(0,len(items),8):
+        lines.append(' '.join(items[i:i+8]))
+    return ('\n'.join(lines)+'\n').encode()
+
+OUTPUTFORMATS = {
+    "bin":      (formatBinaryBigEndian,   "raw machine codes, big endian"),
+    "binle":    (formatBinaryLittleEndian,"raw machine codes, little endian"),
+    "readmemh": (formatReadmemh,          "Verilog $readmemh text"),
+    "readmemb": (formatReadmemb,          "Verilog $readmemb text"),
+    "ihex":     (formatIntelHex,          "Intel HEX"),
+    "logisim":  (formatLogisim,           "Logisim v2.0 raw memory image"),
+}
+
+#------------------------------------------------------------------------------------------------------------#
+#   True when output is a file opened with O_APPEND (e.g >> out.bin), fcntl is not there on Windows
+#------------------------------------------------------------------------------------------------------------#
+def isAppending(output):
+    if fcntl is None:
+        return 'a' in getattr(output,'mode','')
+    return bool(fcntl.fcntl(output.fileno(),fcntl.F_GETFL) & os.O_APPEND)
+
+#------------------------------------------------------------------------------------------------------------#
+#   Fixup sections written after the last record of a stream which could not be patched in place, fixups
+#   is array('I') of (address, code) pairs. Binary images get the pairs in their byte order followed by the
+#   number of pairs and STREAMFIXUPMAGIC, Verilog images get "@address" and the word which the loaders
+#   write over the 0 at that address
+#------------------------------------------------------------------------------------------------------------#
+def fixupSectionBinary(format,fixups):
+    formatter = OUTPUTFORMATS[format][0]
+    return formatter(fixups)+formatter([len(fixups)//2])+STREAMFIXUPMAGIC
+
+def fixupSectionReadmem(format,fixups):
+    formatter = OUTPUTFORMATS[format][0]
+    return b''.join([b'@%x\n' % fixups[i] + formatter([fixups[i+1]]) for i in range(0,len(fixups),2)])
+
+STREAMFORMATS = {"bin":fixupSectionBinary, "binle":fixupSectionBinary,     #fixed width records
+                 "readmemh":fixupSectionReadmem, "readmemb":fixupSectionReadmem}
+
+#------------------------------------------------------------------------------------------------------------#
+#   Writes the whole data at once, for very large images the file can be filled through mmap
+#------------------------------------------------------------------------------------------------------------#
+def writeBulk(path,data,useMmap = False):
+    if not useMmap or len(data) == 0:       #an empty file cannot be mapped
+        with open(path,'wb') as outhandler:
+            outhandler.write(data)
+        return
+    with open(path,'w+b') as outhandler:
+        outhandler.truncate(len(data))
+        with mmap.mmap(outhandler.fileno(),len(data)) as image:
+            image[:] = data
+
+
+
+#============================================================================================================#
+#                                             Batch Mode
+#   Translates many programs in a process pool. Every worker creates its Assembler (reads the reference
+#   files) only once in batchInit() and then translates the files handed to it. Sources are given as
+#   paths, globs or @manifest files having one path/glob per line ('#' starts a comment)
+#============================================================================================================#
+OUTPUTEXTENSIONS = {"listing":".lst", "bin":".bin", "binle":".bin", "readmemh":".mem", "readmemb":".mem",
+                    "ihex":".hex", "logisim":".img"}
+
+batchAssembler = None                       #Assembler of the worker process
+
+def batchInit(mnemonicsPath,regNamesPath,maxErrors = None):
+    global batchAssembler
+    batchAssembler = Assembler(mnemonicsPath,regNamesPath,verbose = False,maxErrors = maxErrors)
+
+def batchWorker(job):
+    (path,outpath,format,singlePass) = job
+    start = time.perf_counter()
+    try:
+        code = batchAssembler.assemble_file(path,singlePass)
+        batchAssembler.writeOutput(outpath,format)
+    except (AssemblerError,IOError) as error:
+        return (path,outpath,0,0,time.perf_counter()-start,[],str(error))
+    except ValueError as error:             #e.g UnicodeDecodeError, a binary file given as source
+        return (path,outpath,0,0,time.perf_counter()-start,[],"File in path "+path+" cannot be read ("+str(error)+")")
+    return (path,outpath,len(code),batchAssembler.WarningCount,time.perf_counter()-start,
+            batchAssembler.Diagnostics.messages(),None)
+
+def batchSources(patterns):
+    paths = []
+    for pattern in patterns:
+        if pattern.startswith('@'):         #manifest file
+            try:
+                with open(pattern[1:],'r') as manifest:
+                    entries = [line.split('#')[0].strip() for line in manifest]
+            except IOError:
+                raise AssemblerError("Manifest "+pattern[1:]+" not found")
+            base = os.path.dirname(pattern[1:])
+            entries = [os.path.join(base,entry) for entry in entries if entry]
+        else:
+            entries = [pattern]
+        for entry in entries:
+            found = sorted(glob.glob(entry))
+            if not found:
+                found = [entry]             #reported as not found by the worker
+            paths.extend(found)
+    return paths
+
+def batchOutputPath(path,outdir,format):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if outdir is None:
+        outdir = os.path.dirname(path)
+    return os.path.join(outdir,stem+OUTPUTEXTENSIONS[format])
+
+#------------------------------------------------------------------------------------------------------------#
+#   (source, output) pairs without a source given twice. Two sources written to one output (a/prog.s and
+#   b/prog.s or prog.s and prog.txt with --outdir) would overwrite each other, that is an error
+#------------------------------------------------------------------------------------------------------------#
+def uniqueOutputs(pairs):
+    sources = {}                            #real path of the output -> source
+    unique = []
+    for (source,output) in pairs:
+        key = os.path.realpath(output)
+        if key in sources:
+            if os.path.realpath(sources[key]) != os.path.realpath(source):
+                raise AssemblerError(str(sources[key])+" and "+str(source)+" would both be written to "+str(output))
+            continue
+        sources[key] = source
+        unique.append((source,output))
+    return unique
+
+def assembleBatch(patterns,outdir = None,format = "listing",singlePass = False,jobs = None,
+                  mnemonicsPath = MNEMINOCSPATH,regNamesPath = REGNAMES,maxErrors = None):
+    paths = batchSources(patterns)
+    if outdir is not None:
+        os.makedirs(outdir,exist_ok = True)
+    jobsList = [(path,output,format,singlePass) for (path,output) in
+                uniqueOutputs([(path,batchOutputPath(path,outdir,format)) for path in paths])]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers = jobs,initializer = batchInit,initargs = (mnemonicsPath,regNamesPath,maxErrors)) as pool:
+        chunk = max(1,len(jobsList)//(4*(jobs or os.cpu_count() or 1)))
+        results = list(pool.map(batchWorker,jobsList,chunksize = chunk))
+    return (results,time.perf_counter()-start)
+
+def batchReport(results,elapsed):
+    failed = 0
+    totalWords = 0
+    totalWarnings = 0
+    for (path,outpath,count,warnings,seconds,messages,error) in results:
+        if error is not None:
+            failed += 1
+            print("ERROR  "+path+" : "+error)
             continue
-        CurrentMem += 1                         #updating Memory Position    
-        tmpwhandler.write(str(LineNumber)+'='+asm+'\n')
-         
-    tmpwhandler.close()
-    fp.close()
-except IOError:
-    print("ERROR: File in path "+INPATH+" not found"+"\nTerminating the program.....")
-#==================================================================================================================#  
+        totalWords += count
+        totalWarnings += warnings
+        print(("OK     " if warnings == 0 else "WARN   ")+path+" -> "+outpath+" : "+str(count)+" asm, "
+              +str(warnings)+" warnings, "+"%.3f" % (seconds*1000)+" ms")
+        for message in messages:
+            print("       "+message)
+    rate = totalWords/elapsed if elapsed > 0 else 0
+    print("Translated "+str(len(results)-failed)+"/"+str(len(results))+" files, "+str(totalWords)+" asm, "
+          +str(totalWarnings)+" warnings in "+"%.3f" % elapsed+" s ("+"%.0f" % rate+" asm/s)")
+    return failed
 
 
 
+#============================================================================================================#
+#   Watch mode: polls @INPATH and translates it again with the incremental cache as soon as it is saved
+#============================================================================================================#
+def watch(assembler,args):
+    last = None
+    files = [args.input]                  #the input and the files it included in the last build
+    print("Watching "+str(args.input)+" (Ctrl+C to stop)")
+    try:
+        while True:
+            stamp = tuple([sourceStamp(path) for path in files])
+            if stamp[0] is not None and stamp != last:
+                start = time.perf_counter()
+                try:
+                    code = assembler.assemble_file(args.input)
+                    assembler.writeOutput(args.output,args.format,args.mmap)
+                    assembler.Cache.save()
+                except AssemblerError as error:
+                    writeDiagnostics(assembler,args)
+                    print("ERROR: "+str(error))
+                    code = None
+                if code is not None:                      #stamps of the included files as they were read
+                    included = assembler.Program.Includes
+                else:                                     #the files read till the error and the ones before
+                    read = assembler.SourceMap.Files if assembler.SourceMap is not None else []
+                    included = dict([(path,sourceStamp(path)) for path in files[1:]+read if path is not None])
+                files = [args.input]+[path for path in included if path != args.input]
+                last = (stamp[0],)+tuple([included[path] for path in files[1:]])
+                if code is not None:
+                    writeDiagnostics(assembler,args)
+                    print(time.strftime("%H:%M:%S")+" "+str(len(code))+" asm ("+str(assembler.Cache.Hits)+" reused), "
+                          +str(assembler.WarningCount)+" warnings, "+"%.1f" % ((time.perf_counter()-start)*1000)+" ms -> "+str(args.output))
+            time.sleep(args.poll)
+    except KeyboardInterrupt:
+        return 0
 
 
-    
 
-#========================================= Main Program part-2  ======================================================#   
-#   Iterating for all line till End of Line of 'TMP' is reached. It will convert the assembly code 
-#   NOTE:readline() will return '' for eof and \n for a newline
-#==================================================================================================================#    
-try:
-    outhandler = open(OUTPUT,'w')
-    tmprhandler = open(TMP,'r')
-    CurrentMem = int(MemDictionary['root'])       #Holds the memory locatiom the current asm 
-    asm = ''                                      #Holds the assembly codes
-    
-    for line in tmprhandler:
-        asm = line.rstrip().split('=')[1]   
-        LineNumber = int(line.rstrip().split('=')[0].split()[0])
-        MachineHex = assemblyConverter(asm,CurrentMem,LineNumber)
-        CurrentMem += 1                           #updating Memory Position 
-        output = asm.ljust(30,' ') +': '
-        if (MachineHex =='WARNING'):
-            WarningCount += 1
-            output+= 'WARNING'.ljust(15,' ')+' : '
+#============================================================================================================#
+#   Warnings which are not printed by the assembler itself (json or --diagnostics-file) are written here
+#============================================================================================================#
+def writeDiagnostics(assembler,args):
+    if assembler.Verbose:
+        return
+    if args.diagnostics_file is None:
+        assembler.Diagnostics.emit(args.diagnostics,reportStream(args) if args.diagnostics == "text" else sys.stdout)
+    else:
+        with open(args.diagnostics_file,'w') as stream:
+            assembler.Diagnostics.emit(args.diagnostics,stream)
+
+
+
+#------------------------------------------------------------------------------------------------------------#
+#   Stream for the text meant for people (warnings, summary), stderr when stdout carries a JSON document
+#------------------------------------------------------------------------------------------------------------#
+def reportStream(args):
+    if args.stats == "json" or (args.diagnostics == "json" and args.diagnostics_file is None):
+        return sys.stderr
+    return sys.stdout
+
+
+
+#============================================================================================================#
+#   Streaming mode: stdin -> stdout, everything else is written to stderr so that the output can be piped.
+#   When stdout is a file (generator | python MIPSAssembler.py --stream -f bin > out.bin) the records
+#   waiting for a TAG are patched in place, for a pipe they come in the fixup section at the end
+#============================================================================================================#
+def streamMode(assembler,args):
+    start = time.perf_counter()
+    stream = None
+    try:
+        if args.diagnostics_file is not None:
+            stream = open(args.diagnostics_file,'w')
+        count = assembler.stream(sys.stdin,sys.stdout.buffer,args.format,args.chunk_size or STREAMCHUNK,stream)
+    except AssemblerError as error:
+        print("ERROR: "+str(error)+"\nTerminating the program.....",file=sys.stderr)
+        return 1
+    finally:
+        if stream is not None:
+            stream.close()
+    print("Streamed "+str(count)+" asm with "+str(assembler.WarningCount)+" warnings and "+str(len(assembler.MemDictionary)-1)
+          +" TAGs in "+"%.1f" % ((time.perf_counter()-start)*1000)+" ms",file=sys.stderr)
+    return 0
+
+
+
+#============================================================================================================#
+#   Command line use:  python MIPSAssembler.py [-i INPATH] [-o OUTPUT] [-f FORMAT]
+#                      python MIPSAssembler.py --watch [--incremental CACHE]
+#                      python MIPSAssembler.py --stream -f FORMAT < INPATH > OUTPUT
+#                      python MIPSAssembler.py --batch SOURCE [SOURCE ...] [--outdir DIR] [-j JOBS]
+#   Without any arguments it translates @INPATH to @OUTPUT as before
+#============================================================================================================#
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Converts MIPS assembly program to HEX and binary codes")
+    parser.add_argument("-i","--input",default=INPATH,help="path of the assembly program")
+    parser.add_argument("-o","--output",default=OUTPUT,help="path where the output is generated")
+    parser.add_argument("-f","--format",default="listing",choices=["listing"]+list(OUTPUTFORMATS),help="output format, listing is \"asm : HEX : binary\"")
+    parser.add_argument("--mmap",action="store_true",help="write the output through mmap, useful for very large images")
+    parser.add_argument("--single-pass",action="store_true",help="convert every asm as soon as it is read, TAGs read later are backpatched")
+    parser.add_argument("--batch",nargs="+",metavar="SOURCE",help="translate many programs (paths, globs or @manifest) in a process pool")
+    parser.add_argument("--outdir",help="batch mode: directory for the outputs, default is next to each program")
+    parser.add_argument("-j","--jobs",type=int,help="batch mode: number of worker processes, default is every core")
+    parser.add_argument("--parallel",type=int,metavar="JOBS",help="convert a large program in JOBS processes after the TAGs are read (0 = every core)")
+    parser.add_argument("--chunk-size",type=int,help="number of asm per chunk with --parallel (default "+str(PARALLELCHUNK)
+                                                      +") or written at once with --stream (default "+str(STREAMCHUNK)+")")
+    parser.add_argument("--stream",action="store_true",help="read the program from stdin and write the machine codes to stdout as they are translated")
+    parser.add_argument("--incremental",metavar="CACHE",help="reuse the machine codes of unchanged asm kept in CACHE from the last run")
+    parser.add_argument("--watch",action="store_true",help="translate again every time the input is saved")
+    parser.add_argument("--poll",type=float,default=0.05,help="watch mode: seconds between checks of the input")
+    parser.add_argument("--stats",nargs="?",const="text",choices=["text","json"],help="print time per phase/mnemonic, warnings by category and TAG count")
+    parser.add_argument("--max-errors",type=int,metavar="N",help="stop translating after N warnings")
+    parser.add_argument("--diagnostics",default="text",choices=["text","json"],help="format of the warnings written after translating")
+    parser.add_argument("--diagnostics-file",metavar="PATH",help="write the warnings to PATH instead of the console")
+    parser.add_argument("--no-table-cache",action="store_true",help="always parse the reference files, do not read/write their cache")
+    parser.add_argument("--no-preprocess",action="store_true",help="read .include/.macro lines as asm, no preprocessing")
+    parser.add_argument("--optimize",action="store_true",help="remove nops, asm without effect and branches to the next asm")
+    parser.add_argument("--fill-delay-slots",action="store_true",help="optimize for a target with branch delay slots, moves asm into them")
+    parser.add_argument("--mnemonics",default=MNEMINOCSPATH,help="mnemonics reference file")
+    parser.add_argument("--regnames",default=REGNAMES,help="register names reference file")
+    args = parser.parse_args(argv)
+    if args.parallel is not None and args.single_pass:
+        parser.error("--parallel needs the TAGs of the whole program and cannot be used with --single-pass")
+    if (args.incremental or args.watch) and (args.single_pass or args.parallel is not None):
+        parser.error("--incremental/--watch cannot be used with --single-pass or --parallel")
+    if (args.optimize or args.fill_delay_slots) and (args.single_pass or args.batch):
+        parser.error("--optimize/--fill-delay-slots need the whole program and cannot be used with --single-pass or --batch")
+    if args.stream and (args.batch or args.watch or args.incremental or args.parallel is not None or args.mmap
+                        or args.optimize or args.fill_delay_slots or args.stats):
+        parser.error("--stream translates stdin in a single pass, it cannot be used with --batch, --watch, --incremental, "
+                     "--parallel, --mmap, --optimize or --stats")
+    if args.stream and args.format not in STREAMFORMATS:
+        parser.error("--stream writes fixed width records, use -f with one of "+", ".join(STREAMFORMATS))
+    if args.stream and args.diagnostics == "json":
+        parser.error("--stream writes the warnings as text while translating")
+    if args.stats == "json" and args.diagnostics == "json" and args.diagnostics_file is None:
+        parser.error("--stats json and --diagnostics json cannot both be written to stdout, use --diagnostics-file")
+    if args.max_errors is not None and args.max_errors < 1:
+        parser.error("--max-errors should be at least 1")
+
+    if args.batch:
+        try:
+            (results,elapsed) = assembleBatch(args.batch,args.outdir,args.format,args.single_pass,args.jobs,
+                                              args.mnemonics,args.regnames,args.max_errors)
+        except AssemblerError as error:
+            print("ERROR: "+str(error)+"\nTerminating the program.....")
+            return 1
+        return 1 if batchReport(results,elapsed) else 0
+
+    assembler = None
+    try:
+        assembler = Assembler(args.mnemonics,args.regnames,tableCache = not args.no_table_cache,maxErrors = args.max_errors,
+                              verbose = args.diagnostics == "text" and args.diagnostics_file is None and args.stats != "json")
+        assembler.ChunkSize = args.chunk_size or PARALLELCHUNK
+        if args.no_preprocess:
+            assembler.Preprocessor = None
+        assembler.Optimize = args.optimize or args.fill_delay_slots
+        assembler.DelaySlots = args.fill_delay_slots
+        if args.stats:
+            assembler.enableStats()
+        if args.incremental or args.watch:
+            assembler.Cache = IncrementalCache(args.incremental,assembler)
+        if args.watch:
+            return watch(assembler,args)
+        if args.stream:
+            return streamMode(assembler,args)
+        assembler.assemble_file(args.input,args.single_pass,args.parallel)
+        assembler.writeOutput(args.output,args.format,args.mmap)
+        if assembler.Cache is not None:
+            assembler.Cache.save()
+    except AssemblerError as error:
+        if assembler is not None:
+            writeDiagnostics(assembler,args)
+        print("ERROR: "+str(error)+"\nTerminating the program.....",file=reportStream(args))
+        return 1
+    writeDiagnostics(assembler,args)
+    report = reportStream(args)
+    if assembler.Optimize:
+        for (LineNumber,text) in assembler.Optimizations:
+            print("OPTIMIZED line "+assembler.location(LineNumber)+": "+text,file=report)
+        print("Optimizer made "+str(len(assembler.Optimizations))+" changes",file=report)
+
+    if(assembler.WarningCount == 0):
+        print("Program succesfully compiled and translated for MIPS R2000",file=report)
+        if args.format == "listing":
+            print("Output generated in "+str(args.output)+" which is formatted as \"asm : HEX : binary\" ",file=report)
         else:
-            output+= underscoreRemover(MachineHex,LineNumber).ljust(15,' ')+' : '
-         
-        output+=MachineHex
-        outhandler.write(output+'\n')
-
-    tmprhandler.close()
-    outhandler.close()
-except IOError:
-    print("ERROR: run time generated files were deleted. Re-run the program.\nTerminating the program.....")
-    
-    
-
-if(WarningCount == 0):
-    print("Program succesfully compiled and translated for MIPS R2000")
-    print("Output generated in "+str(OUTPUT)+" which is formatted as \"asm : HEX : binary\" ")
-else:
-    print("Program encountered "+str(WarningCount)+" warnings while translating")
-
-#============================================= The End ============================================================#  
+            print("Output generated in "+str(args.output)+" as "+OUTPUTFORMATS[args.format][1],file=report)
+    else:
+        print("Program encountered "+str(assembler.WarningCount)+" warnings while translating",file=report)
+    if args.stats == "json":
+        print(json.dumps(assembler.Stats.asDict(),indent=2))
+    elif args.stats:
+        print(assembler.Stats.summary())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
 
+#============================================= The End ============================================================#
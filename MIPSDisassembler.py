@@ -0,0 +1,450 @@
+#===========================================================================================================#
+# Name  : MIPSDisassembler.py
+#
+# Turns the machine codes written by MIPSAssembler.py back into assembly. The decode tables are the inverse
+# of 'PNUMANICSdictionary' and 'RegNameDictionary' so an opcode/function changed in 'mnemonics.dict' is
+# followed here as well.
+#
+# HIGHLIGHTS:
+#          1) The image is read into a uint32 NumPy array and every field (opcode, rs, rt, rd, shamt, funct,
+#             immediate, target) is extracted for all the words at once with masks and shifts
+#          2) Every word is classified in bulk through one lookup table indexed by opcode and function
+#          3) Branch and jump targets inside the image get TAGs (L<address>) so the output can be assembled
+#             again, e.g  python MIPSDisassembler.py -i program.bin -o program.s
+#          4) --compare SOURCE assembles SOURCE and lists the addresses where the image differs
+#
+# NOTE: Mnemonics sharing the same opcode and function in 'mnemonics.dict' (e.g sw/sb) are disassembled as
+#       the one written first. Words which match no mnemonic are written as '.word 0x........'
+#============================================================================================================#
+
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from MIPSAssembler import (Assembler, AssemblerError, MNEMINOCSPATH, REGNAMES, REGBITWIDTH, FUNCTIONBITWIDTH,
+                           OFFSETBITWIDTH, TARGETBITWIDTH, STREAMFIXUPMAGIC)
+
+#============================================================================================================#
+#                                           Constants Used
+#============================================================================================================#
+UNKNOWN = -1                 #class of a word which matches no mnemonic
+NOP = -2                     #class of the all zero word
+
+#------------------- how the operands of every mnemonic are written, found from its encoder -------------------#
+STYLE_RRR = 0                #add rd, rs, rt
+STYLE_SHIFT = 1              #sll rd, rt, sa
+STYLE_SHIFTV = 2             #sllv rd, rt, rs
+STYLE_IMMEDIATE = 3          #addi rt, rs, immediate
+STYLE_BRANCH2 = 4            #beq rs, rt, offset
+STYLE_MEMORY = 5             #lw rt, offset(rs)
+STYLE_BRANCH1 = 6            #bgez rs, offset
+STYLE_JR = 7                 #jr rs
+STYLE_JUMP = 8               #j target
+
+INPUTFORMATS = ["bin","binle","readmemh","readmemb","ihex","logisim","listing"]
+
+
+
+#============================================================================================================#
+#                                               Image Loading
+#   Every loader returns the image as a uint32 array. The text formats are converted with a digit lookup
+#   table over the bytes of the file, only ihex/logisim/listing go through Python per record/line
+#============================================================================================================#
+HEXDIGITS = np.full(256,255,dtype=np.uint8)
+for digit,character in enumerate(b"0123456789abcdef"):
+    HEXDIGITS[character] = digit
+    HEXDIGITS[ord(chr(character).upper())] = digit
+
+def parseDigits(tokens,base):
+    if not tokens:
+        return np.zeros(0,dtype=np.uint32)
+    width = len(tokens[0])
+    if width <= 32 and all(len(token) == width for token in tokens):      #e.g readmemh: 8 digits per word
+        digits = HEXDIGITS[np.frombuffer(b''.join(tokens),dtype=np.uint8)].reshape(len(tokens),width)
+        if (digits >= base).any():
+            raise AssemblerError("image has a value which is not a base "+str(base)+" number")
+        words = np.zeros(len(tokens),dtype=np.uint64)
+        for column in range(width):
+            words = words*base + digits[:,column]
+    else:
+        try:
+            words = np.array([int(token,base) for token in tokens],dtype=np.uint64)
+        except ValueError:
+            raise AssemblerError("image has a value which is not a base "+str(base)+" number")
+    if (words >> 32).any():
+        raise AssemblerError("image has a value wider than 32 bits")
+    return words.astype(np.uint32)
+
+def readmemTokens(data):                    #drops // comments, [(address, tokens)] for every '@address'
+    if b"//" not in data and b"@" not in data:
+        return [(0,data.split())]
+    segments = [(0,[])]
+    for line in data.splitlines():
+        line = line.split(b"//")[0].strip()
+        if line.startswith(b"@"):
+            try:
+                segments.append((int(line[1:].split()[0],16),[]))
+            except (IndexError,ValueError):
+                raise AssemblerError("image has a bad @address record "+line.decode(errors="replace"))
+            line = b' '.join(line.split()[1:])
+        segments[-1][1].extend(line.split())
+    return segments
+
+def loadReadmem(data,base):                 #later '@address' words are written over the earlier ones
+    segments = readmemTokens(data)
+    if len(segments) == 1:
+        return parseDigits(segments[0][1],base)
+    words = np.zeros(max([address+len(tokens) for (address,tokens) in segments]),dtype=np.uint32)
+    for (address,tokens) in segments:
+        words[address:address+len(tokens)] = parseDigits(tokens,base)
+    return words
+
+#------------------------------------------------------------------------------------------------------------#
+#   Binary image streamed to a pipe by MIPSAssembler.py --stream: the records which were fixed after they
+#   were written follow the image as (address, word) pairs, their count and STREAMFIXUPMAGIC
+#------------------------------------------------------------------------------------------------------------#
+def applyFixupSection(data,dtype):
+    count = int(np.frombuffer(data,dtype=dtype,count=1,offset=len(data)-len(STREAMFIXUPMAGIC)-4)[0])
+    end = len(data)-len(STREAMFIXUPMAGIC)-4-8*count
+    if end < 0 or end % 4:
+        raise AssemblerError("image has a broken fixup section")
+    pairs = np.frombuffer(data,dtype=dtype,count=2*count,offset=end).astype(np.uint32)
+    words = np.frombuffer(data[:end],dtype=dtype).astype(np.uint32)
+    if count and int(pairs[0::2].max()) >= len(words):
+        raise AssemblerError("image has a fixup outside of the image")
+    words[pairs[0::2]] = pairs[1::2]
+    return words
+
+def loadIntelHex(data):
+    image = bytearray()
+    upper = 0
+    for record in data.split():
+        record = bytes.fromhex(record.decode()[1:])
+        (count,address,recordType) = (record[0],record[1]<<8 | record[2],record[3])
+        if recordType == 1:
+            break
+        if recordType == 4:
+            upper = record[4]<<8 | record[5]
+        elif recordType == 0:
+            start = (upper<<16) + address
+            if len(image) < start:
+                image.extend(bytes(start-len(image)))
+            image[start:start+count] = record[4:4+count]
+    return image
+
+def loadLogisim(data):
+    tokens = []
+    for line in data.decode().splitlines()[1:]:           #first line is "v2.0 raw"
+        for item in line.split('#')[0].split():
+            if '*' in item:
+                (count,word) = item.split('*')
+                tokens.extend([word]*int(count))
+            else:
+                tokens.append(item)
+    return np.array([int(token,16) for token in tokens],dtype=np.uint32)
+
+def loadListing(data):                      #"asm : HEX : binary", WARNING lines are nop in the image
+    words = []
+    for line in data.decode().splitlines():
+        pieces = line.split(' : ')
+        if len(pieces) >= 2:
+            text = pieces[1].strip()
+            words.append(int(text,16) if text.startswith('0x') else 0)
+    return np.array(words,dtype=np.uint32)
+
+def loadImage(path,format = "bin"):
+    try:
+        with open(path,'rb') as imagefile:
+            data = imagefile.read()
+    except IOError:
+        raise AssemblerError(str(path)+" file not found in the directory")
+    if format in ("bin","binle","ihex"):
+        if format == "ihex":
+            data = loadIntelHex(data)
+        if format != "ihex" and data.endswith(STREAMFIXUPMAGIC):
+            return applyFixupSection(data,'<u4' if format == "binle" else '>u4')
+        if len(data) % 4:
+            data = bytes(data)+bytes(4-len(data) % 4)
+        return np.frombuffer(data,dtype='<u4' if format == "binle" else '>u4').astype(np.uint32)
+    if format == "readmemh":
+        return loadReadmem(data,16)
+    if format == "readmemb":
+        return loadReadmem(data,2)
+    if format == "logisim":
+        return loadLogisim(data)
+    if format == "listing":
+        return loadListing(data)
+    raise AssemblerError("image format "+str(format)+" is not known")
+
+
+
+#============================================================================================================#
+#                                             Disassembler
+#   Builds the decode tables from the tables of an Assembler (so the table cache is used as well). The
+#   class of a word is found by Classes[opcode<<SubBits | sub] where sub is the function field of that
+#   opcode (funct for R type, rt for bgez/bltz...) or 0 when the opcode has no function
+#============================================================================================================#
+class Disassembler:
+
+    def __init__(self,mnemonicsPath = MNEMINOCSPATH,regNamesPath = REGNAMES,tableCache = True):
+        self.Assembler = Assembler(mnemonicsPath,regNamesPath,verbose = False,tableCache = tableCache)
+        self.Mnemonics = []                 #class -> mnemonic
+        self.Styles = []                    #class -> STYLE_*
+        self.RegNames = {}                  #register number -> '$name' (first name in 'regNames.dict')
+        for name in self.Assembler.RegNameDictionary:
+            self.RegNames.setdefault(int(self.Assembler.RegNameDictionary[name]),'$'+name)
+        self.buildTables(self.Assembler.encoderSpecs())
+
+    def buildTables(self,specs):
+        opcodeShift = None
+        subFields = {}                      #opcode -> (shift, width) of its function field
+        entries = []
+        for Mnemonics in specs:
+            (encoder,layout,shifts,base) = specs[Mnemonics]
+            descriptionMnemonics = self.Assembler.PNUMANICSdictionary[Mnemonics]
+            hasValue = descriptionMnemonics[1]
+            if opcodeShift is None:
+                (opcodeShift,opcodeWidth) = (shifts[0],layout[0])
+            elif (shifts[0],layout[0]) != (opcodeShift,opcodeWidth):
+                raise AssemblerError("{"+Mnemonics+"} has an opcode field of another width, it cannot be disassembled")
+            opcode = int(descriptionMnemonics[2],2)
+            zero = []                       #fields which are always 0 for this mnemonic
+            sub = None
+            if encoder == "threeRegisterEncoder":
+                sub = 5
+                style = {'a':STYLE_RRR, 's':STYLE_SHIFT}.get(hasValue,STYLE_SHIFTV)
+                zero = [1] if hasValue == 's' else [4]
+            elif encoder == "twoRegisterEncoder":
+                style = {'a':STYLE_IMMEDIATE, 'b':STYLE_BRANCH2}.get(hasValue,STYLE_MEMORY)
+            elif encoder == "branchEncoder":
+                (sub,style) = (2,STYLE_BRANCH1)
+            elif encoder == "jumpRegisterEncoder":
+                (sub,style,zero) = (3,STYLE_JR,[2])
+            else:
+                style = STYLE_JUMP
+            fixedMask = ((1<<layout[0])-1)<<shifts[0]
+            fixedValue = opcode<<shifts[0]
+            subValue = 0
+            if sub is not None:
+                if subFields.setdefault(opcode,(shifts[sub],layout[sub])) != (shifts[sub],layout[sub]):
+                    raise AssemblerError("{"+Mnemonics+"} has its function in another field than the other mnemonics of its opcode")
+                subValue = int(descriptionMnemonics[3],2)
+                fixedMask |= ((1<<layout[sub])-1)<<shifts[sub]
+                fixedValue |= subValue<<shifts[sub]
+            for field in zero:
+                fixedMask |= ((1<<layout[field])-1)<<shifts[field]
+            entries.append((Mnemonics,style,opcode,sub is not None,subValue,fixedMask,fixedValue))
+        if opcodeShift is None:
+            raise AssemblerError("no mnemonics to disassemble")
+
+        self.OpcodeShift = opcodeShift
+        self.OpcodeMask = (1<<opcodeWidth)-1
+        self.SubBits = max([width for (shift,width) in subFields.values()] or [0])
+        self.SubShift = np.zeros(1<<opcodeWidth,dtype=np.uint32)
+        self.SubMask = np.zeros(1<<opcodeWidth,dtype=np.uint32)
+        for opcode in subFields:
+            (shift,width) = subFields[opcode]
+            self.SubShift[opcode] = shift
+            self.SubMask[opcode] = (1<<width)-1
+        self.Classes = np.full((1<<opcodeWidth)<<self.SubBits,UNKNOWN,dtype=np.int16)
+        fixedMasks = []
+        fixedValues = []
+        for (Mnemonics,style,opcode,hasSub,subValue,fixedMask,fixedValue) in entries:
+            if hasSub != (opcode in subFields):
+                raise AssemblerError("{"+Mnemonics+"} has no function but other mnemonics of its opcode have one")
+            key = opcode<<self.SubBits | subValue
+            if self.Classes[key] != UNKNOWN:            #same codes as an earlier mnemonic, that one is used
+                continue
+            self.Classes[key] = len(self.Mnemonics)
+            self.Mnemonics.append(Mnemonics)
+            self.Styles.append(style)
+            fixedMasks.append(fixedMask)
+            fixedValues.append(fixedValue)
+        #the last two entries are for NOP (-2) and UNKNOWN (-1), an UNKNOWN word never matches its fixed value
+        self.FixedMasks = np.array(fixedMasks+[0,0],dtype=np.uint32)
+        self.FixedValues = np.array(fixedValues+[0,1],dtype=np.uint32)
+        self.StyleOf = np.array(self.Styles+[-1,-1],dtype=np.int8)
+
+    #=========================================================================================================#
+    #   Splits every word into its fields and finds its class, all in NumPy. Returns a DecodedImage
+    #=========================================================================================================#
+    def decode(self,words):
+        words = np.ascontiguousarray(words,dtype=np.uint32)
+        count = len(words)
+        regMask = np.uint32((1<<REGBITWIDTH)-1)
+        decoded = DecodedImage(words)
+        shift = self.OpcodeShift                        #opcode_rs_rt_rd_sa_function
+        decoded.Opcode = (words >> np.uint32(shift)) & np.uint32(self.OpcodeMask)
+        (decoded.Rs,decoded.Rt,decoded.Rd,decoded.Shamt) = [(words >> np.uint32(shift-i*REGBITWIDTH)) & regMask
+                                                            for i in range(1,5)]
+        decoded.Funct = words & np.uint32((1<<FUNCTIONBITWIDTH)-1)
+        decoded.Immediate = (words & np.uint32((1<<OFFSETBITWIDTH)-1)).astype(np.int16)   #wraps to the signed value
+        decoded.Target = words & np.uint32((1<<TARGETBITWIDTH)-1)
+
+        opcode = decoded.Opcode
+        classes = self.Classes[(opcode << np.uint32(self.SubBits)) | ((words >> self.SubShift[opcode]) & self.SubMask[opcode])]
+        classes[(words & self.FixedMasks[classes]) != self.FixedValues[classes]] = UNKNOWN   #e.g shamt of add is not 0
+        classes[words == 0] = NOP
+        decoded.Class = classes
+
+        #------------------------------- TAGs for branch and jump targets inside the image ---------------------#
+        style = self.StyleOf[classes]
+        branch = (style == STYLE_BRANCH2) | (style == STYLE_BRANCH1)
+        rows = np.flatnonzero(branch | (style == STYLE_JUMP))
+        targets = np.where(branch[rows],rows+1+decoded.Immediate[rows],decoded.Target[rows])
+        inside = (targets >= 0) & (targets < count)
+        decoded.Targets = np.full(count,-1,dtype=np.int64)
+        decoded.Targets[rows[inside]] = targets[inside]
+        marked = np.zeros(count,dtype=bool)
+        marked[targets[inside]] = True
+        decoded.Labels = dict([(target,"L"+str(target)) for target in np.flatnonzero(marked).tolist()])
+        return decoded
+
+    #=========================================================================================================#
+    #   Writes the asm of every word. Operands are taken from the decoded columns as Python lists once
+    #=========================================================================================================#
+    def render(self,decoded):
+        names = self.Mnemonics
+        styles = self.Styles
+        regs = [self.RegNames.get(number,'$'+str(number)) for number in range(1<<REGBITWIDTH)]
+        labels = decoded.Labels
+        jumpSign = 1<<(TARGETBITWIDTH-1)
+        lines = []
+        columns = zip(decoded.Words.tolist(),decoded.Class.tolist(),decoded.Rs.tolist(),decoded.Rt.tolist(),
+                      decoded.Rd.tolist(),decoded.Shamt.tolist(),decoded.Immediate.tolist(),decoded.Target.tolist(),
+                      decoded.Targets.tolist())
+        for (word,wordClass,rs,rt,rd,sa,imm,target,jumpTo) in columns:
+            if wordClass < 0:
+                lines.append("nop" if wordClass == NOP else ".word 0x%08x" % word)
+                continue
+            Mnemonics = names[wordClass]
+            style = styles[wordClass]
+            if style == STYLE_RRR:
+                lines.append(Mnemonics+" "+regs[rd]+", "+regs[rs]+", "+regs[rt])
+            elif style == STYLE_SHIFT:
+                lines.append(Mnemonics+" "+regs[rd]+", "+regs[rt]+", "+str(sa))
+            elif style == STYLE_SHIFTV:
+                lines.append(Mnemonics+" "+regs[rd]+", "+regs[rt]+", "+regs[rs])
+            elif style == STYLE_IMMEDIATE:
+                lines.append(Mnemonics+" "+regs[rt]+", "+regs[rs]+", "+str(imm))
+            elif style == STYLE_BRANCH2:
+                lines.append(Mnemonics+" "+regs[rs]+", "+regs[rt]+", "+(labels[jumpTo] if jumpTo >= 0 else str(imm)))
+            elif style == STYLE_MEMORY:
+                lines.append(Mnemonics+" "+regs[rt]+", "+str(imm)+"("+regs[rs]+")")
+            elif style == STYLE_BRANCH1:
+                lines.append(Mnemonics+" "+regs[rs]+", "+(labels[jumpTo] if jumpTo >= 0 else str(imm)))
+            elif style == STYLE_JR:
+                lines.append(Mnemonics+" "+regs[rs])
+            else:
+                if jumpTo < 0 and target >= jumpSign:       #the assembler takes the target as signed
+                    target -= 2*jumpSign
+                lines.append(Mnemonics+" "+(labels[jumpTo] if jumpTo >= 0 else str(target)))
+        return lines
+
+    #=========================================================================================================#
+    #   Whole program text: TAG, asm and (with comments) the address and machine code of every word
+    #=========================================================================================================#
+    def disassemble(self,words,comments = True):
+        return self.listing(self.decode(words),comments)
+
+    def listing(self,decoded,comments = True):
+        labels = decoded.Labels
+        text = []
+        for (address,(asm,word)) in enumerate(zip(self.render(decoded),decoded.Words.tolist())):
+            label = labels[address]+": " if address in labels else ""
+            if comments:
+                text.append((label.ljust(10)+asm).ljust(40)+"# "+"%06x" % address+" : "+"%08x" % word+"\n")
+            else:
+                text.append(label.ljust(10)+asm+"\n")
+        return ''.join(text)
+
+    def disassemble_file(self,path,format = "bin",comments = True):
+        return self.disassemble(loadImage(path,format),comments)
+
+
+
+#============================================================================================================#
+#   Columns of a decoded image, one entry per word. Class is the index in Disassembler.Mnemonics, UNKNOWN
+#   or NOP; Targets is the address a branch/jump goes to when it is inside the image else -1
+#============================================================================================================#
+class DecodedImage:
+
+    def __init__(self,words):
+        self.Words = words
+        self.Opcode = self.Rs = self.Rt = self.Rd = self.Shamt = self.Funct = None
+        self.Immediate = self.Target = self.Class = self.Targets = None
+        self.Labels = {}                    #address -> TAG
+
+    def __len__(self):
+        return len(self.Words)
+
+    def unknown(self):
+        return np.flatnonzero(self.Class == UNKNOWN)
+
+
+
+#============================================================================================================#
+#   Compares an image with the machine codes of an assembly program, returns the addresses which differ.
+#   Lines with warnings are 0 in the assembled image, as in the output formats
+#============================================================================================================#
+def compareImage(words,assembler,sourcePath):
+    assembler.assemble_file(sourcePath)
+    expected = np.frombuffer(assembler.image(),dtype=np.uint32)
+    length = max(len(words),len(expected))
+    image = np.zeros(length,dtype=np.uint32)
+    image[:len(words)] = words
+    reference = np.zeros(length,dtype=np.uint32)
+    reference[:len(expected)] = expected
+    return (np.flatnonzero(image != reference),reference)
+
+
+
+#============================================================================================================#
+#   Command line use:  python MIPSDisassembler.py -i IMAGE [-f FORMAT] [-o OUTPUT] [--compare SOURCE]
+#============================================================================================================#
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Converts MIPS machine codes back to assembly")
+    parser.add_argument("-i","--input",required=True,help="path of the image")
+    parser.add_argument("-f","--format",default="bin",choices=INPUTFORMATS,help="format of the image, as written by MIPSAssembler.py")
+    parser.add_argument("-o","--output",help="path of the assembly program, default is the console")
+    parser.add_argument("--no-comments",action="store_true",help="do not write the address and machine code after every asm")
+    parser.add_argument("--compare",metavar="SOURCE",help="assemble SOURCE and list the addresses where the image differs")
+    parser.add_argument("--no-table-cache",action="store_true",help="always parse the reference files, do not read/write their cache")
+    parser.add_argument("--mnemonics",default=MNEMINOCSPATH,help="mnemonics reference file")
+    parser.add_argument("--regnames",default=REGNAMES,help="register names reference file")
+    args = parser.parse_args(argv)
+
+    try:
+        disassembler = Disassembler(args.mnemonics,args.regnames,not args.no_table_cache)
+        start = time.perf_counter()
+        words = loadImage(args.input,args.format)
+        if args.compare:
+            (differ,reference) = compareImage(words,disassembler.Assembler,args.compare)
+            decoded = disassembler.decode(np.concatenate((words,reference[len(words):])))
+            asm = disassembler.render(decoded)
+            expected = disassembler.render(disassembler.decode(reference))
+            for address in differ.tolist():
+                print("%06x" % address+" : image "+asm[address].ljust(30)+" source "+expected[address])
+            print(str(len(differ))+" of "+str(len(reference))+" words differ from "+args.compare)
+            return 1 if len(differ) else 0
+        decoded = disassembler.decode(words)
+        elapsed = time.perf_counter()-start
+        text = disassembler.listing(decoded,not args.no_comments)
+    except AssemblerError as error:
+        print("ERROR: "+str(error)+"\nTerminating the program.....")
+        return 1
+
+    if args.output is None:
+        sys.stdout.write(text)
+    else:
+        with open(args.output,'w') as outhandler:
+            outhandler.write(text)
+        print("Disassembled "+str(len(decoded))+" words ("+str(len(decoded.Labels))+" TAGs, "+str(len(decoded.unknown()))
+              +" unknown) in "+"%.3f" % elapsed+" s -> "+args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+#===========================================================================================================#
+# Name  : MIPSLinker.py
+#
+# Builds one image from many assembly programs. Every program is translated on its own into a relocatable
+# object (its machine codes as if it started at 0, its TAGs and the relocations of the asm using TAGs of
+# other programs or jumping to its own TAGs) and the linker puts the objects one after the other, finds
+# every TAG and patches the offsets/targets.
+#
+#   python MIPSLinker.py build main.s lib.s -o firmware.bin      # translates what changed, then links
+#   python MIPSLinker.py compile lib.s                           # lib.o
+#   python MIPSLinker.py link main.o lib.o -o firmware.bin --map firmware.map
+#
+# NOTE: All TAGs of a program are exported. A TAG used in a program is taken from that program first, else
+#       from the one other object defining it; a TAG defined in more than one of the other objects is an error
+#============================================================================================================#
+
+import os
+import sys
+import time
+import marshal
+import hashlib
+import argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from MIPSAssembler import (Assembler, AssemblerError, MNEMINOCSPATH, REGNAMES, OFFSETBITWIDTH, TARGETBITWIDTH,
+                           WORDTYPE, OUTPUTFORMATS, writeBulk, tableConstants, uniqueOutputs)
+
+#============================================================================================================#
+#                                           Constants Used
+#============================================================================================================#
+OBJECTVERSION = 2            #changed whenever the object format changes, older objects are translated again
+OBJECTEXTENSION = ".o"
+
+
+
+#============================================================================================================#
+#                                           Relocatable Object
+#   Kept on disk with marshal as (OBJECTVERSION, signature, name, words, exports, relocations, warnings,
+#   includes) where words are the bytes of array('I'), exports {TAG: index} and relocations [(index, TAG,
+#   kind)]. signature is the hash of the program text and the reference tables the object was translated
+#   with, includes {path: sha1} of the files it includes (.include)
+#============================================================================================================#
+class ObjectFile:
+
+    def __init__(self,name,words,exports,relocations,signature = None,warnings = 0,includes = None):
+        self.Name = name
+        self.Words = words                  #array('I'), asm with warnings are 0 (nop)
+        self.Exports = exports              #TAG -> index of the asm in Words
+        self.Relocations = relocations      #(index, TAG, 'j' target or 'b' offset)
+        self.Signature = signature
+        self.Warnings = warnings
+        self.Includes = includes or {}
+
+    def __len__(self):
+        return len(self.Words)
+
+    def imports(self):
+        return sorted(set([TAG for (index,TAG,kind) in self.Relocations if TAG not in self.Exports]))
+
+    def save(self,path):
+        data = marshal.dumps((OBJECTVERSION,self.Signature,self.Name,self.Words.tobytes(),self.Exports,
+                              self.Relocations,self.Warnings,self.Includes))
+        temporary = path+".tmp"
+        with open(temporary,'wb') as objectfile:
+            objectfile.write(data)
+        os.replace(temporary,path)
+
+    @staticmethod
+    def load(path):
+        try:
+            with open(path,'rb') as objectfile:
+                data = marshal.loads(objectfile.read())
+        except IOError:
+            raise AssemblerError("Object "+str(path)+" not found")
+        except (EOFError,ValueError,TypeError):
+            raise AssemblerError("Object "+str(path)+" is not an object file of this linker")
+        if not isinstance(data,tuple) or not data or data[0] != OBJECTVERSION:
+            raise AssemblerError("Object "+str(path)+" was written by another version, translate it again")
+        (version,signature,name,words,exports,relocations,warnings,includes) = data
+        code = array(WORDTYPE)
+        code.frombytes(words)
+        return ObjectFile(name,code,exports,[tuple(relocation) for relocation in relocations],signature,warnings,includes)
+
+
+
+#============================================================================================================#
+#   Translating a program into an object. The signature changes with the program text, the reference
+#   tables and the constants so an object on disk is reused only when it would be translated the same,
+#   together with the sha1 of every file the program includes
+#============================================================================================================#
+def objectSignature(assembler,source):
+    tables = repr((OBJECTVERSION,sorted(assembler.PNUMANICSdictionary.items()),sorted(assembler.RegNameDictionary.items()),
+                   tableConstants())).encode()
+    return hashlib.sha1(tables+b"\0"+source).hexdigest()
+
+def readSource(path):
+    try:
+        with open(path,'rb') as program:
+            return program.read()
+    except IOError:
+        raise AssemblerError("File in path "+str(path)+" not found")
+
+def assembleObject(assembler,path,source = None):
+    if source is None:
+        source = readSource(path)
+    with open(path,'r') as program:                   #read from the file so .include is relative to it
+        relocations = assembler.translate(program,relocatable = True)
+    exports = dict([(TAG,int(address)) for (TAG,address) in assembler.MemDictionary.items() if TAG != "root"])
+    includes = dict([(name,assembler.Preprocessor.digest(name)) for name in assembler.Program.Includes])
+    return ObjectFile(os.path.basename(path),assembler.image(),exports,relocations,
+                      objectSignature(assembler,source),assembler.WarningCount,includes)
+
+def isCurrent(assembler,objectfile,source):
+    if objectfile.Signature != objectSignature(assembler,source):
+        return False
+    for (name,digest) in objectfile.Includes.items():
+        if assembler.Preprocessor is None or assembler.Preprocessor.digest(name) != digest:
+            return False
+    return True
+
+def objectPath(path,objdir = None):
+    stem = os.path.splitext(path)[0]
+    if objdir is not None:
+        stem = os.path.join(objdir,os.path.basename(stem))
+    return stem+OBJECTEXTENSION
+
+#------------------------------------------------------------------------------------------------------------#
+#   Workers of buildObjects(): every worker has its own Assembler, an object is written only when the
+#   program changed. Returns (path, objpath, translated or reused, warning messages, error)
+#------------------------------------------------------------------------------------------------------------#
+linkAssembler = None                        #Assembler of the worker process
+
+def linkInit(mnemonicsPath,regNamesPath):
+    global linkAssembler
+    linkAssembler = Assembler(mnemonicsPath,regNamesPath,verbose = False)
+
+def linkWorker(job):
+    (path,objpath) = job
+    try:
+        source = readSource(path)
+        try:
+            if isCurrent(linkAssembler,ObjectFile.load(objpath),source):
+                return (path,objpath,False,[],None)
+        except AssemblerError:
+            pass                            #no object yet or an old one
+        objectfile = assembleObject(linkAssembler,path,source)
+        objectfile.save(objpath)
+    except (AssemblerError,IOError) as error:
+        return (path,objpath,True,[],str(error))
+    return (path,objpath,True,linkAssembler.Diagnostics.messages(),None)
+
+def buildObjects(paths,objdir = None,jobs = None,mnemonicsPath = MNEMINOCSPATH,regNamesPath = REGNAMES):
+    if objdir is not None:
+        os.makedirs(objdir,exist_ok = True)
+    jobsList = uniqueOutputs([(path,objectPath(path,objdir)) for path in paths])   #one object per program
+    if jobs == 1 or len(jobsList) == 1:     #no process pool for a single program
+        linkInit(mnemonicsPath,regNamesPath)
+        return [linkWorker(job) for job in jobsList]
+    with ProcessPoolExecutor(max_workers = jobs,initializer = linkInit,initargs = (mnemonicsPath,regNamesPath)) as pool:
+        return list(pool.map(linkWorker,jobsList))
+
+
+
+#============================================================================================================#
+#                                                Linker
+#   Puts the objects one after the other from origin, builds the table of every exported TAG and patches
+#   the relocations. Returns (image as array('I'), {TAG: address}, [(object, start, length)]). The TAG
+#   table has only the TAGs defined once, a TAG of more than one object is found through its own object
+#============================================================================================================#
+def link(objects,origin = 0):
+    layout = []
+    symbols = {}
+    defined = {}                            #TAG -> names of the objects defining it
+    start = origin
+    for objectfile in objects:
+        layout.append((objectfile.Name,start,len(objectfile)))
+        for TAG in objectfile.Exports:
+            defined.setdefault(TAG,[]).append(objectfile.Name)
+            symbols[TAG] = start+objectfile.Exports[TAG]
+        start += len(objectfile)
+    for TAG in defined:
+        if len(defined[TAG]) > 1:
+            del symbols[TAG]
+
+    errors = []
+    image = array(WORDTYPE)
+    targetMask = (1<<TARGETBITWIDTH)-1
+    offsetMask = (1<<OFFSETBITWIDTH)-1
+    for (objectfile,(name,base,length)) in zip(objects,layout):
+        words = array(WORDTYPE,objectfile.Words)
+        for (index,TAG,kind) in objectfile.Relocations:
+            address = base+index
+            where = name+" @"+format(address,"08x")
+            if TAG in objectfile.Exports:
+                target = base+objectfile.Exports[TAG]
+            elif TAG in symbols:
+                target = symbols[TAG]
+            elif TAG in defined:
+                errors.append(where+": TAG "+TAG+" is defined in "+", ".join(defined[TAG]))
+                continue
+            else:
+                errors.append(where+": TAG "+TAG+" is not found in any object")
+                continue
+            if kind == 'j':                 #same limits as NegToPosINT for the target
+                if target >= 1<<(TARGETBITWIDTH-1):
+                    errors.append(where+": target of "+TAG+" exceeds allowed offset bit "+str(TARGETBITWIDTH))
+                    continue
+                words[index] = (words[index] & ~targetMask & 0xffffffff) | target
+            else:
+                offset = target-address-1
+                if not -(1<<(OFFSETBITWIDTH-1)) <= offset < 1<<(OFFSETBITWIDTH-1):
+                    errors.append(where+": offset "+str(offset)+" to "+TAG+" exceeds allowed offset bit "+str(OFFSETBITWIDTH))
+                    continue
+                words[index] = (words[index] & ~offsetMask & 0xffffffff) | (offset & offsetMask)
+        image.extend(words)
+    if errors:
+        raise AssemblerError("Linking failed:\n  "+"\n  ".join(errors))
+    return (image,symbols,layout)
+
+def writeMap(path,symbols,layout):
+    lines = ["# object".ljust(32)+"start      length"]
+    for (name,start,length) in layout:
+        lines.append(name.ljust(32)+"%08x" % start+"   "+str(length))
+    lines.append("")
+    lines.append("# TAG".ljust(32)+"address")
+    for TAG in sorted(symbols,key=lambda TAG: (symbols[TAG],TAG)):
+        lines.append(TAG.ljust(32)+"%08x" % symbols[TAG])
+    with open(path,'w') as mapfile:
+        mapfile.write("\n".join(lines)+"\n")
+
+def writeImage(image,path,format,symbols,layout,mapPath = None):
+    writeBulk(path,OUTPUTFORMATS[format][0](image))
+    if mapPath is not None:
+        writeMap(mapPath,symbols,layout)
+
+
+
+#============================================================================================================#
+#   Command line use:  python MIPSLinker.py build SOURCE [SOURCE ...] -o OUTPUT [-f FORMAT] [--objdir DIR] [-j N]
+#                      python MIPSLinker.py compile SOURCE [SOURCE ...] [--objdir DIR]
+#                      python MIPSLinker.py link OBJECT [OBJECT ...] -o OUTPUT [-f FORMAT] [--map MAP]
+#============================================================================================================#
+def compileReport(results):
+    failed = 0
+    for (path,objpath,translated,messages,error) in results:
+        if error is not None:
+            failed += 1
+            print("ERROR  "+path+" : "+error)
+            continue
+        print(("TRANSL " if translated else "REUSED ")+path+" -> "+objpath)
+        for message in messages:
+            print("       "+message)
+    return failed
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Translates MIPS programs into relocatable objects and links them")
+    commands = parser.add_subparsers(dest="command",required=True)
+    build = commands.add_parser("build",help="translate the changed programs and link all of them")
+    compiler = commands.add_parser("compile",help="translate programs into objects")
+    linker = commands.add_parser("link",help="link objects into an image")
+    for command in (build,compiler):
+        command.add_argument("sources",nargs="+",metavar="SOURCE",help="assembly programs")
+        command.add_argument("--objdir",help="directory of the objects, default is next to each program")
+        command.add_argument("-j","--jobs",type=int,help="number of worker processes, default is every core")
+        command.add_argument("--mnemonics",default=MNEMINOCSPATH,help="mnemonics reference file")
+        command.add_argument("--regnames",default=REGNAMES,help="register names reference file")
+    linker.add_argument("objects",nargs="+",metavar="OBJECT",help="objects in the order they are put in memory")
+    for command in (build,linker):
+        command.add_argument("-o","--output",required=True,help="path of the image")
+        command.add_argument("-f","--format",default="bin",choices=list(OUTPUTFORMATS),help="format of the image")
+        command.add_argument("--origin",type=int,default=0,help="address of the first object")
+        command.add_argument("--map",help="write the address of every object and TAG to MAP")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        if args.command in ("build","compile"):
+            results = buildObjects(args.sources,args.objdir,args.jobs,args.mnemonics,args.regnames)
+            if compileReport(results):
+                raise AssemblerError("some programs could not be translated")
+            paths = [objpath for (path,objpath,translated,messages,error) in results]
+            if args.command == "compile":
+                return 0
+        else:
+            paths = args.objects
+        objects = [ObjectFile.load(path) for path in paths]
+        (image,symbols,layout) = link(objects,args.origin)
+        writeImage(image,args.output,args.format,symbols,layout,args.map)
+    except AssemblerError as error:
+        print("ERROR: "+str(error)+"\nTerminating the program.....")
+        return 1
+    warnings = sum([objectfile.Warnings for objectfile in objects])
+    print("Linked "+str(len(objects))+" objects, "+str(len(image))+" asm, "+str(warnings)+" warnings in "
+          +"%.3f" % (time.perf_counter()-start)+" s -> "+args.output+" as "+OUTPUTFORMATS[args.format][1])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
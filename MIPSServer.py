@@ -0,0 +1,350 @@
+#===========================================================================================================#
+# Name  : MIPSServer.py
+#
+# Keeps MIPSAssembler.py running so that an editor or CI calling it many times does not pay for the Python
+# start and the reading of the reference files on every call. Requests and replies are JSON, one per line,
+# over a local Unix socket or stdin/stdout.
+#
+#   python MIPSServer.py serve                          # Unix socket @SOCKETPATH
+#   python MIPSServer.py serve --stdio                  # JSON lines on stdin, replies on stdout
+#   python MIPSServer.py send test/input.txt            # prints the listing and the warnings
+#
+# Request : {"id": 1, "source": "addi $s1, $zero, 8\n..."}  or  {"id": 1, "path": "program.s"}
+#           optional "single_pass": true, "max_errors": N, "listing": false
+#           {"command": "ping"} and {"command": "shutdown"} control the server
+# Reply   : {"id": 1, "ok": true, "words": [...], "listing": [...], "warnings": [{line, column, category,
+#           text, source}, ...], "warning_count": N, "elapsed": seconds}  or  {"id": 1, "ok": false, "error": ...}
+#
+# Small programs are translated right in the event loop with the loaded tables, programs of more than
+# @INLINELINES lines go to a pool of worker processes so that they do not hold up the other requests.
+#============================================================================================================#
+
+import os
+import sys
+import json
+import stat
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from MIPSAssembler import Assembler, AssemblerError, MNEMINOCSPATH, REGNAMES, lineName
+
+#============================================================================================================#
+#                                           Constants Used
+#============================================================================================================#
+SOCKETPATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),   #per user
+                          "MIPSAssembler-"+str(os.getuid() if hasattr(os,"getuid") else os.getpid())+".sock")
+INLINELINES = 2000           #programs up to so many lines are translated in the event loop
+LINELIMIT = 1<<30            #longest request line, a request carries the whole program
+BYTESPERLINE = 40            #used to guess the lines of a program sent by path
+
+
+
+#============================================================================================================#
+#   Translates one request with the given assembler and returns the reply. Used in the event loop as well
+#   as in the worker processes
+#============================================================================================================#
+def assembleRequest(assembler,request):
+    start = time.perf_counter()
+    assembler.MaxErrors = request.get("max_errors")
+    singlePass = bool(request.get("single_pass"))
+    try:
+        if "source" in request:
+            words = assembler.assemble(request["source"],singlePass)
+        elif "path" in request:
+            words = assembler.assemble_file(request["path"],singlePass)
+        else:
+            raise AssemblerError("request has neither a source nor a path")
+    except AssemblerError as error:
+        reply = {"ok":False, "error":str(error)}
+    else:
+        reply = {"ok":True, "words":words, "warning_count":assembler.WarningCount}
+        if request.get("listing",True):
+            reply["listing"] = assembler.listing()
+    reply["warnings"] = [diagnostic.asDict() for diagnostic in assembler.Diagnostics]
+    reply["elapsed"] = time.perf_counter()-start
+    return reply
+
+serverAssembler = None                      #Assembler of the worker process
+
+def serverInit(mnemonicsPath,regNamesPath):
+    global serverAssembler
+    serverAssembler = Assembler(mnemonicsPath,regNamesPath,verbose = False)
+
+def serverWorker(request):
+    return assembleRequest(serverAssembler,request)
+
+
+
+#============================================================================================================#
+#                                               Server
+#   One Assembler with the tables loaded serves the small requests, the worker pool is started with the
+#   first large one. Every request line is handled as its own task so replies can come back in another
+#   order than the requests, the "id" of the request is copied into its reply
+#============================================================================================================#
+class AssemblerServer:
+
+    def __init__(self,mnemonicsPath = MNEMINOCSPATH,regNamesPath = REGNAMES,jobs = None,inlineLines = INLINELINES):
+        self.Assembler = Assembler(mnemonicsPath,regNamesPath,verbose = False)
+        self.MnemonicsPath = mnemonicsPath
+        self.RegNamesPath = regNamesPath
+        self.Jobs = jobs
+        self.InlineLines = inlineLines
+        self.Pool = None
+        self.Requests = 0
+        self.Stopped = None                 #asyncio.Event set by the shutdown command
+
+    def isLarge(self,request):
+        if "source" in request:
+            return request["source"].count("\n") > self.InlineLines
+        try:
+            return os.path.getsize(request.get("path","")) > self.InlineLines*BYTESPERLINE
+        except OSError:
+            return False
+
+    async def handle(self,request):
+        command = request.get("command")
+        if command == "ping":
+            reply = {"ok":True, "requests":self.Requests, "mnemonics":len(self.Assembler.PNUMANICSdictionary)}
+        elif command == "shutdown":
+            self.Stopped.set()
+            reply = {"ok":True}
+        elif command is not None:
+            reply = {"ok":False, "error":"command "+str(command)+" is not known"}
+        else:
+            self.Requests += 1
+            if self.isLarge(request):
+                if self.Pool is None:
+                    self.Pool = ProcessPoolExecutor(max_workers = self.Jobs,initializer = serverInit,
+                                                    initargs = (self.MnemonicsPath,self.RegNamesPath))
+                reply = await asyncio.get_running_loop().run_in_executor(self.Pool,serverWorker,request)
+            else:
+                reply = assembleRequest(self.Assembler,request)
+        reply["id"] = request.get("id")
+        return reply
+
+    async def answer(self,line,writer):
+        try:
+            request = json.loads(line)
+            if not isinstance(request,dict):
+                raise ValueError("request is not a JSON object")
+        except ValueError as error:
+            reply = {"id":None, "ok":False, "error":"bad request: "+str(error)}
+        else:
+            try:
+                reply = await self.handle(request)
+            except Exception as error:                      #a broken worker should not stop the server
+                reply = {"id":request.get("id"), "ok":False, "error":type(error).__name__+": "+str(error)}
+        writer.write((json.dumps(reply)+"\n").encode())
+        await writer.drain()
+
+    async def connection(self,reader,writer):
+        tasks = set()
+        try:
+            while not self.Stopped.is_set():
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(self.answer(line,writer))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except (ConnectionError,asyncio.IncompleteReadError,asyncio.CancelledError):  #client left or shutdown
+            pass
+        finally:
+            writer.close()
+
+    async def serveSocket(self,path = SOCKETPATH):
+        self.Stopped = asyncio.Event()
+        removeStaleSocket(path)
+        server = await asyncio.start_unix_server(self.connection,path,limit = LINELIMIT)
+        inode = os.lstat(path).st_ino
+        try:
+            async with server:
+                await self.Stopped.wait()
+        finally:
+            try:
+                if os.lstat(path).st_ino == inode:        #not replaced by another server meanwhile
+                    os.remove(path)
+            except OSError:
+                pass
+            self.close()
+
+    async def serveStdio(self):
+        self.Stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if isPipe(sys.stdin) and isPipe(sys.stdout):
+            reader = asyncio.StreamReader(limit = LINELIMIT)
+            await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),sys.stdin)
+            (transport,protocol) = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin,sys.stdout)
+            writer = asyncio.StreamWriter(transport,protocol,reader,loop)
+        else:                                             #e.g < requests.jsonl > replies.jsonl
+            reader = writer = FileStream(sys.stdin.buffer,sys.stdout.buffer)
+        try:
+            reading = asyncio.ensure_future(self.connection(reader,writer))
+            stopping = asyncio.ensure_future(self.Stopped.wait())
+            await asyncio.wait([reading,stopping],return_when = asyncio.FIRST_COMPLETED)
+            stopping.cancel()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.Pool is not None:
+            self.Pool.shutdown()
+            self.Pool = None
+
+
+
+#------------------------------------------------------------------------------------------------------------#
+#   Pipe transports of asyncio only take pipes, sockets and terminals. Regular files given as stdin/stdout
+#   are read in a thread and written blocking through FileStream which has the calls connection() uses
+#------------------------------------------------------------------------------------------------------------#
+def isPipe(stream):
+    mode = os.fstat(stream.fileno()).st_mode
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode)
+
+class FileStream:
+
+    def __init__(self,infile,outfile):
+        self.In = infile
+        self.Out = outfile
+
+    async def readline(self):
+        return await asyncio.get_running_loop().run_in_executor(None,self.In.readline)
+
+    def write(self,data):
+        self.Out.write(data)
+
+    async def drain(self):
+        self.Out.flush()
+
+    def close(self):
+        self.Out.flush()
+
+#------------------------------------------------------------------------------------------------------------#
+#   Removes the socket left by a server which is not running any more, anything else at path is an error
+#------------------------------------------------------------------------------------------------------------#
+def removeStaleSocket(path):
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise AssemblerError(str(path)+" exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:                                       #nobody is listening
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+    raise AssemblerError("a server is already listening on "+str(path))
+
+
+
+#============================================================================================================#
+#   Client: sends one request to the server on the Unix socket and returns the reply
+#============================================================================================================#
+def sendRequest(request,path = SOCKETPATH,timeout = None):
+    try:
+        connection = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+        connection.settimeout(timeout)
+        connection.connect(path)
+    except OSError as error:
+        raise AssemblerError("cannot connect to the server at "+str(path)+": "+str(error))
+    with connection:
+        connection.sendall((json.dumps(request)+"\n").encode())
+        data = []
+        while True:
+            chunk = connection.recv(1<<16)
+            if not chunk:
+                break
+            data.append(chunk)
+            if chunk.endswith(b"\n"):
+                break
+    if not data:
+        raise AssemblerError("server at "+str(path)+" closed the connection without a reply")
+    return json.loads(b"".join(data))
+
+def send(args):
+    if not os.path.isfile(args.file):                     #the server reads it, .include is relative to it
+        print("ERROR: File in path "+str(args.file)+" not found\nTerminating the program.....")
+        return 1
+    request = {"id":1, "path":os.path.abspath(args.file), "single_pass":args.single_pass}
+    if args.max_errors is not None:
+        request["max_errors"] = args.max_errors
+    try:
+        reply = sendRequest(request,args.socket)
+    except AssemblerError as error:
+        print("ERROR: "+str(error)+"\nTerminating the program.....")
+        return 1
+    if args.json:
+        print(json.dumps(reply,indent=2))
+        return 0 if reply["ok"] else 1
+    for warning in reply["warnings"]:
+        print("WARNING in line "+lineName(warning["line"],warning.get("file"))+": "+warning["text"])
+    if not reply["ok"]:
+        print("ERROR: "+reply["error"]+"\nTerminating the program.....")
+        return 1
+    if args.output is None:
+        print("\n".join(reply["listing"]))
+    else:
+        with open(args.output,'w') as outhandler:
+            outhandler.write("\n".join(reply["listing"])+"\n")
+    print(str(len(reply["words"]))+" asm, "+str(reply["warning_count"])+" warnings in "+"%.1f" % (reply["elapsed"]*1000)+" ms")
+    return 0
+
+
+
+#============================================================================================================#
+#   Command line use:  python MIPSServer.py serve [--socket PATH | --stdio] [-j JOBS]
+#                      python MIPSServer.py send FILE [--socket PATH] [-o OUTPUT] [--json]
+#============================================================================================================#
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Long running MIPS assembler serving JSON requests")
+    commands = parser.add_subparsers(dest="command",required=True)
+    serve = commands.add_parser("serve",help="run the server")
+    serve.add_argument("--socket",default=SOCKETPATH,help="Unix socket to listen on")
+    serve.add_argument("--stdio",action="store_true",help="read requests from stdin and write replies to stdout")
+    serve.add_argument("-j","--jobs",type=int,help="worker processes for large programs, default is every core")
+    serve.add_argument("--inline-lines",type=int,default=INLINELINES,help="larger programs go to the worker processes")
+    serve.add_argument("--mnemonics",default=MNEMINOCSPATH,help="mnemonics reference file")
+    serve.add_argument("--regnames",default=REGNAMES,help="register names reference file")
+    client = commands.add_parser("send",help="translate a program with a running server")
+    client.add_argument("file",help="path of the assembly program")
+    client.add_argument("--socket",default=SOCKETPATH,help="Unix socket of the server")
+    client.add_argument("-o","--output",help="write the listing to OUTPUT instead of the console")
+    client.add_argument("--single-pass",action="store_true",help="convert every asm as soon as it is read")
+    client.add_argument("--max-errors",type=int,metavar="N",help="stop translating after N warnings")
+    client.add_argument("--json",action="store_true",help="print the whole reply as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "send":
+        return send(args)
+    try:
+        server = AssemblerServer(args.mnemonics,args.regnames,args.jobs,args.inline_lines)
+    except AssemblerError as error:
+        print("ERROR: "+str(error)+"\nTerminating the program.....",file=sys.stderr)
+        return 1
+    try:
+        if args.stdio:
+            asyncio.run(server.serveStdio())
+        else:
+            print("Listening on "+args.socket+" (Ctrl+C to stop)",file=sys.stderr)
+            asyncio.run(server.serveSocket(args.socket))
+    except KeyboardInterrupt:
+        pass
+    except AssemblerError as error:
+        print("ERROR: "+str(error)+"\nTerminating the program.....",file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
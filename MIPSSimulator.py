@@ -0,0 +1,323 @@
+#===========================================================================================================#
+# Name  : MIPSSimulator.py
+#
+# Runs the machine codes written by MIPSAssembler.py. The program is decoded once with the tables of
+# MIPSDisassembler.py (handler = mnemonic class, operands = the decoded columns) and every straight run of
+# asm up to a branch/jump is compiled into one Python function the first time it is reached, with the
+# registers kept in local variables. Execution then only calls one function per block.
+#
+# HIGHLIGHTS:
+#          1) Register file of 'REGFILESIZE' registers, sparse word addressed data memory (dict)
+#          2) Memory mapped output: Simulator.mapOutput(address, function) is called on every store to it,
+#             e.g the Fibonacci test program displays its values through memory[1]
+#          3) Instruction and cycle counters, cycles follow the classic multi-cycle model (CYCLES)
+#          4) python MIPSSimulator.py -i test/input.txt --max-steps 100
+#
+# NOTE: Code and data are addressed in words as in the assembler (branch offset/jump target are words and
+#       sw $s1, 1($zero) writes memory[1]). There are no delay slots, add/addi/sub wrap instead of trapping
+#       and lb/lh/sb/sh use the low byte/halfword of the addressed word. A jump to itself halts the program
+#============================================================================================================#
+
+import re
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from MIPSAssembler import AssemblerError, MNEMINOCSPATH, REGNAMES, REGFILESIZE
+from MIPSDisassembler import (Disassembler, loadImage, INPUTFORMATS, NOP, STYLE_RRR, STYLE_SHIFT, STYLE_SHIFTV,
+                              STYLE_IMMEDIATE, STYLE_MEMORY, STYLE_BRANCH2, STYLE_BRANCH1)
+
+#============================================================================================================#
+#                                           Constants Used
+#============================================================================================================#
+MASK = 0xffffffff            #registers and memory words are 32 bits
+SIGN = 0x80000000
+MAXBLOCK = 256               #longest straight run compiled into one function
+OUTPUTADDRESS = 1            #memory[1] displays the values in the test programs
+MAXSTEPS = 10000             #default number of asm run from the command line
+
+CYCLES = {"alu":4, "load":5, "store":4, "branch":3, "jump":3}  #cycles per asm of every kind
+
+#------------------------------------------------------------------------------------------------------------#
+#   Semantics of every mnemonic: (kind, statement). {rd} {rs} {rt} are registers, {imm} is the signed
+#   immediate, {uimm} the zero extended one, {sa} the shift, {target} the branch/jump address and {next}
+#   the address after the asm. Branches and jumps are an expression giving the next address and stores the
+#   value written to memory[{address}]
+#------------------------------------------------------------------------------------------------------------#
+SEMANTICS = {
+    "add":    ("alu",    "{rd} = ({rs} + {rt}) & MASK"),
+    "addu":   ("alu",    "{rd} = ({rs} + {rt}) & MASK"),
+    "sub":    ("alu",    "{rd} = ({rs} - {rt}) & MASK"),
+    "subu":   ("alu",    "{rd} = ({rs} - {rt}) & MASK"),
+    "and":    ("alu",    "{rd} = {rs} & {rt}"),
+    "or":     ("alu",    "{rd} = {rs} | {rt}"),
+    "xor":    ("alu",    "{rd} = {rs} ^ {rt}"),
+    "nor":    ("alu",    "{rd} = ~({rs} | {rt}) & MASK"),
+    "slt":    ("alu",    "{rd} = int(({rs} ^ SIGN) < ({rt} ^ SIGN))"),
+    "sltu":   ("alu",    "{rd} = int({rs} < {rt})"),
+    "sll":    ("alu",    "{rd} = ({rt} << {sa}) & MASK"),
+    "srl":    ("alu",    "{rd} = {rt} >> {sa}"),
+    "sra":    ("alu",    "{rd} = ((({rt} ^ SIGN) - SIGN) >> {sa}) & MASK"),
+    "sllv":   ("alu",    "{rd} = ({rt} << ({rs} & 31)) & MASK"),
+    "srlv":   ("alu",    "{rd} = {rt} >> ({rs} & 31)"),
+    "srav":   ("alu",    "{rd} = ((({rt} ^ SIGN) - SIGN) >> ({rs} & 31)) & MASK"),
+    "addi":   ("alu",    "{rt} = ({rs} + {imm}) & MASK"),
+    "addiu":  ("alu",    "{rt} = ({rs} + {imm}) & MASK"),
+    "andi":   ("alu",    "{rt} = {rs} & {uimm}"),
+    "ori":    ("alu",    "{rt} = {rs} | {uimm}"),
+    "xori":   ("alu",    "{rt} = {rs} ^ {uimm}"),
+    "slti":   ("alu",    "{rt} = int(({rs} ^ SIGN) < {simm})"),
+    "sltiu":  ("alu",    "{rt} = int({rs} < {wimm})"),
+    "lw":     ("load",   "{rt} = M.get({address}, 0)"),
+    "lb":     ("load",   "{rt} = (((M.get({address}, 0) & 0xff) ^ 0x80) - 0x80) & MASK"),
+    "lbu":    ("load",   "{rt} = M.get({address}, 0) & 0xff"),
+    "lh":     ("load",   "{rt} = (((M.get({address}, 0) & 0xffff) ^ 0x8000) - 0x8000) & MASK"),
+    "lhu":    ("load",   "{rt} = M.get({address}, 0) & 0xffff"),
+    "sw":     ("store",  "{rt}"),
+    "sb":     ("store",  "(M.get({address}, 0) & 0xffffff00) | ({rt} & 0xff)"),
+    "sh":     ("store",  "(M.get({address}, 0) & 0xffff0000) | ({rt} & 0xffff)"),
+    "beq":    ("branch", "{target} if {rs} == {rt} else {next}"),
+    "bne":    ("branch", "{target} if {rs} != {rt} else {next}"),
+    "bgez":   ("branch", "{target} if {rs} < SIGN else {next}"),
+    "bgtz":   ("branch", "{target} if 0 < {rs} < SIGN else {next}"),
+    "blez":   ("branch", "{target} if ({rs} == 0 or {rs} >= SIGN) else {next}"),
+    "bltz":   ("branch", "{target} if {rs} >= SIGN else {next}"),
+    "bgezal": ("branch", "r31 = {next}\n{target} if {rs} < SIGN else {next}"),
+    "bltzal": ("branch", "r31 = {next}\n{target} if {rs} >= SIGN else {next}"),
+    "j":      ("jump",   "{target}"),
+    "jal":    ("jump",   "r31 = {next}\n{target}"),
+    "jr":     ("jump",   "{rs}"),
+}
+
+REGISTERNAME = re.compile(r'\br[0-9]+\b')
+ASSIGNED = re.compile(r'(r[0-9]+) =')
+
+
+
+#============================================================================================================#
+#                                              Simulator
+#   words is the image (any sequence of 32 bit words), the first asm is at address 0 as 'root' of the
+#   assembler. run() executes until the program halts, leaves the image or maxSteps asm are run
+#============================================================================================================#
+class Simulator:
+
+    def __init__(self,words,disassembler = None):
+        if disassembler is None:
+            disassembler = Disassembler()
+        self.Disassembler = disassembler
+        self.Registers = [0]*REGFILESIZE
+        self.Memory = {}                    #address -> word, only the written ones
+        self.Hooks = {}                     #address -> function(address, value) called after a store
+        self.PC = 0
+        self.Instructions = 0
+        self.Cycles = 0
+        self.Halted = None                  #reason the last run() stopped
+        self.predecode(np.ascontiguousarray(words,dtype=np.uint32))
+        self.Blocks = [None]*self.Length    #address -> (function, asm count, cycles) once compiled
+
+    #=========================================================================================================#
+    #   Decodes the whole image once into the handler (mnemonic) and operand tables used by compileBlock
+    #=========================================================================================================#
+    def predecode(self,words):
+        decoded = self.Disassembler.decode(words)
+        mnemonics = self.Disassembler.Mnemonics
+        self.Length = len(decoded)
+        self.Words = decoded.Words
+        self.Handlers = [NOP if wordClass == NOP else (mnemonics[wordClass] if wordClass >= 0 else None)
+                         for wordClass in decoded.Class.tolist()]
+        self.Styles = [self.Disassembler.Styles[wordClass] if wordClass >= 0 else -1 for wordClass in decoded.Class.tolist()]
+        self.Operands = list(zip(decoded.Rs.tolist(),decoded.Rt.tolist(),decoded.Rd.tolist(),decoded.Shamt.tolist(),
+                                 decoded.Immediate.tolist(),decoded.Target.tolist()))
+
+    def mapOutput(self,address,function):
+        self.Hooks[address] = function
+        self.Blocks = [None]*self.Length    #stores to constant addresses are compiled with/without the call
+
+    def reset(self):
+        self.Registers = [0]*REGFILESIZE
+        self.Memory = {}
+        self.PC = 0
+        self.Instructions = 0
+        self.Cycles = 0
+        self.Halted = None
+
+    #=========================================================================================================#
+    #   Python source of the asm at address pc, (statement, kind) with the registers as locals r0..r31
+    #=========================================================================================================#
+    def statement(self,pc):
+        Mnemonics = self.Handlers[pc]
+        if Mnemonics is NOP:
+            return ("","alu")
+        if Mnemonics is None:
+            raise AssemblerError("Unknown machine code "+"0x%08x" % int(self.Words[pc])+" at address "+str(pc))
+        try:
+            (kind,template) = SEMANTICS[Mnemonics]
+        except KeyError:
+            raise AssemblerError("{"+Mnemonics+"} at address "+str(pc)+" has no semantics in the simulator, you can add it in SEMANTICS")
+        (rs,rt,rd,sa,imm,target) = self.Operands[pc]
+        style = self.Styles[pc]
+        if style in (STYLE_BRANCH2,STYLE_BRANCH1):
+            target = pc+1+imm
+        def read(number):
+            return "0" if number == 0 else "r"+str(number)
+        def write(number):
+            return "_" if number == 0 else "r"+str(number)     #writes to $zero are dropped
+        fields = {"rs":read(rs), "rt":read(rt), "rd":read(rd), "sa":sa, "imm":imm, "uimm":imm & 0xffff,
+                  "simm":(imm & MASK) ^ SIGN, "wimm":imm & MASK, "target":target, "next":pc+1}
+        if style in (STYLE_RRR,STYLE_SHIFT,STYLE_SHIFTV):
+            fields["rd"] = write(rd)
+        elif style == STYLE_IMMEDIATE or kind == "load":
+            fields["rt"] = write(rt)
+        if style == STYLE_MEMORY:
+            constant = rs == 0                            #e.g sw $s1, 1($zero) is known while compiling
+            fields["address"] = str(imm & MASK) if constant else "a"
+        code = template.format(**fields)
+        if style == STYLE_MEMORY:
+            address = fields["address"]
+            setup = "" if constant else "a = ("+read(rs)+" + "+str(imm)+") & MASK\n"
+            if kind == "load":
+                code = setup+code
+            elif constant and (imm & MASK) not in self.Hooks:
+                code = setup+"M["+address+"] = "+code
+            else:
+                call = "H["+address+"]("+address+", M["+address+"])"
+                code = setup+"M["+address+"] = "+code+"\n"+(call if constant else "if a in H: "+call)
+        return (code,kind)
+
+    #=========================================================================================================#
+    #   Compiles the straight run of asm starting at pc up to the first branch/jump (or MAXBLOCK asm) into
+    #       def block(R, M, H): load registers; asm...; store registers; return next address
+    #=========================================================================================================#
+    def compileBlock(self,pc):
+        body = []
+        cycles = 0
+        address = pc
+        nextAddress = None
+        while address < self.Length and address-pc < MAXBLOCK:
+            (code,kind) = self.statement(address)
+            cycles += CYCLES[kind]
+            address += 1
+            if kind in ("branch","jump"):
+                lines = code.split("\n")
+                body.extend(lines[:-1])
+                nextAddress = lines[-1]
+                break
+            if code:
+                body.extend(code.split("\n"))
+        if nextAddress is None:
+            nextAddress = str(address)
+        loaded = set()                                    #registers read before the block writes them
+        written = set()
+        for line in body+[nextAddress]:
+            assigned = ASSIGNED.match(line)
+            expression = line[assigned.end():] if assigned else line
+            loaded.update([name for name in REGISTERNAME.findall(expression) if name not in written])
+            if assigned:
+                written.add(assigned.group(1))
+        lines = ["def block(R, M, H):"]
+        lines += ["    "+name+" = R["+name[1:]+"]" for name in sorted(loaded)]
+        lines += ["    "+line for line in body]
+        lines += ["    nextAddress = "+nextAddress]
+        lines += ["    R["+name[1:]+"] = "+name for name in sorted(written)]
+        lines += ["    return nextAddress"]
+        source = "\n".join(lines).replace("MASK",str(MASK)).replace("SIGN",str(SIGN))   #literals are folded by compile
+        namespace = {}
+        exec(compile(source+"\n","<block "+str(pc)+">","exec"),namespace)
+        entry = (namespace["block"],address-pc,cycles)
+        self.Blocks[pc] = entry
+        return entry
+
+    #=========================================================================================================#
+    #   Runs from self.PC. maxSteps is checked after every block so a run can pass it by one block
+    #=========================================================================================================#
+    def run(self,maxSteps = None):
+        R = self.Registers
+        M = self.Memory
+        H = self.Hooks
+        blocks = self.Blocks
+        length = self.Length
+        pc = self.PC
+        instructions = self.Instructions
+        cycles = self.Cycles
+        limit = float('inf') if maxSteps is None else instructions+maxSteps
+        self.Halted = None
+        try:
+            while instructions < limit:
+                if not 0 <= pc < length:
+                    self.Halted = "left the program at address "+str(pc)
+                    break
+                entry = blocks[pc]
+                if entry is None:
+                    entry = self.compileBlock(pc)
+                (block,count,cost) = entry
+                nextAddress = block(R,M,H)
+                instructions += count
+                cycles += cost
+                if nextAddress == pc and count == 1:        #j to itself
+                    self.Halted = "halted at address "+str(pc)
+                    break
+                pc = nextAddress
+            else:
+                self.Halted = "max steps reached"
+        finally:
+            self.PC = pc
+            self.Instructions = instructions
+            self.Cycles = cycles
+        return self.Halted
+
+
+
+#============================================================================================================#
+#   Command line use:  python MIPSSimulator.py [-i PROGRAM | --image IMAGE [-f FORMAT]] [--max-steps N]
+#============================================================================================================#
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Runs MIPS programs translated by MIPSAssembler.py")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("-i","--input",default="./test/input.txt",help="assembly program, translated before running")
+    source.add_argument("--image",help="machine codes written by MIPSAssembler.py")
+    parser.add_argument("-f","--format",default="bin",choices=INPUTFORMATS,help="format of --image")
+    parser.add_argument("--max-steps",type=int,default=MAXSTEPS,help="stop after about so many asm (0 = no limit)")
+    parser.add_argument("--output-address",type=int,default=OUTPUTADDRESS,help="memory address which displays the stored values")
+    parser.add_argument("--quiet",action="store_true",help="do not print the values stored to the output address")
+    parser.add_argument("--registers",action="store_true",help="print the register file at the end")
+    parser.add_argument("--mnemonics",default=MNEMINOCSPATH,help="mnemonics reference file")
+    parser.add_argument("--regnames",default=REGNAMES,help="register names reference file")
+    args = parser.parse_args(argv)
+
+    try:
+        disassembler = Disassembler(args.mnemonics,args.regnames)
+        if args.image:
+            words = loadImage(args.image,args.format)
+        else:
+            assembler = disassembler.Assembler
+            assembler.assemble_file(args.input)
+            if assembler.WarningCount:
+                for message in assembler.Diagnostics.messages():
+                    print(message)
+                raise AssemblerError(str(args.input)+" has "+str(assembler.WarningCount)+" warnings, it cannot be run")
+            words = np.frombuffer(assembler.image(),dtype=np.uint32)
+        simulator = Simulator(words,disassembler)
+        if not args.quiet:
+            simulator.mapOutput(args.output_address,
+                                lambda address,value: print("memory["+str(address)+"] = "+str(value-(value & SIGN)*2)))
+        start = time.perf_counter()
+        reason = simulator.run(args.max_steps or None)
+        elapsed = time.perf_counter()-start
+    except AssemblerError as error:
+        print("ERROR: "+str(error)+"\nTerminating the program.....")
+        return 1
+
+    if args.registers:
+        names = simulator.Disassembler.RegNames
+        for number in range(REGFILESIZE):
+            print(names.get(number,'$'+str(number)).ljust(6)+" = "+"0x%08x" % simulator.Registers[number])
+    rate = simulator.Instructions/elapsed if elapsed > 0 else 0.0
+    print("Stopped ("+reason+") after "+str(simulator.Instructions)+" asm, "+str(simulator.Cycles)+" cycles in "
+          +"%.3f" % elapsed+" s ("+"%.0f" % rate+" asm/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
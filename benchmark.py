@@ -0,0 +1,219 @@
+#===========================================================================================================#
+# Name  : benchmark.py
+#
+# Benchmarks MIPSAssembler.py on synthetic programs. The generator writes programs of any length using every
+# mnemonic of 'mnemonics.dict' with TAGs, forward/backward branches, jumps, offset(rs) memory operations and
+# a share of deliberately invalid lines. The first pass, second pass and output writing are timed separately
+# and the results (asm/s, peak memory) are saved as JSON so that two commits can be compared.
+#
+#   python benchmark.py                                  # 10k and 100k lines -> bench_results.json
+#   python benchmark.py --sizes 10000 1000000 10000000 -o after.json --compare before.json
+#   python benchmark.py --generate big.s --lines 1000000 # only writes the program
+#============================================================================================================#
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+from MIPSAssembler import Assembler, OUTPUTFORMATS
+
+#============================================================================================================#
+#                                           Constants Used
+#============================================================================================================#
+SIZES = [10000, 100000]      #default program lengths
+TAGEVERY = 20                #a TAG every 20 lines
+INVALIDRATIO = 0.01          #share of invalid lines
+COMMENTRATIO = 0.05          #share of comment/empty lines
+BRANCHREACH = 5              #branches go up to 5 TAGs back/forward
+
+REGISTERS = ['$t0','$t1','$t2','$t3','$t4','$t5','$t6','$t7','$s0','$s1','$s2','$s3','$s4','$s5','$s6','$s7',
+             't8','S1','$v0','$a0','$8','$17','$R9']
+SOURCES = REGISTERS + ['$zero','$0','$sp','$ra']
+
+
+
+#============================================================================================================#
+#                                      Synthetic Program Generator
+#   Writes 'lines' lines to path (in chunks, so 10M lines need little memory). TAG Ln is put on line
+#   n*TAGEVERY so every branch knows which TAGs exist before and after it
+#============================================================================================================#
+def generateProgram(path,lines,seed = 1,invalidRatio = INVALIDRATIO,assembler = None):
+    if assembler is None:
+        assembler = Assembler(verbose = False)
+    rnd = random.Random(seed)
+    kinds = {}
+    for Mnemonics in assembler.PNUMANICSdictionary:
+        descriptionMnemonics = assembler.PNUMANICSdictionary[Mnemonics]
+        kinds[Mnemonics] = (int(descriptionMnemonics[0]),descriptionMnemonics[1])
+    mnemonics = sorted(kinds)
+    lastTag = (lines-1)//TAGEVERY
+
+    def target(tag):
+        return 'L'+str(max(0,min(lastTag,tag+rnd.randint(-BRANCHREACH,BRANCHREACH))))
+
+    def instruction(Mnemonics,tag):
+        (paramRequired,hasValue) = kinds[Mnemonics]
+        if paramRequired == 3:
+            if hasValue == 's':
+                return Mnemonics+' '+rnd.choice(REGISTERS)+', '+rnd.choice(SOURCES)+', '+str(rnd.randint(0,31))
+            return Mnemonics+' '+rnd.choice(REGISTERS)+', '+rnd.choice(SOURCES)+','+rnd.choice(SOURCES)
+        if paramRequired == 2:
+            if hasValue == 'a':
+                return Mnemonics+' '+rnd.choice(REGISTERS)+', '+rnd.choice(SOURCES)+', '+str(rnd.randint(-32768,32767))
+            if hasValue == 'b':
+                return Mnemonics+' '+rnd.choice(SOURCES)+', '+rnd.choice(SOURCES)+', '+target(tag)
+            return Mnemonics+' '+rnd.choice(REGISTERS)+', '+str(4*rnd.randint(-64,64))+'('+rnd.choice(SOURCES)+')'
+        if paramRequired == 1:
+            if hasValue == 'b':
+                return Mnemonics+' '+rnd.choice(SOURCES)+', '+target(tag)
+            return Mnemonics+' '+rnd.choice(['$ra','$t9','$31'])
+        return Mnemonics+' '+target(tag)
+
+    def invalid(Mnemonics,tag):
+        asm = instruction(Mnemonics,tag)
+        mistake = rnd.randint(0,4)
+        if mistake == 0:
+            return asm[0]+'x'+asm[1:]                       #unknown mnemonic
+        if mistake == 1:
+            return asm.replace(',',' ',1)                   #missing comma
+        if mistake == 2:
+            return Mnemonics+' $q9, $s1, $s2'               #unknown register
+        if mistake == 3:
+            return 'j MISSING'+str(tag)                     #TAG not in the program
+        return Mnemonics                                    #missing values
+
+    with open(path,'w') as program:
+        chunk = []
+        for LineNumber in range(lines):
+            tag = LineNumber//TAGEVERY
+            choice = rnd.random()
+            if LineNumber % TAGEVERY == 0:
+                text = 'L'+str(tag)+': '+instruction(rnd.choice(mnemonics),tag)
+            elif choice < COMMENTRATIO:
+                text = rnd.choice(['','# synthetic comment','nop'])
+            elif choice < COMMENTRATIO+invalidRatio:
+                text = '       '+invalid(rnd.choice(mnemonics),tag)
+            else:
+                text = '       '+instruction(rnd.choice(mnemonics),tag)+('   # comment' if rnd.random() < 0.2 else '')
+            chunk.append(text)
+            if len(chunk) == 10000:
+                program.write('\n'.join(chunk)+'\n')
+                chunk = []
+        if chunk:
+            program.write('\n'.join(chunk)+'\n')
+
+
+
+#============================================================================================================#
+#   Times the phases of one translation: first pass, second pass and writing the output
+#============================================================================================================#
+def timePhases(assembler,path,outpath,format):
+    start = time.perf_counter()
+    with open(path,'r') as fp:
+        program = assembler.firstPass(fp)
+    pass1 = time.perf_counter()
+    assembler.secondPass(program)
+    pass2 = time.perf_counter()
+    assembler.writeOutput(outpath,format)
+    output = time.perf_counter()
+    return (len(program),pass1-start,pass2-pass1,output-pass2)
+
+def peakMemory(assembler,path,outpath,format):
+    tracemalloc.start()
+    try:
+        timePhases(assembler,path,outpath,format)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def runBenchmark(sizes,format = "listing",repeat = 3,memory = True,seed = 1):
+    assembler = Assembler(verbose = False)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for lines in sizes:
+            path = os.path.join(workdir,"program"+str(lines)+".s")
+            outpath = os.path.join(workdir,"program"+str(lines)+".out")
+            generateProgram(path,lines,seed,assembler = assembler)
+            best = None
+            for i in range(repeat):             #best of repeat runs
+                timing = timePhases(assembler,path,outpath,format)
+                if best is None or sum(timing[1:]) < sum(best[1:]):
+                    best = timing
+            (count,pass1,pass2,output) = best
+            total = pass1+pass2+output
+            result = {"lines":lines, "asm":count, "warnings":assembler.WarningCount, "tags":len(assembler.MemDictionary)-1,
+                      "pass1_s":pass1, "pass2_s":pass2, "output_s":output, "total_s":total,
+                      "lines_per_s":lines/total if total > 0 else 0.0}
+            if memory:
+                result["peak_bytes"] = peakMemory(assembler,path,outpath,format)
+            results.append(result)
+            os.remove(path)
+            os.remove(outpath)
+            printResult(result)
+    return results
+
+def printResult(result,previous = None):
+    text = (str(result["lines"]).rjust(9)+" lines  pass1 "+"%8.3f" % result["pass1_s"]+" s  pass2 "+"%8.3f" % result["pass2_s"]
+            +" s  output "+"%8.3f" % result["output_s"]+" s  "+"%10.0f" % result["lines_per_s"]+" lines/s")
+    if "peak_bytes" in result:
+        text += "  peak "+"%8.1f" % (result["peak_bytes"]/2**20)+" MiB"
+    if previous is not None and previous.get("lines_per_s"):
+        text += "  ("+"%+.1f" % (100*(result["lines_per_s"]/previous["lines_per_s"]-1))+"% lines/s)"
+    print(text)
+
+def gitRevision():
+    try:
+        return subprocess.run(["git","rev-parse","--short","HEAD"],cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True,text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+
+#============================================================================================================#
+#   Command line use:  python benchmark.py [--sizes N ...] [-o RESULTS] [--compare OLDRESULTS]
+#                      python benchmark.py --generate PATH --lines N
+#============================================================================================================#
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Benchmarks MIPSAssembler.py on synthetic programs")
+    parser.add_argument("--sizes",type=int,nargs="+",default=SIZES,help="program lengths in lines")
+    parser.add_argument("-f","--format",default="listing",choices=["listing"]+list(OUTPUTFORMATS),help="output format to time")
+    parser.add_argument("--repeat",type=int,default=3,help="runs per size, the best one is kept")
+    parser.add_argument("--no-memory",action="store_true",help="skip the tracemalloc run for peak memory")
+    parser.add_argument("--seed",type=int,default=1,help="seed of the program generator")
+    parser.add_argument("-o","--output",default="bench_results.json",help="JSON file for the results")
+    parser.add_argument("--compare",help="JSON results of an earlier run to compare with")
+    parser.add_argument("--generate",metavar="PATH",help="only write a synthetic program to PATH")
+    parser.add_argument("--lines",type=int,default=SIZES[0],help="length of the program written by --generate")
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        generateProgram(args.generate,args.lines,args.seed)
+        return 0
+
+    results = runBenchmark(args.sizes,args.format,args.repeat,not args.no_memory,args.seed)
+    report = {"revision":gitRevision(), "python":platform.python_version(), "machine":platform.machine(),
+              "format":args.format, "time":time.strftime("%Y-%m-%dT%H:%M:%S"), "results":results}
+    with open(args.output,'w') as resultfile:
+        json.dump(report,resultfile,indent=2)
+    print("Results saved in "+args.output)
+
+    if args.compare:
+        with open(args.compare,'r') as oldfile:
+            old = json.load(oldfile)
+        print("Compared with "+str(old.get("revision"))+":")
+        previous = dict([(result["lines"],result) for result in old["results"]])
+        for result in results:
+            printResult(result,previous.get(result["lines"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+#============================================================================================================#
+#   Incremental second pass: a program assembled again with the cache of the last run must give the same
+#   machine codes and warnings as a plain run. Run with  python -m unittest discover test
+#============================================================================================================#
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import MIPSAssembler
+
+
+def assemble(lines,cache = None):
+    assembler = MIPSAssembler.Assembler(MIPSAssembler.MNEMINOCSPATH,MIPSAssembler.REGNAMES,verbose = False)
+    assembler.Cache = cache
+    assembler.secondPass(assembler.firstPass(io.StringIO('\n'.join(lines))))
+    return assembler
+
+
+class IncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = MIPSAssembler.IncrementalCache(None,assemble([]))
+
+    def check(self,before,after):
+        assemble(before,self.cache)
+        incremental = assemble(after,self.cache)
+        plain = assemble(after)
+        self.assertEqual(incremental.words(),plain.words())
+        self.assertEqual(incremental.WarningCount,plain.WarningCount)
+        self.assertEqual(incremental.Diagnostics.messages(),plain.Diagnostics.messages())
+        return incremental
+
+    def test_memory_tag_moved(self):              #lw/sw offset to a TAG is relative to the asm
+        before = ["addi $t1, $zero, 1","lw $t0, DATA($zero)","sw $t1, DATA($zero)","nop","DATA: nop"]
+        after = before[:4]+["nop"]+before[4:]
+        words = self.check(before,after).words()
+        self.assertEqual(words[1],0x8c080003)
+        self.assertEqual(words[2] & 0xffff,2)
+
+    def test_memory_tag_defined(self):            #the "@DATA is not found" warning goes once DATA is there
+        before = ["addi $t1, $zero, 1","lw $t0, DATA($zero)","nop"]
+        after = before+["DATA: nop"]
+        incremental = self.check(before,after)
+        self.assertEqual(incremental.words()[1],0x8c080001)
+        self.assertEqual(incremental.WarningCount,0)
+
+    def test_branch_tag_moved(self):
+        before = ["L: addi $t1, $t1, 1","nop","bne $t1, $zero, L"]
+        self.check(before,before[:1]+["nop"]+before[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()